@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+"""This script benchmarks the download of the weather data against a local object store.
+
+The files are served by :class:`energy_forecast.testing.LocalObjectStore`,
+with realistic sizes and a configurable latency and failure rate,
+so the changes of the fetch path can be compared without network access.
+
+Three paths are measured:
+
+- :py:meth:`ArpegeSimpleAPI.fetch`, with and without the subset, for several numbers of workers,
+  then again to measure the cache hits;
+- :func:`download_observations_all_departments`;
+- :func:`download_historical_forecasts`, against the store used as an S3 endpoint.
+
+Usage
+-----
+with hatch:
+>>> hatch run benchmark_fetch --latency 0.05 --failure-rate 0.02 --workers 1 4 8
+
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from energy_forecast.meteo import (
+    ArpegeSimpleAPI,
+    download_historical_forecasts,
+    download_observations_all_departments,
+)
+from energy_forecast.testing import LocalObjectStore, synthetic_observations
+
+logger = logging.getLogger(__name__)
+
+
+def measure(store, function, *args, **kwargs):
+    """Call the function and return the statistics of the store during the call."""
+    store.reset_stats()
+    start = time.perf_counter()
+    error = None
+    try:
+        function(*args, **kwargs)
+    except Exception as e:
+        error = type(e).__name__
+    duration = time.perf_counter() - start
+    stats = dict(store.stats)
+    return {"duration_s": round(duration, 2),
+            "requests": stats["requests"],
+            "failures": stats["failures"],
+            "not_modified": stats["not_modified"],
+            "MB": round(stats["bytes"] / 1024**2, 1),
+            "MB/s": round(stats["bytes"] / 1024**2 / duration, 1),
+            "error": error,
+            }
+
+
+def benchmark_arpege(store, root, workers, horizons):
+    results = []
+    for subset in [False, True]:
+        for max_workers in workers:
+            prefix = root / f"arpege_{subset}_{max_workers}"
+            client = ArpegeSimpleAPI("2024-06-28", prefix=prefix, max_workers=max_workers,
+                                     subset=subset, forecast_horizons=horizons)
+            client.base_url = store.arpege_url
+            for attempt in ["cold", "cache hit"]:
+                result = measure(store, client.fetch, errors="ignore")
+                result.update(path="arpege", subset=subset, max_workers=max_workers, attempt=attempt,
+                              missing=len(client.missing_horizons))
+                results.append(result)
+    return results
+
+
+def benchmark_observations(store, root):
+    results = []
+    # the revalidation sends conditional requests, answered by 304 responses
+    for attempt, cache_duration in [("cold", "12h"), ("cache hit", "12h"), ("revalidate", "0h")]:
+        result = measure(store, download_observations_all_departments,
+                         cache_duration=cache_duration,
+                         file_type="latest-2023-2024_RR-T-Vent",
+                         url_template=store.observations_url,
+                         download_root=root / "observations")
+        result.update(path="observations", attempt=attempt)
+        results.append(result)
+    return results
+
+
+def benchmark_s3(store, root, workers):
+    for var in ["wind_speed_hourly", "sun_flux_downward_hourly", "temperature_hourly"]:
+        for forecast in ["d0", "d1", "d2", "d3"]:
+            # a NetCDF file of the history is a few tens of MB
+            store.add_file(f"/bucket/weather_forecasts/{var}_{forecast}.nc",
+                           synthetic_observations(1, n_stations=400, seed=int(forecast[1])))
+    results = []
+    for max_workers in workers:
+        prefix = root / f"silver_{max_workers}"
+        for attempt in ["cold", "cache hit"]:
+            result = measure(store, download_historical_forecasts,
+                             "key", "secret", store.url, "bucket", prefix=str(prefix), max_workers=max_workers)
+            result.update(path="s3", max_workers=max_workers, attempt=attempt)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the download of the weather data against a local object store.")
+    parser.add_argument("--latency", type=float, default=0.02, help="the latency of each request, in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0., help="the probability of a 503 error per request")
+    parser.add_argument("--truncate-rate", type=float, default=0., help="the probability of a truncated response")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="the numbers of workers to compare")
+    parser.add_argument("--horizons", nargs="+", default=["000H012H", "013H024H", "025H036H"],
+                        help="the forecast horizons of ARPEGE to download")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["arpege", "observations", "s3"],
+                        help="the paths not to benchmark")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as root, \
+            LocalObjectStore(latency=args.latency,
+                             failure_rate=args.failure_rate,
+                             truncate_rate=args.truncate_rate) as store:
+        root = Path(root)
+        if "arpege" not in args.skip:
+            logger.info("Generating the synthetic ARPEGE files")
+            for horizon in args.horizons:
+                store.get_content(store.arpege_url.format(date="2024-06-28", time="00:00:00", resolution="01",
+                                                          forecast=horizon).removeprefix(store.url))
+            results += benchmark_arpege(store, root, args.workers, args.horizons)
+        if "observations" not in args.skip:
+            results += benchmark_observations(store, root)
+        if "s3" not in args.skip:
+            results += benchmark_s3(store, root, args.workers)
+
+    columns = ["path", "subset", "max_workers", "attempt", "duration_s", "requests", "failures",
+               "not_modified", "MB", "MB/s", "missing", "error"]
+    df_results = pd.DataFrame(results).reindex(columns=columns)
+    print(df_results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -18,12 +18,14 @@ import pandas as pd
 from energy_forecast import ROOT_DIR
 from energy_forecast.consumption_forecast import PredictionForecastAPI
 from energy_forecast.eco2mix import get_data as get_eco2mix_data
+from energy_forecast.geography import DEPARTEMENT_WEIGHTS_FILENAME, load_departement_weights
 from energy_forecast.enr_production_model import ENRProductionModel
 from energy_forecast.meteo import (
     ArpegeSimpleAPI,
     aggregates_observations,
     download_observations_all_departments,
 )
+from energy_forecast.observations import ObservationStore
 from energy_forecast.performances import expires_after, memory
 from energy_forecast.tempo_rte import TempoPredictor, TempoSignalAPI
 
@@ -70,13 +72,13 @@ def fetch_ret_consumption_forecast():
 
 
 def fetch_mf_sun_forecast():
-    client = ArpegeSimpleAPI(date=TODAY)
+    client = ArpegeSimpleAPI.latest_run()
     mf_sun_deps = client.departement_sun()
     return mf_sun_deps
 
 
 def fetch_mf_wind_forecast():
-    client = ArpegeSimpleAPI(date=TODAY)
+    client = ArpegeSimpleAPI.latest_run()
     mf_wind_deps = client.departement_wind()
     return mf_wind_deps
 
@@ -110,8 +112,11 @@ def fetch_temperature():
     """
     files = download_observations_all_departments()
     cut_before = TODAY - pd.DateOffset(years=1) - pd.DateOffset(month=9, day=1)
-    cut_before = TODAY - pd.DateOffset(years=1) - pd.DateOffset(month=9, day=1)
-    daily_temperature = aggregates_observations(files, cut_before=cut_before).tz_localize("Europe/Paris")
+    # the consumption follows the temperature where people live
+    weights = load_departement_weights() if DEPARTEMENT_WEIGHTS_FILENAME.exists() else None
+    daily_temperature = aggregates_observations(files, cut_before=cut_before,
+                                                store=ObservationStore(),
+                                                weights=weights).tz_localize("Europe/Paris")
     return daily_temperature
 
 
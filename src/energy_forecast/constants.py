@@ -54,7 +54,7 @@ departement_names = ["Aisne",
                 "Pyrénées-Atlantiques",
                 "Rhône",
                 "Saône-et-Loire",
-                # "Paris",
+                "Paris",
                 "Yvelines",
                 "Tarn",
                 "Tarn-et-Garonne",
@@ -113,8 +113,109 @@ departement_names = ["Aisne",
                 "Mayenne",
                 "Meurthe-et-Moselle",
                 "Deux-Sèvres",
+                "Territoire de Belfort",
                 ]
 
+#: Region of each department of France.
+departement_regions = {
+    "Aisne": "Hauts-de-France",
+    "Aube": "Grand Est",
+    "Calvados": "Normandie",
+    "Cantal": "Auvergne-Rhône-Alpes",
+    "Eure-et-Loir": "Centre-Val de Loire",
+    "Ille-et-Vilaine": "Bretagne",
+    "Jura": "Bourgogne-Franche-Comté",
+    "Landes": "Nouvelle-Aquitaine",
+    "Loire": "Auvergne-Rhône-Alpes",
+    "Loiret": "Centre-Val de Loire",
+    "Lot-et-Garonne": "Nouvelle-Aquitaine",
+    "Meuse": "Grand Est",
+    "Orne": "Normandie",
+    "Pas-de-Calais": "Hauts-de-France",
+    "Puy-de-Dôme": "Auvergne-Rhône-Alpes",
+    "Bas-Rhin": "Grand Est",
+    "Haut-Rhin": "Grand Est",
+    "Seine-Maritime": "Normandie",
+    "Yonne": "Bourgogne-Franche-Comté",
+    "Seine-Saint-Denis": "Île-de-France",
+    "Alpes-de-Haute-Provence": "Provence-Alpes-Côte d'Azur",
+    "Hautes-Alpes": "Provence-Alpes-Côte d'Azur",
+    "Ardèche": "Auvergne-Rhône-Alpes",
+    "Ardennes": "Grand Est",
+    "Ariège": "Occitanie",
+    "Charente-Maritime": "Nouvelle-Aquitaine",
+    "Corrèze": "Nouvelle-Aquitaine",
+    "Dordogne": "Nouvelle-Aquitaine",
+    "Eure": "Normandie",
+    "Indre-et-Loire": "Centre-Val de Loire",
+    "Lozère": "Occitanie",
+    "Nièvre": "Bourgogne-Franche-Comté",
+    "Oise": "Hauts-de-France",
+    "Pyrénées-Atlantiques": "Nouvelle-Aquitaine",
+    "Rhône": "Auvergne-Rhône-Alpes",
+    "Saône-et-Loire": "Bourgogne-Franche-Comté",
+    "Yvelines": "Île-de-France",
+    "Tarn": "Occitanie",
+    "Tarn-et-Garonne": "Occitanie",
+    "Var": "Provence-Alpes-Côte d'Azur",
+    "Vendée": "Pays de la Loire",
+    "Haute-Vienne": "Nouvelle-Aquitaine",
+    "Vosges": "Grand Est",
+    "Hauts-de-Seine": "Île-de-France",
+    "Allier": "Auvergne-Rhône-Alpes",
+    "Alpes-Maritimes": "Provence-Alpes-Côte d'Azur",
+    "Aude": "Occitanie",
+    "Corse-du-Sud": "Corse",
+    "Côtes-d'Armor": "Bretagne",
+    "Creuse": "Nouvelle-Aquitaine",
+    "Doubs": "Bourgogne-Franche-Comté",
+    "Finistère": "Bretagne",
+    "Gard": "Occitanie",
+    "Gironde": "Nouvelle-Aquitaine",
+    "Indre": "Centre-Val de Loire",
+    "Isère": "Auvergne-Rhône-Alpes",
+    "Marne": "Grand Est",
+    "Haute-Marne": "Grand Est",
+    "Moselle": "Grand Est",
+    "Hautes-Pyrénées": "Occitanie",
+    "Pyrénées-Orientales": "Occitanie",
+    "Savoie": "Auvergne-Rhône-Alpes",
+    "Haute-Savoie": "Auvergne-Rhône-Alpes",
+    "Seine-et-Marne": "Île-de-France",
+    "Vaucluse": "Provence-Alpes-Côte d'Azur",
+    "Vienne": "Nouvelle-Aquitaine",
+    "Val-de-Marne": "Île-de-France",
+    "Ain": "Auvergne-Rhône-Alpes",
+    "Aveyron": "Occitanie",
+    "Bouches-du-Rhône": "Provence-Alpes-Côte d'Azur",
+    "Charente": "Nouvelle-Aquitaine",
+    "Cher": "Centre-Val de Loire",
+    "Haute-Corse": "Corse",
+    "Côte-d'Or": "Bourgogne-Franche-Comté",
+    "Drôme": "Auvergne-Rhône-Alpes",
+    "Haute-Garonne": "Occitanie",
+    "Gers": "Occitanie",
+    "Hérault": "Occitanie",
+    "Haute-Loire": "Auvergne-Rhône-Alpes",
+    "Loire-Atlantique": "Pays de la Loire",
+    "Lot": "Occitanie",
+    "Maine-et-Loire": "Pays de la Loire",
+    "Manche": "Normandie",
+    "Morbihan": "Bretagne",
+    "Nord": "Hauts-de-France",
+    "Haute-Saône": "Bourgogne-Franche-Comté",
+    "Sarthe": "Pays de la Loire",
+    "Somme": "Hauts-de-France",
+    "Essonne": "Île-de-France",
+    "Val-d'Oise": "Île-de-France",
+    "Loir-et-Cher": "Centre-Val de Loire",
+    "Mayenne": "Pays de la Loire",
+    "Meurthe-et-Moselle": "Grand Est",
+    "Deux-Sèvres": "Nouvelle-Aquitaine",
+    "Paris": "Île-de-France",
+    "Territoire de Belfort": "Bourgogne-Franche-Comté",
+}
+
 france_bounds = {
 "min_lon": -4.79542,
 "max_lon": 9.55996,
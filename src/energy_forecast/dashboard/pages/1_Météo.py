@@ -1,5 +1,6 @@
 """This Page is used to display the weather forecast data."""
 from matplotlib import pyplot as plt
+from energy_forecast.dashboard.runs import get_latest_run
 from energy_forecast.meteo import get_region_sun, get_region_wind, memory, ArpegeSimpleAPI
 from energy_forecast.constants import france_bounds
 import pandas as pd
@@ -14,7 +15,7 @@ alt.renderers.set_embed_options(time_format_locale="fr-FR.UTF-8", format_locale=
 
 
 @memory.cache
-def compute_data_sun(date: str)->pd.DataFrame:
+def compute_data_sun(date: str, time: str = "00:00:00")->pd.DataFrame:
     """Retrun the mean sun flux for each hour of the day.
 
     Solar radiation is in W/m^2.
@@ -29,6 +30,9 @@ def compute_data_sun(date: str)->pd.DataFrame:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`energy_forecast.meteo.ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -49,14 +53,14 @@ def compute_data_sun(date: str)->pd.DataFrame:
     .. seealso::
         :func:`compute_data_wind`
     """
-    sun_data = get_region_sun(date)
+    sun_data = get_region_sun(date, time)
     data = sun_data.mean(axis=1).to_frame()
     data.reset_index(inplace=True)
     data.columns = ["time", "sun_flux"]
     return data
 
 @memory.cache
-def compute_data_wind(date: str)->pd.DataFrame:
+def compute_data_wind(date: str, time: str = "00:00:00")->pd.DataFrame:
     """Retrun the mean wind speed for each hour of the day.
 
     Wind speed is in m/s.
@@ -71,6 +75,9 @@ def compute_data_wind(date: str)->pd.DataFrame:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`energy_forecast.meteo.ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -92,14 +99,14 @@ def compute_data_wind(date: str)->pd.DataFrame:
         :func:`compute_data_sun`
 
     """
-    wind_data = get_region_wind(date)
+    wind_data = get_region_wind(date, time)
     data = wind_data.mean(axis=1).to_frame()
     data.reset_index(inplace=True)
     data.columns = ["time", "wind_speed"]
     return data
 
 @memory.cache
-def get_noon_wind_map(date: str, step="12h")->xr.DataArray:
+def get_noon_wind_map(date: str, time: str = "00:00:00", step="12h")->xr.DataArray:
     """Return the mean wind speed at noon for a given date.
 
     Parameters
@@ -108,6 +115,9 @@ def get_noon_wind_map(date: str, step="12h")->xr.DataArray:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`energy_forecast.meteo.ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -120,12 +130,12 @@ def get_noon_wind_map(date: str, step="12h")->xr.DataArray:
     2.0
 
     """
-    client = ArpegeSimpleAPI(date=date)
+    client = ArpegeSimpleAPI(date=date, time=time)
     wind = client.read_wind()
     
     return wind.sel(step=pd.Timedelta(step)).si10
 
-def get_sun_map(date: str, step="12h")->xr.DataArray:
+def get_sun_map(date: str, time: str = "00:00:00", step="12h")->xr.DataArray:
     """Return the mean sun flux at noon for a given date.
 
     Parameters
@@ -134,6 +144,9 @@ def get_sun_map(date: str, step="12h")->xr.DataArray:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`energy_forecast.meteo.ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -146,19 +159,21 @@ def get_sun_map(date: str, step="12h")->xr.DataArray:
     1000.0
 
     """
-    client = ArpegeSimpleAPI(date=date)
+    client = ArpegeSimpleAPI(date=date, time=time)
     sun = client.read_sspd().ssrd.diff("step")
     #set long_name for the variable
     sun["long_name"] = "Flux solaire"
     
     return sun.sel(step=pd.Timedelta(step))
+
+
 if __name__ == "__main__":
 
     st.title("Prévision meteo")
     st.markdown("Cette page affiche les prévisions météorologiques pour les prochains jours."
                 " Les données sont obtenues à partir de [Météo France](https://www.meteofrance.com/).")
-    date = pd.Timestamp.now().strftime("%Y-%m-%d")
-    wind_data = compute_data_wind(date)
+    run_date, run_time = get_latest_run()
+    wind_data = compute_data_wind(run_date, run_time)
 
 
     wind_barplot = alt.Chart(wind_data).mark_bar().encode(
@@ -169,7 +184,7 @@ if __name__ == "__main__":
                     use_container_width=True
                 )
 
-    sun_data = compute_data_sun(date)
+    sun_data = compute_data_sun(run_date, run_time)
     sun_data["sun_flux"] = sun_data["sun_flux"] / 1000
     sun_barplot = alt.Chart(sun_data).mark_bar().encode(
         y=alt.Y("sun_flux:Q").title("Flux solaire (kW/m²)"),
@@ -188,7 +203,7 @@ if __name__ == "__main__":
         
         min_lon, max_lon = france_bounds["min_lon"], france_bounds["max_lon"]
         min_lat, max_lat = france_bounds["min_lat"], france_bounds["max_lat"]
-        noon_wind = get_noon_wind_map(date, step=f"{step}h").sel(
+        noon_wind = get_noon_wind_map(run_date, run_time, step=f"{step}h").sel(
             longitude=slice(min_lon, max_lon), latitude=slice(max_lat, min_lat)
             )
         
@@ -205,7 +220,7 @@ if __name__ == "__main__":
 
         st.pyplot(fig)
 
-        sun_noon = get_sun_map(date, step=f"{step}h").sel(
+        sun_noon = get_sun_map(run_date, run_time, step=f"{step}h").sel(
             longitude=slice(min_lon, max_lon), latitude=slice(max_lat, min_lat)
             )
         fig, ax = plt.subplots(subplot_kw={"projection": ccrs.PlateCarree()})
@@ -5,6 +5,7 @@
 """
 from energy_forecast.energy import ECO2MixDownloader
 from energy_forecast import ROOT_DIR
+from energy_forecast.dashboard.runs import get_latest_run
 from energy_forecast.meteo import ArpegeSimpleAPI, memory
 from energy_forecast.enr_production_model import ENRProductionModel
 import pandas as pd
@@ -13,7 +14,7 @@ import altair as alt
 alt.renderers.set_embed_options(time_format_locale="fr-FR", format_locale="fr-FR")
 
 @memory.cache
-def compute_my_prodiction(date)->pd.DataFrame:
+def compute_my_prodiction(date, time="00:00:00")->pd.DataFrame:
     """Estimate the power generated by eolien.
 
     Use the data from :func:`get_region_swind` and a linear model to estimate the power generated by wind turbines.
@@ -22,6 +23,9 @@ def compute_my_prodiction(date)->pd.DataFrame:
     ----------
     date : str
         The date at which the power is estimated.
+    time : str, optional
+        The time of the weather forecast run, see :class:`energy_forecast.meteo.ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -29,15 +33,16 @@ def compute_my_prodiction(date)->pd.DataFrame:
         The power generated by solar panels for each hour of the day.
         The columns are ["time", "eolien_power"]
     """
-    wind_data = ArpegeSimpleAPI(date).departement_wind()
-    sun_data = ArpegeSimpleAPI(date).departement_sun()
+    client = ArpegeSimpleAPI(date, time)
+    wind_data = client.departement_wind()
+    sun_data = client.departement_sun()
     my_model = ENRProductionModel.load(filename="model_departements.pkl")
     
     predictions = my_model.predict(sun_data, wind_data)
     return predictions
 
 @memory.cache
-def compute_energy(date:str):
+def compute_energy(date:str, time:str="00:00:00"):
     """Concatenate the energy production data with the predictions.
 
     Energy production data is downloaded from RTE and the predictions are computed using the models from :func:`compute_data_pv_power` and :func:`compute_data_eolien`.
@@ -50,6 +55,9 @@ def compute_energy(date:str):
     ----------
     date : str
         The date at which the energy production is estimated.
+    time : str, optional
+        The time of the weather forecast run.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -63,7 +71,7 @@ def compute_energy(date:str):
         - ``"Eolien Prediction"``: the wind power production prediction (from linear model using weather date)
 
     """
-    predictions = compute_my_prodiction(date)
+    predictions = compute_my_prodiction(date, time)
     
     current_year = pd.Timestamp(date).year
     r = ECO2MixDownloader(year=current_year)
@@ -88,8 +96,11 @@ if __name__ == "__main__":
 
     date_input = st.sidebar.date_input("Date", pd.Timestamp.now())
 
-    # date = pd.Timestamp.now().strftime("%Y-%m-%d")
-    energy = compute_energy(date_input)
+    run_date, run_time = get_latest_run()
+    if run_date == date_input.strftime("%Y-%m-%d"):
+        energy = compute_energy(run_date, run_time)
+    else:
+        energy = compute_energy(date_input)
     # keep only full hours, needed to plot the data without empty spaces
     print(energy)
     energy = energy[energy["time"].dt.minute == 0]
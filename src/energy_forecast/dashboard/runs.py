@@ -0,0 +1,25 @@
+"""Select the run of ARPEGE displayed by the dashboard."""
+import pandas as pd
+import requests
+import streamlit as st
+
+from energy_forecast.meteo import ArpegeSimpleAPI
+
+
+@st.cache_data(ttl="1h")
+def get_latest_run() -> tuple[str, str]:
+    """Return the date and the time of the latest run of ARPEGE, see :py:meth:`ArpegeSimpleAPI.latest_run`.
+
+    The result is cached for an hour, so the pages do not send ``HEAD`` requests at each refresh.
+    If no run can be found, the 00Z run of today is used.
+
+    Returns
+    -------
+    tuple[str, str]
+        the date and the time of the run.
+    """
+    try:
+        client = ArpegeSimpleAPI.latest_run()
+    except (ValueError, requests.exceptions.ConnectionError):
+        return pd.Timestamp("today").strftime("%Y-%m-%d"), "00:00:00"
+    return client.date, client.time
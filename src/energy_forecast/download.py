@@ -0,0 +1,336 @@
+"""Implements helpers to download files over HTTP.
+
+The files are streamed to the disk by chunks, so the memory used does not depend on the size of the file.
+They are first written to a temporary ``.part`` file which is renamed once the download is complete and validated,
+hence a file present at its final location is always complete.
+"""
+import json
+import logging
+import os
+from email.utils import formatdate
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+#: Size of the chunks written to the disk, in bytes.
+CHUNK_SIZE = 1024 * 1024
+
+
+class IncompleteDownloadError(requests.exceptions.RequestException):
+    """Raised when the size of a downloaded file does not match the size announced by the server."""
+
+
+class RangeNotSupportedError(requests.exceptions.RequestException):
+    """Raised when the server ignores the ``Range`` header of a request."""
+
+
+def partial_filename(filename: str | Path) -> Path:
+    """Return the name of the temporary file used while downloading ``filename``."""
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".part")
+
+
+def validators_filename(filename: str | Path) -> Path:
+    """Return the file of the validators (``ETag``, ``Last-Modified``) of the partial download of ``filename``."""
+    filename = Path(filename)
+    return filename.with_name(filename.name + ".part.json")
+
+
+def _if_range(validators: dict) -> str | None:
+    """Return the ``If-Range`` header of the validators, a strong ``ETag`` or else the ``Last-Modified`` date."""
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def stream_to_file(url: str,
+                   filename: str | Path,
+                   session: requests.Session | None = None,
+                   chunk_size: int = CHUNK_SIZE,
+                   ) -> Path:
+    """Download the url to the filename, by chunks, atomically.
+
+    The content is written to a ``.part`` file next to ``filename``.
+    If such a file already exists (from a previous failed download),
+    the download is resumed using an HTTP ``Range`` request.
+    The ``ETag`` and ``Last-Modified`` headers of the response are saved next to the ``.part`` file
+    (see :func:`validators_filename`) and sent back in the ``If-Range`` header,
+    so the server sends the full file if it has been modified since the partial download.
+    A partial file without validators is downloaded again from the start.
+
+    Once the download is finished, the size of the file is checked against the size announced by the server,
+    and the ``.part`` file is renamed to ``filename``.
+
+    Parameters
+    ----------
+    url : str
+        the url to download.
+    filename : str | Path
+        the filename to save the data.
+    session : requests.Session, optional
+        the session used to download the file.
+        Default is None, which uses :func:`requests.get`.
+    chunk_size : int, optional
+        the size of the chunks written to the disk, in bytes.
+        Default is :py:data:`CHUNK_SIZE`.
+
+    Returns
+    -------
+    Path
+        the filename of the downloaded file.
+
+    Raises
+    ------
+    requests.exceptions.HTTPError
+        if the server returns an error.
+    IncompleteDownloadError
+        if the downloaded file is smaller or larger than announced.
+        The ``.part`` file is kept so the next call resumes the download.
+    """
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    partial = partial_filename(filename)
+    validators_file = validators_filename(filename)
+    client = session or requests
+    offset = partial.stat().st_size if partial.exists() else 0
+    if_range = None
+    if offset and validators_file.exists():
+        try:
+            if_range = _if_range(json.loads(validators_file.read_text()))
+        except json.JSONDecodeError:
+            pass
+    headers = {}
+    if if_range:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = if_range
+    with client.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # the partial file is not consistent with the remote file
+            logger.warning(f"Cannot resume {partial}, downloading it again")
+            partial.unlink()
+            validators_file.unlink(missing_ok=True)
+            return stream_to_file(url, filename, session=session, chunk_size=chunk_size)
+        response.raise_for_status()
+        if response.status_code == 206:
+            start, expected_size = _parse_content_range(response.headers.get("Content-Range", ""))
+            if start != offset:
+                partial.unlink()
+                validators_file.unlink(missing_ok=True)
+                raise IncompleteDownloadError(f"{url} : the server resumed at byte {start} instead of {offset}")
+            logger.info(f"Resuming the download of {url} at byte {offset}")
+            mode = "ab"
+        else:
+            mode = "wb"
+            expected_size = _content_length(response.headers)
+            validators_file.write_text(json.dumps({"etag": response.headers.get("ETag"),
+                                                   "last_modified": response.headers.get("Last-Modified")}))
+        with open(partial, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+    size = partial.stat().st_size
+    if expected_size is not None and size != expected_size:
+        if size > expected_size:
+            # cannot be resumed
+            partial.unlink()
+            validators_file.unlink(missing_ok=True)
+        raise IncompleteDownloadError(f"{url} : downloaded {size} bytes, expected {expected_size}")
+    os.replace(partial, filename)
+    validators_file.unlink(missing_ok=True)
+    return filename
+
+
+def conditional_download(url: str,
+                         filename: str | Path,
+                         etag: str | None = None,
+                         last_modified: str | None = None,
+                         session: requests.Session | None = None,
+                         chunk_size: int = CHUNK_SIZE,
+                         ) -> dict:
+    """Download the url to the filename, only if the remote file changed since the previous download.
+
+    If the file exists, the request carries the ``If-None-Match`` and ``If-Modified-Since`` headers
+    with the validators of the previous download, and the server answers ``304 Not Modified``
+    without a body if the file did not change. Without validators, the modification time of the file is used.
+    As for :func:`stream_to_file`, a new content is written to a ``.part`` file renamed once complete.
+
+    Parameters
+    ----------
+    url : str
+        the url to download.
+    filename : str | Path
+        the filename to save the data.
+    etag : str, optional
+        the ``ETag`` header of the previous download.
+    last_modified : str, optional
+        the ``Last-Modified`` header of the previous download.
+    session : requests.Session, optional
+        the session used to download the file.
+        Default is None, which uses :func:`requests.get`.
+    chunk_size : int, optional
+        the size of the chunks written to the disk, in bytes.
+        Default is :py:data:`CHUNK_SIZE`.
+
+    Returns
+    -------
+    dict
+        the ``"status"``, either ``"not_modified"`` or ``"downloaded"``,
+        and the validators ``"etag"`` and ``"last_modified"`` of the file.
+
+    Raises
+    ------
+    requests.exceptions.HTTPError
+        if the server returns an error.
+    IncompleteDownloadError
+        if the downloaded file is smaller or larger than announced.
+    """
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    client = session or requests
+    headers = {}
+    if filename.exists():
+        if etag:
+            headers["If-None-Match"] = etag
+        headers["If-Modified-Since"] = last_modified or formatdate(filename.stat().st_mtime, usegmt=True)
+    with client.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return {"status": "not_modified",
+                    "etag": response.headers.get("ETag", etag),
+                    "last_modified": response.headers.get("Last-Modified", last_modified)}
+        response.raise_for_status()
+        partial = partial_filename(filename)
+        with open(partial, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+    expected_size = _content_length(response.headers)
+    size = partial.stat().st_size
+    if expected_size is not None and size != expected_size:
+        partial.unlink()
+        raise IncompleteDownloadError(f"{url} : downloaded {size} bytes, expected {expected_size}")
+    os.replace(partial, filename)
+    return {"status": "downloaded",
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")}
+
+
+def read_range(url: str,
+               offset: int,
+               length: int,
+               session: requests.Session | None = None,
+               ) -> bytes:
+    """Return ``length`` bytes of the remote file, starting at ``offset``.
+
+    Parameters
+    ----------
+    url : str
+        the url of the file.
+    offset : int
+        the first byte to read.
+    length : int
+        the number of bytes to read.
+    session : requests.Session, optional
+        the session used for the request.
+        Default is None, which uses :func:`requests.get`.
+
+    Returns
+    -------
+    bytes
+        the bytes read. Fewer than ``length`` bytes are returned at the end of the file,
+        and none if ``offset`` is beyond the end of the file.
+
+    Raises
+    ------
+    RangeNotSupportedError
+        if the server does not support ``Range`` requests.
+    """
+    client = session or requests
+    response = client.get(url, headers={"Range": f"bytes={offset}-{offset + length - 1}"})
+    if response.status_code == 416:
+        return b""
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise RangeNotSupportedError(f"{url} : the server does not support Range requests")
+    return response.content
+
+
+def download_ranges(url: str,
+                    ranges: list[tuple[int, int]],
+                    filename: str | Path,
+                    session: requests.Session | None = None,
+                    chunk_size: int = CHUNK_SIZE,
+                    ) -> Path:
+    """Download some byte ranges of the url and concatenate them in the filename, atomically.
+
+    As for :func:`stream_to_file`, the content is written to a ``.part`` file,
+    which is renamed once all the ranges are downloaded with the expected size.
+    The ``.part`` file is deleted if a range fails, since it cannot be resumed.
+
+    Parameters
+    ----------
+    url : str
+        the url to download.
+    ranges : list[tuple[int, int]]
+        the ``(start, end)`` byte ranges to download, ``end`` being excluded.
+    filename : str | Path
+        the filename to save the data.
+    session : requests.Session, optional
+        the session used to download the file.
+        Default is None, which uses :func:`requests.get`.
+    chunk_size : int, optional
+        the size of the chunks written to the disk, in bytes.
+        Default is :py:data:`CHUNK_SIZE`.
+
+    Returns
+    -------
+    Path
+        the filename of the downloaded file.
+
+    Raises
+    ------
+    RangeNotSupportedError
+        if the server does not support ``Range`` requests.
+    IncompleteDownloadError
+        if a range is not downloaded entirely.
+    """
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    partial = partial_filename(filename)
+    client = session or requests
+    try:
+        with open(partial, "wb") as f:
+            for start, end in ranges:
+                with client.get(url, headers={"Range": f"bytes={start}-{end - 1}"}, stream=True) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise RangeNotSupportedError(f"{url} : the server does not support Range requests")
+                    written = 0
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        written += f.write(chunk)
+                if written != end - start:
+                    raise IncompleteDownloadError(f"{url} : downloaded {written} bytes of the range {start}-{end}")
+    except BaseException:
+        # the concatenated ranges cannot be resumed, unlike the partial file of stream_to_file
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, filename)
+    return filename
+
+
+def _content_length(headers) -> int | None:
+    """Return the size of the body announced by the headers, if it can be trusted."""
+    if "Content-Length" not in headers or headers.get("Content-Encoding", "identity") != "identity":
+        # the body is decoded on the fly, its size on the disk differs from the Content-Length
+        return None
+    return int(headers["Content-Length"])
+
+
+def _parse_content_range(content_range: str) -> tuple[int | None, int | None]:
+    """Return the first byte and the total size from a ``Content-Range: bytes start-end/total`` header."""
+    try:
+        byte_range, total = content_range.removeprefix("bytes ").split("/")
+        start = int(byte_range.split("-")[0])
+    except ValueError:
+        return None, None
+    return start, None if total == "*" else int(total)
@@ -1,9 +1,13 @@
+import logging
 from pathlib import Path
 import pandas as pd
 from sklearn import pipeline, linear_model
 from energy_forecast import ROOT_DIR
 from joblib import dump, load
 
+logger = logging.getLogger(__name__)
+
+
 class ENRProductionModel:
     """Model to predict the production of renewable energy sources.
     
@@ -54,10 +58,34 @@ class ENRProductionModel:
         sun_flux_preprocessed = self.pre_process_sun_flux(sun_flux)
         self.model_sun.fit(sun_flux_preprocessed, productions["sun"])
     
+    @staticmethod
+    def select_features(model, X:pd.DataFrame) -> pd.DataFrame:
+        """Keep the columns the model was fitted on, e.g. when new zones were added since.
+
+        Raises
+        ------
+        ValueError
+            if columns the model was fitted on are missing,
+            or if the model has no feature names and the number of columns differs.
+        """
+        features = getattr(model, "feature_names_in_", None)
+        if features is None:
+            n_features = getattr(model, "n_features_in_", X.shape[1])
+            if X.shape[1] != n_features:
+                raise ValueError(f"The model was fitted on {n_features} unnamed features, got {X.shape[1]} columns")
+            return X
+        missing = [feature for feature in features if feature not in X.columns]
+        if missing:
+            raise ValueError(f"The columns {missing} the model was fitted on are missing")
+        ignored = [column for column in X.columns if column not in set(features)]
+        if ignored:
+            logger.warning(f"The columns {ignored} are ignored, the model was not fitted on them")
+        return X[features]
+
     def predict(self, sun_flux:pd.DataFrame, wind_speed:pd.DataFrame) -> pd.DataFrame:
-        wind_speed_preprocessed = self.pre_process_wind_speed(wind_speed)
+        wind_speed_preprocessed = self.select_features(self.model_wind, self.pre_process_wind_speed(wind_speed))
         wind_predictions = self.model_wind.predict(wind_speed_preprocessed)
-        sun_flux_preprocessed = self.pre_process_sun_flux(sun_flux)
+        sun_flux_preprocessed = self.select_features(self.model_sun, self.pre_process_sun_flux(sun_flux))
         sun_predictions = self.model_sun.predict(sun_flux_preprocessed)
         self.predictions = pd.concat([pd.Series(wind_predictions, name="wind",
                                                 index=wind_speed.index),
@@ -1,23 +1,62 @@
-"""Implements functions to handle geographical data."""
+"""Implements functions to handle geographical data.
+
+Usage
+-----
+The binary files of the geometries are built automatically when needed.
+They can also be built in advance, optionally simplified::
+
+    python -m energy_forecast.geography --tolerance 0.001
+
+"""
+import argparse
+import hashlib
+import os
 import shapely
 from energy_forecast import ROOT_DIR
-from energy_forecast.constants import departement_names, region_names
+from energy_forecast.constants import departement_names, departement_regions, region_names
+from energy_forecast.grib_index import content_hash
 import geojson
 from pathlib import Path
 from tqdm.auto import tqdm
 from shapely.geometry import Polygon, MultiPolygon, Point
 import shapely.plotting
 import numpy as np
+import pandas as pd
 import xarray as xr
 import logging
+from scipy import sparse
+
+from energy_forecast.zonal import ZonalAggregator
 
 logger = logging.getLogger(__name__)
 
 #: Path to the file containing the coordinates of France.
 LONLAT_FRANCE_FILENAME = ROOT_DIR / "data" / "geo" / "lonlat_france.npz"
+#: Directory of the masks, one file per type and grid signature.
+MASK_CACHE_DIR = ROOT_DIR / "data" / "geo" / "masks"
+
+#: Version of the generation of the masks, part of the grid signature.
+MASK_VERSION = 3
+
+#: Directory of the binary files of the geometries, see :func:`build_geometry_store`.
+GEOMETRY_STORE_DIR = ROOT_DIR / "data" / "geo" / "geometries"
+
+#: Directory of the files of the installed capacities, see :func:`load_capacity`.
+CAPACITY_DIR = ROOT_DIR / "data" / "geo"
 
-def extract_list_poly(geojson_filename:str|Path, list_features_to_keep:list, verbose:bool=False):
+#: File of the weights of the departements in the national means, e.g. their population,
+#: see :func:`load_departement_weights`.
+DEPARTEMENT_WEIGHTS_FILENAME = ROOT_DIR / "data" / "geo" / "population_departements.csv"
+
+_masks: dict[tuple[str, str], xr.DataArray] = {}
+_geometries: dict[tuple, dict] = {}
+_coverages: dict[tuple[str, str], sparse.csr_array] = {}
+_capacity_coverages: dict[tuple[str, str, str], sparse.csr_array] = {}
+
+def extract_list_poly(geojson_filename:str|Path, list_features_to_keep:list, verbose:bool=False, largest:bool=False):
     """Return a dictionary of polygons extracted from a geojson file.
+
+    Parsing the geojson files is slow, :func:`get_geometries` reads the same geometries from a binary file.
     
     The dictionary keys are the index of the feature in the list of features to keep.
 
@@ -29,10 +68,14 @@ def extract_list_poly(geojson_filename:str|Path, list_features_to_keep:list, ver
         The list of features to keep.
     verbose : bool, optional
         if True, more information is displaid, by default False
+    largest : bool, optional
+        if True, only the outline of the largest polygon of each feature is kept, without its holes,
+        as in the masks the production models were trained with (see :func:`generate_mask`).
+        By default False, to keep all the polygons (islands, enclaves) and their holes.
 
     Returns
     -------
-    dict[int, Polygon]
+    dict[int, Polygon | MultiPolygon]
         The dictionary of polygons.
     """
     polys = geojson.load(open(geojson_filename))
@@ -48,13 +91,14 @@ def extract_list_poly(geojson_filename:str|Path, list_features_to_keep:list, ver
         if name not in list_features_to_keep:
             continue
         index = list_features_to_keep.index(name)
-        if feature["geometry"]["type"] == "Polygon":
+        if not largest:
+            polys_kept[index] = shapely.geometry.shape(feature["geometry"])
+        elif feature["geometry"]["type"] == "Polygon":
             polys_kept[index] = Polygon(feature["geometry"]["coordinates"][0])
         elif feature["geometry"]["type"] == "MultiPolygon":
             # keeping the largest polygon
             tmp_list = [Polygon(geo[0]) for geo in feature["geometry"]["coordinates"]]
-            largest = max(tmp_list, key=lambda x: x.area)
-            polys_kept[index] = Polygon(largest)
+            polys_kept[index] = max(tmp_list, key=lambda x: x.area)
     
     if verbose:
         all_polys = [poly for poly in polys_kept.values()]
@@ -64,13 +108,188 @@ def extract_list_poly(geojson_filename:str|Path, list_features_to_keep:list, ver
     return polys_kept
 
 
-def generate_mask(type):
+def _geojson_filename(type):
+    if type == "regions":
+        return ROOT_DIR / "data" / "geo" / "regions.geojson", region_names
+    elif type == "departements":
+        return ROOT_DIR / "data" / "geo" / "departements.geojson", departement_names
+    raise ValueError("type should be either 'regions' or 'departements'")
+
+
+def build_geometry_store(type, tolerance=None, filename=None, largest=False):
+    """Convert the geojson file of the regions or the departements to a compact binary file.
+
+    The geometries are saved as WKB in a ``.npz`` file, in the order of the names of
+    :py:data:`energy_forecast.constants.region_names` or :py:data:`energy_forecast.constants.departement_names`,
+    with the hash of the geojson file to detect when it changes.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    tolerance : float, optional
+        the tolerance of the simplification of the geometries, in degrees.
+        Default is None, to keep the full geometries.
+    filename : str | Path, optional
+        the file to write.
+        Default is the file of :py:data:`GEOMETRY_STORE_DIR` used by :func:`get_geometries`.
+    largest : bool, optional
+        if True, only the largest polygon of each zone is kept, see :func:`extract_list_poly`.
+        Default is False.
+
+    Returns
+    -------
+    Path
+        the file written.
+
+    Raises
+    ------
+    ValueError
+        If the type is not "regions" or "departements", or a name is missing from the geojson file.
+    """
+    geojson_filename, names = _geojson_filename(type)
+    polygones = extract_list_poly(geojson_filename, names, largest=largest)
+    missing = [name for index, name in enumerate(names) if index not in polygones]
+    if missing:
+        raise ValueError(f"The geometries of {missing} are not in {geojson_filename}")
+    geometries = np.array([polygones[index] for index in range(len(names))])
+    if tolerance is not None:
+        geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    wkbs = shapely.to_wkb(geometries)
+    filename = Path(filename or _geometry_store_filename(type, tolerance, largest))
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = filename.with_suffix(f".{os.getpid()}.part.npz")
+    np.savez(tmp_file,
+             names=np.array(names),
+             wkb=np.frombuffer(b"".join(wkbs), dtype=np.uint8),
+             offsets=np.cumsum([0] + [len(wkb) for wkb in wkbs]),
+             source_hash=np.array(content_hash(geojson_filename)))
+    os.replace(tmp_file, filename)
+    return filename
+
+
+def load_geometry_store(filename):
+    """Load the geometries of a file written by :func:`build_geometry_store`.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the file to read.
+
+    Returns
+    -------
+    tuple[list[str], dict[int, Polygon | MultiPolygon], str]
+        the names of the zones, the geometry of each zone indexed by its position in the names,
+        and the hash of the geojson file.
+    """
+    with np.load(filename) as data:
+        names = data["names"].tolist()
+        wkb = data["wkb"].tobytes()
+        offsets = data["offsets"]
+        source_hash = str(data["source_hash"])
+    wkbs = np.array([wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+    return names, dict(enumerate(shapely.from_wkb(wkbs))), source_hash
+
+
+def _geometry_store_filename(type, tolerance=None, largest=False):
+    suffix = ("" if tolerance is None else f"_{tolerance:g}") + ("_largest" if largest else "")
+    return GEOMETRY_STORE_DIR / f"{type}{suffix}.npz"
+
+
+def get_geometries(type, tolerance=None, largest=False):
+    """Get the geometries of the regions or the departements of France.
+
+    The geometries are read from the binary file of :func:`build_geometry_store`,
+    built from the geojson file on the first call or when the geojson file changes,
+    and memoized for the process.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    tolerance : float, optional
+        the tolerance of the simplification of the geometries, in degrees.
+        Default is None, to keep the full geometries.
+    largest : bool, optional
+        if True, only the largest polygon of each zone is kept, see :func:`extract_list_poly`.
+        Default is False.
+
+    Returns
+    -------
+    dict[int, Polygon | MultiPolygon]
+        the geometry of each zone, indexed by its position in
+        :py:data:`energy_forecast.constants.region_names` or :py:data:`energy_forecast.constants.departement_names`,
+        as :func:`extract_list_poly`.
+    """
+    geojson_filename, names = _geojson_filename(type)
+    source_hash = content_hash(geojson_filename)
+    key = (type, tolerance, largest, source_hash)
+    if key not in _geometries:
+        filename = _geometry_store_filename(type, tolerance, largest)
+        stored_names, geometries, stored_hash = (load_geometry_store(filename) if filename.exists()
+                                                 else (None, None, None))
+        if stored_hash != source_hash or stored_names != names:
+            logger.info(f"Building the geometry store of the {type}")
+            build_geometry_store(type, tolerance, largest=largest)
+            _, geometries, _ = load_geometry_store(filename)
+        _geometries[key] = geometries
+    return _geometries[key]
+
+
+def _grid_coords(grid=None):
+    """Return the longitudes and latitudes of a grid, by default the grid of France."""
+    if grid is None:
+        data_coords = np.load(LONLAT_FRANCE_FILENAME)
+        return data_coords['lon'], data_coords['lat']
+    return np.asarray(grid["longitude"]), np.asarray(grid["latitude"])
+
+
+def grid_signature(type, grid=None):
+    """Return the signature of the mask of a grid.
+
+    The signature is a hash of the coordinates of the grid (rounded to 1e-6 degree),
+    of the content of the geojson file, of the names of the zones and of :py:data:`MASK_VERSION`,
+    so it changes when either changes.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        an object with the coordinates ``longitude`` and ``latitude``.
+        Default is None, for the grid of France at 0.1° (see :py:data:`LONLAT_FRANCE_FILENAME`).
+
+    Returns
+    -------
+    str
+        the hexadecimal signature.
+    """
+    geojson_filename, names = _geojson_filename(type)
+    longitude, latitude = _grid_coords(grid)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(MASK_VERSION).encode())
+    for coords in [longitude, latitude]:
+        digest.update(np.round(np.asarray(coords, dtype=float), 6).tobytes())
+    digest.update(content_hash(geojson_filename).encode())
+    digest.update("\n".join(names).encode())
+    return digest.hexdigest()
+
+
+def generate_mask(type, grid=None):
     """Produce a mask of France with the regions or the departements.
 
+    Each cell is given to the zone containing its centre.
+    Only the largest polygon of each zone is used (see :func:`extract_list_poly`),
+    so the inputs of the production models trained with these masks do not change;
+    the full geometries are used by the area weighting (see :func:`generate_coverage`).
+
     Parameters
     ----------
     type : str
         Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        an object with the coordinates ``longitude`` and ``latitude``.
+        Default is None, for the grid of France at 0.1° (see :py:data:`LONLAT_FRANCE_FILENAME`).
 
     Returns
     -------
@@ -82,40 +301,29 @@ def generate_mask(type):
     ValueError
         If the type is not "regions" or "departements".
     """
-    if type == "regions":
-        geojson_filename = ROOT_DIR / "data" / "geo" / "regions.geojson"
-        names = region_names
-    elif type == "departements":
-        geojson_filename = ROOT_DIR / "data" / "geo" / "departements.geojson"
-        names = departement_names
-    else:
-        raise ValueError("type should be either 'regions' or 'departements'")
-    
-    polygones = extract_list_poly(geojson_filename, names)
-    
-    data_coords = np.load(LONLAT_FRANCE_FILENAME)
-    long = xr.DataArray(data_coords['lon'], dims='longitude', coords={'longitude': data_coords['lon']})
-    lat = xr.DataArray(data_coords['lat'], dims='latitude', coords={'latitude': data_coords['lat']})
-    
-    mask = xr.apply_ufunc(
-        which_region,
-        long,
-        lat,
-        kwargs={"polygons_regions": polygones},
-        vectorize=True,
-        dask="parallelized",
-    )
+    polygones = get_geometries(type, largest=True)
+
+    longitude, latitude = _grid_coords(grid)
+    long, lat = np.meshgrid(longitude, latitude, indexing="ij")
+    mask = xr.DataArray(points_in_polygons(long, lat, polygones),
+                        dims=("longitude", "latitude"),
+                        coords={"longitude": longitude, "latitude": latitude})
     return mask
 
-def get_mask(type):
+def get_mask(type, grid=None):
     """Get the mask of France with the regions or the departements.
-    
-    The mask is saved in a file in the data/geo folder and is loaded if it exists.
+
+    The masks are cached by grid signature (see :func:`grid_signature`),
+    in memory for the process and in files of :py:data:`MASK_CACHE_DIR`.
+    A mask is generated only for a new grid or when the geojson file changes.
 
     Parameters
     ----------
     type : str
         Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        an object with the coordinates ``longitude`` and ``latitude``, e.g. the weather dataset.
+        Default is None, for the grid of France at 0.1° (see :py:data:`LONLAT_FRANCE_FILENAME`).
 
     Returns
     -------
@@ -127,42 +335,438 @@ def get_mask(type):
     ValueError
         If the type is not "regions" or "departements".
     """
-    if type not in ["regions", "departements"]:
-        raise ValueError("type should be either 'regions' or 'departements'")
-    file_to_save = ROOT_DIR / "data" / "geo" / f"mask_france_{type}.nc"
+    signature = grid_signature(type, grid)
+    if (type, signature) in _masks:
+        return _masks[(type, signature)]
+    file_to_save = MASK_CACHE_DIR / f"mask_france_{type}_{signature}.nc"
     if not file_to_save.exists():
-        mask = generate_mask(type)
-        mask.to_netcdf(file_to_save)
+        logger.info(f"Generating the mask of the {type} for the grid {signature}")
+        mask = generate_mask(type, grid)
+        file_to_save.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file_to_save.with_suffix(f".{os.getpid()}.part")
+        mask.to_netcdf(tmp_file)
+        os.replace(tmp_file, file_to_save)
     else:
-        mask = xr.open_dataarray(file_to_save)
+        with xr.open_dataarray(file_to_save) as mask:
+            mask = mask.load()
+    _masks[(type, signature)] = mask
     return mask
 
-def get_mask_regions():
+def get_mask_regions(grid=None):
     """Get the mask of France with the regions.
     
-    A wrapper around get_mask("regions").
+    A wrapper around get_mask("regions", grid).
+
+    Parameters
+    ----------
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid of the mask, see :func:`get_mask`.
 
     Returns
     -------
     xr.DataArray
         The mask of France with the regions.
     """
-    return get_mask("regions")
+    return get_mask("regions", grid)
 
-def get_mask_departements():
+def get_mask_departements(grid=None):
     """Get the mask of France with the departements.
 
-    A wrapper around get_mask("departements").
-    
+    A wrapper around get_mask("departements", grid).
+
+    Parameters
+    ----------
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid of the mask, see :func:`get_mask`.
+
     Returns
     -------
     xr.DataArray
         The mask of France with the departements.
     """
-    return get_mask("departements")
+    return get_mask("departements", grid)
+
+def _cell_edges(coords):
+    """Return the lower and upper edges of the cells centred on the coordinates."""
+    half_widths = np.abs(np.gradient(np.asarray(coords, dtype=float))) / 2
+    return coords - half_widths, coords + half_widths
+
+
+def generate_coverage(type, grid=None):
+    """Compute the area of each cell of the grid covered by each region or departement.
+
+    Each cell is a box centred on its coordinates, intersected with the full geometry of the zones.
+    The areas in square degrees are multiplied by the cosine of the latitude,
+    so they are proportional to the areas on the ground.
+    A cell on a border is shared between its zones, in proportion to the area of each one,
+    and the small zones (islands, coastal departements) get their coastal cells.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        an object with the coordinates ``longitude`` and ``latitude``.
+        Default is None, for the grid of France at 0.1° (see :py:data:`LONLAT_FRANCE_FILENAME`).
+
+    Returns
+    -------
+    sparse.csr_array
+        the ``(cells, zones)`` covered areas, the cells being ordered as the flattened ``(latitude, longitude)`` grid,
+        see :class:`energy_forecast.zonal.ZonalAggregator`.
+    """
+    _, names = _geojson_filename(type)
+    polygones = get_geometries(type)
+    indexes = np.array(list(polygones))
+    geometries = np.array(list(polygones.values()))
+    shapely.prepare(geometries)
+
+    longitude, latitude = _grid_coords(grid)
+    lon_min, lon_max = _cell_edges(longitude)
+    lat_min, lat_max = _cell_edges(latitude)
+    lat_lower, lon_lower = np.meshgrid(np.minimum(lat_min, lat_max), lon_min, indexing="ij")
+    lat_upper, lon_upper = np.meshgrid(np.maximum(lat_min, lat_max), lon_max, indexing="ij")
+    cells = shapely.box(lon_lower.ravel(), lat_lower.ravel(), lon_upper.ravel(), lat_upper.ravel())
+
+    cell_positions, zone_positions = shapely.STRtree(geometries).query(cells, predicate="intersects")
+    areas = shapely.area(cells[cell_positions])
+    # only the cells on a border need an intersection
+    border = ~shapely.contains_properly(geometries[zone_positions], cells[cell_positions])
+    areas[border] = shapely.area(shapely.intersection(cells[cell_positions[border]],
+                                                      geometries[zone_positions[border]]))
+    cos_latitude = np.cos(np.deg2rad(np.repeat(latitude, len(longitude))))
+    coverage = sparse.csr_array((areas * cos_latitude[cell_positions], (cell_positions, indexes[zone_positions])),
+                                shape=(cells.size, len(names)))
+    coverage.eliminate_zeros()
+    return coverage
+
+
+def get_coverage(type, grid=None):
+    """Get the area of each cell of the grid covered by each region or departement.
+
+    The coverages are cached like the masks (see :func:`get_mask`),
+    in memory and in ``.npz`` files of :py:data:`MASK_CACHE_DIR`,
+    so the intersections of the polygons are computed once per grid.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid, see :func:`get_mask`.
+
+    Returns
+    -------
+    sparse.csr_array
+        the ``(cells, zones)`` covered areas, see :func:`generate_coverage`.
+    """
+    signature = grid_signature(type, grid)
+    if (type, signature) in _coverages:
+        return _coverages[(type, signature)]
+    file_to_save = MASK_CACHE_DIR / f"coverage_france_{type}_{signature}.npz"
+    if not file_to_save.exists():
+        logger.info(f"Generating the coverage of the {type} for the grid {signature}")
+        coverage = generate_coverage(type, grid)
+        file_to_save.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file_to_save.with_suffix(f".{os.getpid()}.part.npz")
+        sparse.save_npz(tmp_file, coverage)
+        os.replace(tmp_file, file_to_save)
+    else:
+        coverage = sparse.csr_array(sparse.load_npz(file_to_save))
+    _coverages[(type, signature)] = coverage
+    return coverage
+
+
+def _capacity_filename(capacity):
+    """Return the file of an installed capacity, given as a path or as a name in :py:data:`CAPACITY_DIR`."""
+    filename = Path(capacity)
+    candidates = [filename, CAPACITY_DIR / filename]
+    if not filename.suffix:
+        candidates += [CAPACITY_DIR / f"{filename.name}{suffix}" for suffix in [".csv", ".nc"]]
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+    raise FileNotFoundError(f"No file of installed capacity {capacity} in {CAPACITY_DIR}")
+
+
+def load_capacity(capacity):
+    """Load the installed capacity of the production sites, from a point file or a raster.
+
+    Two formats are accepted:
+
+    - a ``.csv`` file of points, with the columns ``longitude``, ``latitude`` and ``capacity``,
+      e.g. one line per installation of the national register;
+    - a ``.nc`` raster, with a single variable on the dimensions ``longitude`` and ``latitude``,
+      each cell being a point at its centre.
+
+    Parameters
+    ----------
+    capacity : str | Path
+        the file, or its name in :py:data:`CAPACITY_DIR`, with or without the suffix,
+        e.g. ``"capacity_wind"`` for ``data/geo/capacity_wind.csv``.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        the longitudes, the latitudes and the positive capacities of the points.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist.
+    ValueError
+        If the format of the file is unknown, or a column is missing.
+    """
+    filename = _capacity_filename(capacity)
+    if filename.suffix == ".csv":
+        df = pd.read_csv(filename)
+        missing = {"longitude", "latitude", "capacity"} - set(df.columns)
+        if missing:
+            raise ValueError(f"The columns {sorted(missing)} are missing in {filename}")
+        lon, lat, values = (df[column].to_numpy(dtype=float) for column in ["longitude", "latitude", "capacity"])
+    elif filename.suffix == ".nc":
+        with xr.open_dataarray(filename) as da:
+            da = da.load()
+        lat, lon = np.meshgrid(da["latitude"].to_numpy(), da["longitude"].to_numpy(), indexing="ij")
+        values = da.transpose("latitude", "longitude").to_numpy().astype(float)
+        lon, lat, values = lon.ravel(), lat.ravel(), values.ravel()
+    else:
+        raise ValueError(f"Unknown format of installed capacity {filename.suffix} : must be in ['.csv', '.nc']")
+    kept = np.isfinite(lon) & np.isfinite(lat) & (values > 0)
+    return lon[kept], lat[kept], values[kept]
+
+
+def generate_capacity_coverage(type, capacity, grid=None):
+    """Compute the installed capacity of each cell of the grid in each region or departement.
+
+    Each point of capacity belongs to the zone containing it (see :func:`points_in_polygons`),
+    and is spread over the four surrounding cells with the bilinear weights
+    (see :py:meth:`energy_forecast.zonal.ZonalAggregator.from_points`).
+    The mean over a zone with these weights is thus the mean of the values at its sites,
+    weighted by their capacity.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    capacity : str | Path
+        the file of the installed capacity, see :func:`load_capacity`.
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid, see :func:`get_mask`.
+
+    Returns
+    -------
+    sparse.csr_array
+        the ``(cells, zones)`` installed capacities, the cells being ordered as the flattened ``(latitude, longitude)`` grid.
+    """
+    _, names = _geojson_filename(type)
+    lon, lat, values = load_capacity(capacity)
+    zones = points_in_polygons(lon, lat, get_geometries(type))
+    in_zone = ~np.isnan(zones)
+    if not in_zone.all():
+        logger.warning(f"{values[~in_zone].sum():.1f} of installed capacity is outside of the {type}")
+    longitude, latitude = _grid_coords(grid)
+    sites = ZonalAggregator.from_points(longitude, latitude, lon[in_zone], lat[in_zone])
+    site_zones = sparse.csr_array((values[in_zone], (np.arange(in_zone.sum()), zones[in_zone].astype(int))),
+                                  shape=(in_zone.sum(), len(names)))
+    coverage = sparse.csr_array(sites.coverage @ site_zones)
+    coverage.eliminate_zeros()
+    return coverage
+
+
+def get_capacity_coverage(type, capacity, grid=None):
+    """Get the installed capacity of each cell of the grid in each region or departement.
+
+    The coverages are cached like the area coverages (see :func:`get_coverage`),
+    by grid signature and hash of the file of the installed capacity.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    capacity : str | Path
+        the file of the installed capacity, see :func:`load_capacity`.
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid, see :func:`get_mask`.
+
+    Returns
+    -------
+    sparse.csr_array
+        the ``(cells, zones)`` installed capacities, see :func:`generate_capacity_coverage`.
+    """
+    filename = _capacity_filename(capacity)
+    signature = grid_signature(type, grid)
+    capacity_hash = content_hash(filename)[:16]
+    key = (type, signature, capacity_hash)
+    if key in _capacity_coverages:
+        return _capacity_coverages[key]
+    file_to_save = MASK_CACHE_DIR / f"capacity_france_{type}_{filename.stem}_{signature}_{capacity_hash}.npz"
+    if not file_to_save.exists():
+        logger.info(f"Generating the coverage of the {type} weighted by {filename.name} for the grid {signature}")
+        coverage = generate_capacity_coverage(type, filename, grid)
+        file_to_save.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file_to_save.with_suffix(f".{os.getpid()}.part.npz")
+        sparse.save_npz(tmp_file, coverage)
+        os.replace(tmp_file, file_to_save)
+    else:
+        coverage = sparse.csr_array(sparse.load_npz(file_to_save))
+    _capacity_coverages[key] = coverage
+    return coverage
+
+
+def get_zone_aggregator(type, grid=None, weighting="area", capacity=None):
+    """Get the aggregator of the data of a grid over the regions or the departements.
+
+    Parameters
+    ----------
+    type : str
+        Either "regions" or "departements".
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid, see :func:`get_mask`.
+    weighting : str, optional
+        ``"area"`` to weight the cells by their area in each zone (see :func:`get_coverage`),
+        ``"cells"`` to give each cell to the zone containing its centre (see :func:`get_mask`),
+        or ``"capacity"`` to weight the cells by their installed capacity in each zone
+        (see :func:`get_capacity_coverage`). The zones without capacity are NaN.
+        With ``"area"`` and ``"cells"``, the zones covering no cell of the grid are left out,
+        e.g. Paris on a grid coarser than the departement.
+        Default is ``"area"``.
+    capacity : str | Path, optional
+        the file of the installed capacity, required by the weighting ``"capacity"``,
+        see :func:`load_capacity`.
+
+    Returns
+    -------
+    ZonalAggregator
+        the aggregator, with the dimension ``"region"`` or ``"departement"``.
+
+    Raises
+    ------
+    ValueError
+        If the type or the weighting is unknown, or the capacity is missing.
+    """
+    _, names = _geojson_filename(type)
+    label = type.removesuffix("s")
+    if weighting == "cells":
+        return ZonalAggregator.from_masks(get_mask(type, grid), names, label).drop_empty_zones()
+    if weighting == "area":
+        coverage = get_coverage(type, grid)
+    elif weighting == "capacity":
+        if capacity is None:
+            raise ValueError("the file of the installed capacity is required by the weighting 'capacity'")
+        coverage = get_capacity_coverage(type, capacity, grid)
+    else:
+        raise ValueError("weighting should be either 'area', 'cells' or 'capacity'")
+    longitude, latitude = _grid_coords(grid)
+    aggregator = ZonalAggregator.from_coverage(coverage, longitude, latitude, names, label)
+    return aggregator.drop_empty_zones() if weighting == "area" else aggregator
+
+
+def points_in_polygons(lon: np.ndarray, lat: np.ndarray, polygons_regions: dict[int, Polygon]) -> np.ndarray:
+    """Return the index of the region in which each point is located.
+
+    This is the vectorized version of :func:`which_region`:
+    the polygons are indexed in a ``shapely.STRtree``, queried with all the points at once.
+    A point located in several polygons gets the first one, in the order of the dictionary.
+
+    Parameters
+    ----------
+    lon : np.ndarray
+        The longitudes of the points.
+    lat : np.ndarray
+        The latitudes of the points, with the same shape as ``lon``.
+    polygons_regions : dict[int, Polygon]
+        The dictionary of polygons representing the regions.
+
+    Returns
+    -------
+    np.ndarray
+        The index of the region of each point, NaN outside of all the regions,
+        with the same shape as ``lon``.
+    """
+    indexes = np.array(list(polygons_regions), dtype=float)
+    tree = shapely.STRtree(list(polygons_regions.values()))
+    points = shapely.points(np.ravel(lon), np.ravel(lat))
+    point_positions, polygon_positions = tree.query(points, predicate="within")
+    # keep the first polygon of each point
+    order = np.lexsort((polygon_positions, point_positions))
+    point_positions, polygon_positions = point_positions[order], polygon_positions[order]
+    first = np.unique(point_positions, return_index=True)[1]
+    result = np.full(points.size, np.nan)
+    result[point_positions[first]] = indexes[polygon_positions[first]]
+    return result.reshape(np.shape(lon))
+
+
+def load_departement_weights(filename=None):
+    """Load the weights of the departements, e.g. their population.
+
+    The file is a ``.csv`` file with the columns ``departement``, the code of the departement
+    as in the names of the observation files of Météo-France (e.g. ``"01"``, ``"20"`` for Corsica),
+    and ``weight``.
+
+    Parameters
+    ----------
+    filename : str | Path, optional
+        the file of the weights.
+        Default is :py:data:`DEPARTEMENT_WEIGHTS_FILENAME`.
+
+    Returns
+    -------
+    pd.Series
+        the weight of each departement, indexed by the code of the departement.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist.
+    ValueError
+        If a column is missing, or a weight is negative.
+    """
+    filename = Path(filename or DEPARTEMENT_WEIGHTS_FILENAME)
+    df = pd.read_csv(filename, dtype={"departement": str})
+    missing = {"departement", "weight"} - set(df.columns)
+    if missing:
+        raise ValueError(f"The columns {sorted(missing)} are missing in {filename}")
+    weights = df.set_index(df["departement"].str.zfill(2).rename("departement"))["weight"].astype(float)
+    if (weights < 0).any():
+        raise ValueError(f"The weights of {filename} should be positive")
+    return weights
+
+
+def get_zone_hierarchy(grid=None, weighting="area", capacity=None):
+    """Get the table of the departements of France with their region and their weight.
+
+    The weight of a departement is its total weight in the aggregation (see :func:`get_zone_aggregator`),
+    so the mean over a region is exactly the weighted mean of the means over its departements
+    (see :func:`energy_forecast.zonal.rollup`).
+
+    Parameters
+    ----------
+    grid : xr.Dataset | xr.DataArray, optional
+        the grid, see :func:`get_mask`.
+    weighting : str, optional
+        ``"area"``, ``"cells"`` or ``"capacity"``, see :func:`get_zone_aggregator`.
+        Default is ``"area"``.
+    capacity : str | Path, optional
+        the file of the installed capacity, for the weighting ``"capacity"``.
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by the departements of the aggregation
+        (in the order of :py:data:`energy_forecast.constants.departement_names`),
+        with the columns ``"region"`` and ``"weight"``.
+    """
+    aggregator = get_zone_aggregator("departements", grid, weighting, capacity)
+    return pd.DataFrame({"region": [departement_regions[name] for name in aggregator.names],
+                         "weight": aggregator.totals},
+                        index=pd.Index(aggregator.names, name="departement"))
+
 
 def which_region(lon, lat, polygons_regions: dict[int, Polygon]):
     """Return the index of the region in which the point is located.
+
+    See :func:`points_in_polygons` to locate many points at once.
     
     Parameters
     ----------
@@ -183,3 +787,21 @@ def which_region(lon, lat, polygons_regions: dict[int, Polygon]):
             return index
     else:
         return np.nan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary files of the geometries of the regions and the departements.")
+    parser.add_argument("--type", nargs="+", default=["regions", "departements"], choices=["regions", "departements"],
+                        help="the geometries to build (default: both)")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="the tolerance of the simplification, in degrees (default: no simplification)")
+    args = parser.parse_args()
+    for type in args.type:
+        for largest in [False, True]:
+            filename = build_geometry_store(type, args.tolerance, largest=largest)
+            print(f"Built {filename} ({filename.stat().st_size / 1024:.0f} kB)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
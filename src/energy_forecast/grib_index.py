@@ -0,0 +1,398 @@
+"""Implements a light index of the messages of a GRIB2 file, and manages the cfgrib index files.
+
+A GRIB2 file is a concatenation of independent messages, each one containing a single field.
+The header of each message gives its total length and describes the field
+(parameter, type of level, level), so the file can be indexed by reading only a few hundred bytes per message.
+
+This is used to download only the messages that are needed from the remote files, with HTTP ``Range`` requests.
+The concatenation of the selected messages is itself a valid GRIB2 file, which can be read by cfgrib.
+
+cfgrib also scans the whole file to build its own index, saved by default next to the GRIB file.
+:func:`open_grib` saves these index files in a dedicated directory instead,
+named after the path, the size and the modification time of the GRIB file (see :func:`index_key`),
+so they are never stale and work even if the GRIB directory is read-only.
+They are deleted with their GRIB file by :func:`energy_forecast.retention.evict`, see :func:`remove_index`.
+
+.. seealso::
+    The `GRIB2 documentation <https://codes.ecmwf.int/grib/format/grib2/>`_ from ECMWF.
+"""
+import fcntl
+import hashlib
+import os
+import struct
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import xarray as xr
+
+#: Directory of the cfgrib index files.
+CFGRIB_INDEX_DIR = Path("/tmp/cache/energy_forecast/cfgrib_index")
+
+#: Product discipline, parameter category and parameter number of the ``cfVarName`` used in this project.
+GRIB2_PARAMETERS = {
+    "ssrd": (0, 4, 7),
+    "si10": (0, 2, 1),
+    "t2m": (0, 0, 0),
+}
+
+#: Code of the type of the first fixed surface for each ``typeOfLevel``.
+GRIB2_LEVEL_TYPES = {
+    "surface": 1,
+    "heightAboveGround": 103,
+}
+
+#: Size of the section 0 of a GRIB2 message, the smallest possible header.
+SECTION_0_SIZE = 16
+
+#: Number of bytes read to parse the header of a message.
+#: Sections 0 to 4 of the ARPEGE files fit in a few hundred bytes.
+HEADER_SIZE = 1024
+
+_MISSING_LEVEL = 0xFFFFFFFF
+
+
+def parse_message_header(data: bytes, offset: int = 0) -> dict:
+    """Parse the header (sections 0 to 4) of a GRIB2 message.
+
+    Parameters
+    ----------
+    data : bytes
+        the first bytes of the message.
+    offset : int, optional
+        the offset of the message in the file, reported in the result.
+        Default is 0.
+
+    Returns
+    -------
+    dict
+        the description of the message, with the keys ``"offset"``, ``"length"``,
+        ``"discipline"``, ``"parameterCategory"``, ``"parameterNumber"``,
+        ``"typeOfFirstFixedSurface"`` and ``"level"``.
+        The description keys are None if ``data`` is too short to contain the section 4.
+
+    Raises
+    ------
+    ValueError
+        if the data is not the start of a GRIB2 message, or its length is shorter than the section 0.
+    """
+    if len(data) < SECTION_0_SIZE or data[:4] != b"GRIB":
+        raise ValueError(f"No GRIB message at offset {offset}")
+    if data[7] != 2:
+        raise ValueError(f"Only GRIB edition 2 is supported, got edition {data[7]} at offset {offset}")
+    length = struct.unpack(">Q", data[8:SECTION_0_SIZE])[0]
+    if length < SECTION_0_SIZE:
+        raise ValueError(f"Corrupt GRIB message at offset {offset}: length {length}")
+    message = {
+        "offset": offset,
+        "length": length,
+        "discipline": data[6],
+        "parameterCategory": None,
+        "parameterNumber": None,
+        "typeOfFirstFixedSurface": None,
+        "level": None,
+    }
+    position = 16
+    while position + 5 <= len(data):
+        section_length, section_number = struct.unpack(">IB", data[position:position + 5])
+        if section_number == 4:
+            section = data[position:position + section_length]
+            if len(section) < 28:
+                break
+            scale_factor = struct.unpack(">b", section[23:24])[0]
+            scaled_value = struct.unpack(">I", section[24:28])[0]
+            message["parameterCategory"] = section[9]
+            message["parameterNumber"] = section[10]
+            message["typeOfFirstFixedSurface"] = section[22]
+            if scaled_value != _MISSING_LEVEL:
+                message["level"] = scaled_value / 10 ** scale_factor
+            break
+        position += section_length
+    return message
+
+
+def iter_messages(read: Callable[[int, int], bytes], block_size: int = HEADER_SIZE) -> Iterator[dict]:
+    """Iterate over the messages of a GRIB2 file, reading only their headers.
+
+    The file is read by blocks of ``block_size`` bytes:
+    the headers of the following messages starting in the same block are parsed without another read,
+    so a file of small messages is indexed with a few requests.
+
+    Parameters
+    ----------
+    read : Callable[[int, int], bytes]
+        a function returning ``length`` bytes of the file starting at ``offset``,
+        called as ``read(offset, length)``.
+        It returns fewer bytes (or none) at the end of the file.
+    block_size : int, optional
+        the minimum number of bytes read at once.
+        Default is :py:data:`HEADER_SIZE`, to read only the headers.
+
+    Yields
+    ------
+    dict
+        the description of each message, see :func:`parse_message_header`.
+
+    Raises
+    ------
+    ValueError
+        if a header is truncated or corrupt, so the next message cannot be located.
+    """
+    block_start, block, end_of_file = 0, b"", False
+
+    def read_block(offset, length):
+        nonlocal block_start, block, end_of_file
+        if block_start <= offset and (offset + length <= block_start + len(block) or end_of_file):
+            return block[offset - block_start:offset - block_start + length]
+        size = max(length, block_size)
+        block_start, block = offset, read(offset, size)
+        end_of_file = len(block) < size
+        return block[:length]
+
+    offset = 0
+    while True:
+        data = read_block(offset, HEADER_SIZE)
+        if not data:
+            return
+        if len(data) < SECTION_0_SIZE:
+            raise ValueError(f"Truncated GRIB header at offset {offset}: {len(data)} bytes")
+        message = parse_message_header(data, offset)
+        if message["parameterCategory"] is None and len(data) == HEADER_SIZE:
+            # the header is larger than expected (e.g. a large local section)
+            message = parse_message_header(read_block(offset, message["length"]), offset)
+        yield message
+        offset += message["length"]
+
+
+def match_keys_filter(message: dict, keys_filter: dict) -> bool:
+    """Check if a message matches a cfgrib ``filter_by_keys`` dictionary.
+
+    Only the keys ``"cfVarName"``, ``"typeOfLevel"`` and ``"level"`` are supported,
+    see :py:data:`GRIB2_PARAMETERS` and :py:data:`GRIB2_LEVEL_TYPES`.
+
+    Parameters
+    ----------
+    message : dict
+        the description of the message, see :func:`parse_message_header`.
+    keys_filter : dict
+        the keys to filter the data, e.g. :py:data:`energy_forecast.meteo.KEYS_FILTER_WIND`.
+
+    Returns
+    -------
+    bool
+        True if the message matches all the keys.
+
+    Raises
+    ------
+    ValueError
+        if a key or a value of the filter is not supported.
+    """
+    for key, value in keys_filter.items():
+        if key == "cfVarName":
+            if value not in GRIB2_PARAMETERS:
+                raise ValueError(f"Unknown cfVarName {value} : must be in {list(GRIB2_PARAMETERS)}")
+            actual = (message["discipline"], message["parameterCategory"], message["parameterNumber"])
+            if actual != GRIB2_PARAMETERS[value]:
+                return False
+        elif key == "typeOfLevel":
+            if value not in GRIB2_LEVEL_TYPES:
+                raise ValueError(f"Unknown typeOfLevel {value} : must be in {list(GRIB2_LEVEL_TYPES)}")
+            if message["typeOfFirstFixedSurface"] != GRIB2_LEVEL_TYPES[value]:
+                return False
+        elif key == "level":
+            if message["level"] != value:
+                return False
+        else:
+            raise ValueError(f"Unknown key {key} : must be in ['cfVarName', 'typeOfLevel', 'level']")
+    return True
+
+
+def select_messages(messages: list[dict], keys_filters: list[dict]) -> list[dict]:
+    """Return the messages matching at least one of the filters, in the order of the file.
+
+    Parameters
+    ----------
+    messages : list[dict]
+        the messages of the file, see :func:`iter_messages`.
+    keys_filters : list[dict]
+        the cfgrib ``filter_by_keys`` dictionaries.
+
+    Returns
+    -------
+    list[dict]
+        the selected messages.
+    """
+    return [message for message in messages
+            if any(match_keys_filter(message, keys_filter) for keys_filter in keys_filters)]
+
+
+def merge_ranges(messages: list[dict]) -> list[tuple[int, int]]:
+    """Merge the byte ranges of contiguous messages, to reduce the number of requests.
+
+    Parameters
+    ----------
+    messages : list[dict]
+        the messages to download, sorted by offset.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        the ``(start, end)`` byte ranges, ``end`` being excluded.
+    """
+    ranges: list[tuple[int, int]] = []
+    for message in messages:
+        start, end = message["offset"], message["offset"] + message["length"]
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+@lru_cache(maxsize=256)
+def _file_digest(filename: str, size: int, mtime_ns: int) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()[:32]
+
+
+def content_hash(filename: str | Path) -> str:
+    """Return a hash of the content of the file.
+
+    The hash is cached in memory for the process, as long as the size and the modification time of the file are unchanged.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the file to hash.
+
+    Returns
+    -------
+    str
+        the hexadecimal hash of the file.
+    """
+    stat = os.stat(filename)
+    return _file_digest(str(filename), stat.st_size, stat.st_mtime_ns)
+
+
+def index_key(filename: str | Path) -> str:
+    """Return the name of the cfgrib index files of a GRIB file.
+
+    The name is a hash of the resolved path, the size and the modification time of the file,
+    so the file is not read, and a new version of the file gets new index files.
+    cfgrib checks the path of the GRIB file saved in the index anyway, so an index is never shared between paths.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the GRIB file.
+
+    Returns
+    -------
+    str
+        the hexadecimal key.
+    """
+    path = Path(filename).resolve()
+    stat = path.stat()
+    return hashlib.blake2b(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode(), digest_size=16).hexdigest()
+
+
+def cfgrib_indexpath(filename: str | Path, index_dir: str | Path = CFGRIB_INDEX_DIR) -> str:
+    """Return the template of the cfgrib index files of a GRIB file.
+
+    The index files are named after :func:`index_key`,
+    and cfgrib appends a hash of the indexed keys (``{short_hash}``).
+
+    Parameters
+    ----------
+    filename : str | Path
+        the GRIB file.
+    index_dir : str | Path, optional
+        the directory of the index files.
+        Default is :py:data:`CFGRIB_INDEX_DIR`.
+
+    Returns
+    -------
+    str
+        the ``indexpath`` argument of cfgrib.
+    """
+    return f"{index_dir}/{index_key(filename)}.{{short_hash}}.idx"
+
+
+@contextmanager
+def index_lock(filename: str | Path, index_dir: str | Path = CFGRIB_INDEX_DIR):
+    """Lock the cfgrib index files of a GRIB file, between processes.
+
+    cfgrib writes the index file in place: without the lock,
+    another process could read a partially written index and fail to use it.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the GRIB file.
+    index_dir : str | Path, optional
+        the directory of the index files.
+        Default is :py:data:`CFGRIB_INDEX_DIR`.
+    """
+    Path(index_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(index_dir) / f"{index_key(filename)}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def remove_index(filename: str | Path, index_dir: str | Path = CFGRIB_INDEX_DIR) -> list[Path]:
+    """Delete the cfgrib index files of a GRIB file, before the GRIB file itself is deleted.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the GRIB file, which must still exist.
+    index_dir : str | Path, optional
+        the directory of the index files.
+        Default is :py:data:`CFGRIB_INDEX_DIR`.
+
+    Returns
+    -------
+    list[Path]
+        the deleted index files.
+    """
+    key = index_key(filename)
+    index_files = [*Path(index_dir).glob(f"{key}.*.idx"), Path(index_dir) / f"{key}.lock"]
+    deleted = []
+    for index_file in index_files:
+        if index_file.exists():
+            index_file.unlink(missing_ok=True)
+            deleted.append(index_file)
+    return deleted
+
+
+def open_grib(filename: str | Path, keys_filter: dict, index_dir: str | Path = CFGRIB_INDEX_DIR) -> xr.Dataset:
+    """Open a GRIB file with cfgrib, using the index files of ``index_dir``.
+
+    The first opening of a file scans it and saves the index,
+    the next ones (from any process) only read the index.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the GRIB file.
+    keys_filter : dict
+        the keys to filter the data.
+    index_dir : str | Path, optional
+        the directory of the index files.
+        Default is :py:data:`CFGRIB_INDEX_DIR`.
+
+    Returns
+    -------
+    xr.Dataset
+        the dataset containing the data of the file.
+    """
+    with index_lock(filename, index_dir):
+        return xr.open_dataset(filename,
+                               engine="cfgrib",
+                               backend_kwargs={"filter_by_keys": keys_filter,
+                                               "indexpath": cfgrib_indexpath(filename, index_dir)},
+                               )
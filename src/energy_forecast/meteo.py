@@ -1,14 +1,40 @@
+import json
 import logging
+import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import xarray as xr
-from energy_forecast.constants import departement_names, region_names, france_bounds
+from energy_forecast.constants import region_names, france_bounds
 from energy_forecast import ROOT_DIR
-from energy_forecast.geography import get_mask_departements, get_mask_regions
+from energy_forecast.download import (
+    IncompleteDownloadError,
+    RangeNotSupportedError,
+    conditional_download,
+    download_ranges,
+    partial_filename,
+    read_range,
+    stream_to_file,
+)
+from energy_forecast.grib_index import iter_messages, merge_ranges, open_grib, select_messages
+from energy_forecast.geography import get_zone_aggregator, get_zone_hierarchy
+from energy_forecast.observations import (
+    departement_of,
+    departement_temperatures,
+    national_temperature,
+    read_observations,
+)
 from energy_forecast.performances import memory
+from energy_forecast.retention import evict, use_run
+from energy_forecast.zonal import STATISTICS, ZonalAggregator, rollup, to_table
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +53,8 @@ KEYS_FILTER_T2M = {
     "level": 2,
     "cfVarName": "t2m",
 }
+#: The fields used in the project: solar radiation, wind speed and temperature.
+KEYS_FILTERS = [KEYS_FILTER_SSPD, KEYS_FILTER_WIND, KEYS_FILTER_T2M]
 
 GEO_DIR = ROOT_DIR / "data" / "geo"
 bounds_file = GEO_DIR / "france_bounds.yml"
@@ -37,6 +65,8 @@ class ArpegeSimpleAPI():
 
     It downloads the data in the format GRIB2 and reads it using xarray.
     If the file is already downloaded, it will not download it again.
+    The files are written atomically (see :func:`energy_forecast.download.stream_to_file`),
+    so a failed download never leaves a truncated file in the prefix folder.
 
     Parameters
     ----------
@@ -52,6 +82,24 @@ class ArpegeSimpleAPI():
         the prefix where the files are downloaded.
         Used to avoid downloading the same file multiple times.
         Default is ``"/tmp/arpege"``
+    max_workers : int, optional
+        the maximum number of forecast horizons downloaded in parallel.
+        Use ``1`` to download the files one after the other.
+        Default is ``4``
+    subset : bool, optional
+        if True, only the GRIB messages matching :py:attr:`subset_keys_filters`
+        are downloaded, using HTTP ``Range`` requests (see :py:meth:`fetch_subset`).
+        If False, the full files are downloaded.
+        Default is True
+    forecast_horizons : list[str], optional
+        the forecast horizons to download and read.
+        Default is None, which uses all the forecast horizons of the run (see :py:attr:`run_forecast_horizons`).
+
+    Notes
+    -----
+    After each :py:meth:`fetch`, the least recently used runs of the prefix folder are deleted
+    so that it stays below :py:attr:`max_prefix_size` and :py:attr:`max_prefix_age`,
+    see :py:meth:`evict`.
     """
 
     base_url = "https://object.data.gouv.fr/meteofrance-pnt/pnt/{date}T{time}Z/arpege/01/SP1/arpege__{resolution}__SP1__{forecast}__{date}T{time}Z.grib2"
@@ -66,14 +114,48 @@ class ArpegeSimpleAPI():
                          "097H102H",
                          ]
     resolution = "01"
+    #: The times of the runs of ARPEGE.
+    run_times = ["00:00:00", "06:00:00", "12:00:00", "18:00:00"]
+    #: The forecast horizons published for each run, the 06Z and 18Z runs stop earlier.
+    run_forecast_horizons = {"00:00:00": forecast_horizons,
+                             "06:00:00": forecast_horizons[:6],
+                             "12:00:00": forecast_horizons,
+                             "18:00:00": forecast_horizons[:5],
+                             }
+    #: The fields kept when downloading a subset of the files.
+    subset_keys_filters = KEYS_FILTERS
+    #: The size in bytes of the blocks read to locate the messages of a subset, see :py:func:`iter_messages`.
+    subset_probe_size = 64 * 1024
+    #: The maximum size of the prefix folder, see :py:meth:`evict`.
+    max_prefix_size = "5GB"
+    #: The maximum duration since the last use of a run in the prefix folder, see :py:meth:`evict`.
+    max_prefix_age = "7D"
+    #: The weighting of the cells in the means over the regions and the departements,
+    #: ``"area"`` or ``"cells"``, see :func:`energy_forecast.geography.get_zone_aggregator`.
+    #: The models saved in ``data/production_prediction`` were trained with ``"cells"``.
+    zone_weighting = "cells"
+    #: The files of the installed capacities of the solar and wind farms, in ``data/geo``,
+    #: see :func:`energy_forecast.geography.load_capacity`.
+    capacity_files = {"sun": "capacity_sun", "wind": "capacity_wind"}
 
     def __init__(self,
                  date=pd.Timestamp("today").strftime("%Y-%m-%d"),
                  time="00:00:00",
-                 prefix="/tmp/arpege",):
+                 prefix="/tmp/arpege",
+                 max_workers=4,
+                 subset=True,
+                 forecast_horizons=None,):
         self.date = date
         self.time = time
         self.prefix = prefix
+        self.max_workers = max_workers
+        self.subset = subset
+        if forecast_horizons is not None:
+            self.forecast_horizons = forecast_horizons
+        else:
+            self.forecast_horizons = self.run_forecast_horizons.get(time, self.forecast_horizons)
+        self.missing_horizons = []
+        self._session = None
         self.min_lon = france_bounds["min_lon"]
         self.max_lon = france_bounds["max_lon"]
         self.min_lat = france_bounds["min_lat"]
@@ -86,40 +168,307 @@ class ArpegeSimpleAPI():
                                     resolution=self.resolution,
                                     forecast=forecast_horizon)
 
-    def get_filename(self, forecast_horizon):
-        """Format the filename to save the data."""
-        return f"{self.prefix}/arpege_{self.resolution}_{self.date}_{self.time}_{forecast_horizon}.grib2"
+    def get_run(self):
+        """Format the name of the run, shared by all its files in the prefix folder."""
+        return f"arpege_{self.resolution}_{self.date}_{self.time}"
 
-    def fetch(self):
-        """Download the data from the API and save it in the prefix folder.
-        All the forecast horizons are downloaded.
+    @property
+    def run_timestamp(self):
+        """The date and time at which the weather forecast was computed."""
+        return pd.Timestamp(f"{self.date} {self.time}")
+
+    @classmethod
+    def latest_run(cls, now=None, max_runs=8, **kwargs):
+        """Return a client for the most recent run whose forecast horizons are all published.
+
+        The runs are checked from the most recent one, first on the disk (see :py:meth:`is_complete`),
+        then with a ``HEAD`` request on the last forecast horizon of the run (see :py:meth:`is_available`).
+
+        Parameters
+        ----------
+        now : str or pd.Timestamp, optional
+            the time (UTC) from which the runs are searched.
+            Default is None, for the current time.
+        max_runs : int, optional
+            the maximum number of runs checked.
+            Default is 8 (two days).
+        **kwargs
+            the other parameters of the client, e.g. ``prefix``.
 
         Returns
         -------
-        list[Path]
-            The list of the files downloaded.
+        ArpegeSimpleAPI
+            the client for the latest available run.
+
+        Raises
+        ------
+        ValueError
+            if none of the ``max_runs`` runs is available.
         """
-        list_files = []
-        for forecast_horizon in self.forecast_horizons:
-            logger.debug(f"Fetching {forecast_horizon}")
-            url = self.get_url(forecast_horizon=forecast_horizon)
-            filename = self.get_filename(forecast_horizon)
-            list_files.append(filename)
+        now = pd.Timestamp("now", tz="UTC").tz_localize(None) if now is None else pd.Timestamp(now)
+        run_timestamp = now.floor("6h")
+        for _ in range(max_runs):
+            client = cls(date=run_timestamp.strftime("%Y-%m-%d"),
+                         time=run_timestamp.strftime("%H:%M:%S"),
+                         **kwargs)
+            if client.is_complete() or client.is_available(client.forecast_horizons[-1]):
+                return client
+            logger.debug(f"The run {run_timestamp} is not available")
+            run_timestamp -= pd.Timedelta("6h")
+        raise ValueError(f"No run available in the {max_runs} runs before {now}")
+
+    @property
+    def last_valid_time(self):
+        """The last valid time covered by the forecast horizons of the client."""
+        return self.run_timestamp + pd.Timedelta(hours=forecast_horizon_hours(self.forecast_horizons[-1])[1])
+
+    def new_forecast_horizons(self, previous):
+        """Return the forecast horizons reaching valid times not covered by a previous run.
+
+        Parameters
+        ----------
+        previous : ArpegeSimpleAPI
+            the client of a previous run.
+
+        Returns
+        -------
+        list[str]
+            the forecast horizons of this run ending after :py:attr:`last_valid_time` of the previous run.
+        """
+        return [forecast_horizon for forecast_horizon in self.forecast_horizons
+                if self.run_timestamp + pd.Timedelta(hours=forecast_horizon_hours(forecast_horizon)[1])
+                > previous.last_valid_time]
+
+    def get_filename(self, forecast_horizon, subset=None):
+        """Format the filename to save the data.
+
+        Parameters
+        ----------
+        forecast_horizon : str
+            the forecast horizon of the file.
+        subset : bool, optional
+            whether the file holds only the messages of :py:attr:`subset_keys_filters`.
+            Default is None, which uses :py:attr:`subset`.
+        """
+        if subset is None:
+            subset = self.subset
+        suffix = "_subset" if subset else ""
+        return f"{self.prefix}/{self.get_run()}_{forecast_horizon}{suffix}.grib2"
+
+    def find_file(self, forecast_horizon):
+        """Find the downloaded file of a forecast horizon.
+
+        When :py:attr:`subset` is True, the full file, downloaded if the server does not support
+        ``Range`` requests, is used if the subset is missing.
+
+        Parameters
+        ----------
+        forecast_horizon : str
+            the forecast horizon of the file.
+
+        Returns
+        -------
+        str or None
+            the filename, or None if the forecast horizon is not downloaded.
+        """
+        candidates = [self.get_filename(forecast_horizon)]
+        if self.subset:
+            candidates.append(self.get_filename(forecast_horizon, subset=False))
+        for filename in candidates:
             if Path(filename).exists():
-                continue
-            filename = Path(filename)
-            filename.parent.mkdir(parents=True, exist_ok=True)
-            response = requests.get(url)
-            response.raise_for_status()
-            with open(filename, "wb") as f:
-                f.write(response.content)
+                return filename
+        return None
 
+    def get_session(self):
+        """Return the HTTP session shared by all the downloads of the client.
+
+        The connection pool is sized with :py:attr:`max_workers`
+        so that the parallel downloads reuse their connections.
+
+        Returns
+        -------
+        requests.Session
+            the session used to download the files.
+        """
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def fetch_horizon(self, forecast_horizon):
+        """Download a single forecast horizon, if it is not already in the prefix folder.
+
+        Parameters
+        ----------
+        forecast_horizon : str
+            the forecast horizon to download, one of :py:attr:`forecast_horizons`.
+
+        Returns
+        -------
+        str
+            the filename of the downloaded file.
+        """
+        logger.debug(f"Fetching {forecast_horizon}")
+        url = self.get_url(forecast_horizon=forecast_horizon)
+        filename = self.find_file(forecast_horizon)
+        if filename is not None:
+            return filename
+        if self.subset:
+            try:
+                return self.fetch_subset(forecast_horizon)
+            except (RangeNotSupportedError, ValueError) as e:
+                logger.warning(f"Cannot download a subset of {url} ({e}), downloading the full file")
+        filename = self.get_filename(forecast_horizon, subset=False)
+        stream_to_file(url, filename, session=self.get_session())
+        return filename
+
+    def fetch_subset(self, forecast_horizon):
+        """Download only the GRIB messages of a forecast horizon matching :py:attr:`subset_keys_filters`.
+
+        The headers of the messages are read with HTTP ``Range`` requests of :py:attr:`subset_probe_size` bytes
+        to locate the wanted messages (see :mod:`energy_forecast.grib_index`),
+        then only their byte ranges are downloaded and concatenated.
+        The resulting file is a valid GRIB2 file, readable with :py:meth:`read_files_as_xarray`.
+
+        Parameters
+        ----------
+        forecast_horizon : str
+            the forecast horizon to download, one of :py:attr:`forecast_horizons`.
+
+        Returns
+        -------
+        str
+            the filename of the downloaded file.
+
+        Raises
+        ------
+        RangeNotSupportedError
+            if the server does not support ``Range`` requests.
+        ValueError
+            if the file is not a GRIB2 file or no message matches the filters.
+        """
+        url = self.get_url(forecast_horizon=forecast_horizon)
+        filename = self.get_filename(forecast_horizon, subset=True)
+        session = self.get_session()
+        messages = list(iter_messages(lambda offset, length: read_range(url, offset, length, session=session),
+                                      block_size=self.subset_probe_size))
+        selected = select_messages(messages, self.subset_keys_filters)
+        if not selected:
+            raise ValueError(f"No message of {url} matches the filters")
+        logger.debug(f"{forecast_horizon}: downloading {len(selected)} of {len(messages)} messages")
+        download_ranges(url, merge_ranges(selected), filename, session=session)
+        return filename
+
+    def is_available(self, forecast_horizon):
+        """Check with a ``HEAD`` request if a forecast horizon is published.
+
+        Parameters
+        ----------
+        forecast_horizon : str
+            the forecast horizon to check, one of :py:attr:`forecast_horizons`.
+
+        Returns
+        -------
+        bool
+            True if the file can be downloaded.
+        """
+        response = self.get_session().head(self.get_url(forecast_horizon=forecast_horizon), allow_redirects=True)
+        if response.status_code in [403, 404]:
+            return False
+        response.raise_for_status()
+        return True
+
+    def is_complete(self):
+        """Check, without any network call, if all the forecast horizons are already downloaded.
+
+        Returns
+        -------
+        bool
+            True if the France subset of the run or all the GRIB files are in the prefix folder.
+        """
+        if Path(self.get_cache_filename()).exists():
+            return True
+        return all(self.find_file(forecast_horizon) is not None
+                   for forecast_horizon in self.forecast_horizons)
+
+    def fetch(self, errors="raise", forecast_horizons=None):
+        """Download the data from the API and save it in the prefix folder.
+        All the forecast horizons are downloaded, up to :py:attr:`max_workers` at the same time.
+
+        Each forecast horizon is downloaded independently:
+        a failed horizon does not prevent the others from being saved.
+        The failed horizons are listed in :py:attr:`missing_horizons`.
+
+        Parameters
+        ----------
+        errors : str, optional
+            What to do if a forecast horizon cannot be downloaded.
+            If ``"raise"``, the first error is raised once all the downloads are finished.
+            If ``"ignore"``, the missing files are left out of the returned list.
+            Default is ``"raise"``.
+        forecast_horizons : list[str], optional
+            the forecast horizons to download.
+            Default is None, which downloads all the :py:attr:`forecast_horizons`.
+
+        Returns
+        -------
+        list[str]
+            The list of the files downloaded, ordered as :py:attr:`forecast_horizons`.
+
+        Raises
+        ------
+        Exception
+            the first error of the forecast horizons which could not be downloaded, if ``errors="raise"``,
+            e.g. a :py:class:`requests.exceptions.RequestException` or an :py:class:`OSError`.
+        """
+        if errors not in ["raise", "ignore"]:
+            raise ValueError(f"Unknown errors {errors} : must be in ['raise', 'ignore']")
+        if forecast_horizons is None:
+            forecast_horizons = self.forecast_horizons
+        with use_run(self.prefix, self.get_run()), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {forecast_horizon: executor.submit(self.fetch_horizon, forecast_horizon)
+                       for forecast_horizon in forecast_horizons}
+        list_files = []
+        failures = {}
+        for forecast_horizon, future in futures.items():
+            try:
+                list_files.append(future.result())
+            except Exception as e:
+                logger.warning(f"Could not fetch {forecast_horizon}: {e}")
+                failures[forecast_horizon] = e
+        self.missing_horizons = list(failures)
+        self.evict()
+        if failures and errors == "raise":
+            raise next(iter(failures.values()))
         return list_files
 
+    def evict(self):
+        """Delete the least recently used runs of the prefix folder.
+
+        The runs are deleted until the prefix folder is below :py:attr:`max_prefix_size`
+        and :py:attr:`max_prefix_age`. The run of the client, and the runs used by other processes, are kept.
+        See :func:`energy_forecast.retention.evict`.
+
+        Returns
+        -------
+        list[Path]
+            the deleted files.
+        """
+        return evict(self.prefix,
+                     max_size=self.max_prefix_size,
+                     max_age=self.max_prefix_age,
+                     pinned=[self.get_run()])
+
     @staticmethod
     def read_file_as_xarray(filename, keys_filter):
         """Open the file as an xarray dataset.
 
+        The cfgrib index files are saved in a dedicated directory,
+        see :func:`energy_forecast.grib_index.open_grib`.
+
         Parameters
         ----------
         filename : str
@@ -132,10 +481,7 @@ class ArpegeSimpleAPI():
         xr.Dataset
             the dataset containing the weather forecast data.
         """
-        return xr.open_dataset(filename,
-                               engine="cfgrib",
-                               backend_kwargs={"filter_by_keys": keys_filter},
-                               )
+        return open_grib(filename, keys_filter)
 
     @staticmethod
     def read_files_as_xarray(list_files, keys_filter):
@@ -153,10 +499,39 @@ class ArpegeSimpleAPI():
         xr.Dataset
             the dataset containing the weather forecast data.
         """
-        return xr.open_mfdataset(list_files,
-                                 engine="cfgrib",
-                                 backend_kwargs={"filter_by_keys": keys_filter},
-                                 )        
+        return xr.concat([ArpegeSimpleAPI.read_file_as_xarray(filename, keys_filter) for filename in list_files],
+                         dim="step")
+
+    def get_cache_filename(self):
+        """Format the filename of the France subset of the run, see :py:meth:`read_dataset`."""
+        if self.forecast_horizons == self.run_forecast_horizons.get(self.time, ArpegeSimpleAPI.forecast_horizons):
+            return f"{self.prefix}/{self.get_run()}_france.nc"
+        return f"{self.prefix}/{self.get_run()}_{'_'.join(self.forecast_horizons)}_france.nc"
+
+    def read_dataset(self):
+        """Fetch the data and read the solar radiation, the wind speed and the temperature over France.
+
+        The first time, the GRIB files are decoded only once, for all the fields of :py:data:`KEYS_FILTERS`
+        (see :func:`read_forecast_files`), and the France subset is saved as a compressed NetCDF file
+        (see :py:meth:`get_cache_filename` and :func:`write_france_cache`).
+        Afterwards, only this small file is read, without opening the GRIB files.
+
+        The dataset is kept in memory for the process (see :func:`read_france_cache`).
+        Hence the ``region_*`` and ``departement_*`` methods,
+        and other clients for the same date and time, reuse the same dataset.
+
+        Returns
+        -------
+        xr.Dataset
+            the dataset containing the variables ``ssrd``, ``si10`` and ``t2m``.
+        """
+        cache_filename = self.get_cache_filename()
+        with use_run(self.prefix, self.get_run()):
+            if not Path(cache_filename).exists():
+                list_files = self.fetch()
+                dataset = read_forecast_files(list_files)
+                write_france_cache(dataset, cache_filename)
+            return read_france_cache(cache_filename)
 
     def read_sspd(self):
         """Fetch the data and read the solar radiation.
@@ -166,8 +541,7 @@ class ArpegeSimpleAPI():
         xr.Dataset
             the dataset containing the solar radiation data.
         """
-        list_files = self.fetch()
-        return self.read_files_as_xarray(list_files, KEYS_FILTER_SSPD)
+        return self.read_dataset()[["ssrd"]]
 
     def read_wind(self):
         """Fetch the data and read the wind speed.
@@ -177,8 +551,17 @@ class ArpegeSimpleAPI():
         xr.Dataset
             the dataset containing the wind speed data.
         """
-        list_files = self.fetch()
-        return self.read_files_as_xarray(list_files, KEYS_FILTER_WIND)
+        return self.read_dataset()[["si10"]]
+
+    def read_t2m(self):
+        """Fetch the data and read the temperature at 2 meters.
+
+        Returns
+        -------
+        xr.Dataset
+            the dataset containing the temperature data.
+        """
+        return self.read_dataset()[["t2m"]]
 
     def region_sun(self):
         """Return the mean sun flux for each region of France.
@@ -188,7 +571,7 @@ class ArpegeSimpleAPI():
         pd.DataFrame
             The mean sun flux for each region of France
         """
-        return self.mask_sun(get_mask_regions(), region_names, "region")
+        return self.aggregate_sun(self.get_aggregator("regions"))
     
     def departement_sun(self):
         """Return the mean sun flux for each department of France.
@@ -198,7 +581,7 @@ class ArpegeSimpleAPI():
         pd.DataFrame
             The mean sun flux for each department of France
         """
-        return self.mask_sun(get_mask_departements(), departement_names, "departement")
+        return self.aggregate_sun(self.get_aggregator("departements"))
     
     def region_wind(self):
         """Return the mean wind speed for each region of France.
@@ -208,7 +591,7 @@ class ArpegeSimpleAPI():
         pd.DataFrame
             The mean wind speed for each region of France
         """
-        return self.mask_wind(get_mask_regions(), region_names, "region")
+        return self.aggregate_wind(self.get_aggregator("regions"))
     
     def departement_wind(self):
         """Return the mean wind speed for each department of France.
@@ -218,42 +601,427 @@ class ArpegeSimpleAPI():
         pd.DataFrame
             The mean wind speed for each department of France
         """
-        return self.mask_wind(get_mask_departements(), departement_names, "departement")
+        return self.aggregate_wind(self.get_aggregator("departements"))
     
+    def zones_sun(self):
+        """Return the mean sun flux for each department and each region of France.
+
+        The grid is aggregated once, over the departements,
+        and the regions are derived from the departements (see :func:`energy_forecast.zonal.rollup`).
+        As all the departements are in :py:data:`energy_forecast.constants.departement_names`,
+        the means over the regions are the same as :py:meth:`region_sun`.
+
+        Returns
+        -------
+        tuple[pd.DataFrame, pd.DataFrame]
+            The mean sun flux for each department, and for each region of France.
+        """
+        df_departements = self.departement_sun()
+        return df_departements, rollup(df_departements,
+                                       get_zone_hierarchy(self.read_dataset(), self.zone_weighting),
+                                       "region",
+                                       region_names)
+
+    def zones_wind(self):
+        """Return the mean wind speed for each department and each region of France.
+
+        See :py:meth:`zones_sun`.
+
+        Returns
+        -------
+        tuple[pd.DataFrame, pd.DataFrame]
+            The mean wind speed for each department, and for each region of France.
+        """
+        df_departements = self.departement_wind()
+        return df_departements, rollup(df_departements,
+                                       get_zone_hierarchy(self.read_dataset(), self.zone_weighting),
+                                       "region",
+                                       region_names)
+
+    def capacity_sun(self, type="departements"):
+        """Return the mean sun flux for each region or department of France, weighted by the installed capacity.
+
+        The cells are weighted by the installed capacity of the solar farms
+        (see :py:attr:`capacity_files`), so the features follow the production
+        rather than the area. The weights are precomputed, the cost is the same as :py:meth:`departement_sun`.
+
+        Parameters
+        ----------
+        type : str, optional
+            Either "regions" or "departements".
+            Default is "departements".
+
+        Returns
+        -------
+        pd.DataFrame
+            The mean sun flux for each zone, NaN for the zones without solar farms.
+        """
+        return self.aggregate_sun(self.get_aggregator(type, "capacity", self.capacity_files["sun"]))
+
+    def capacity_wind(self, type="departements"):
+        """Return the mean wind speed for each region or department of France, weighted by the installed capacity.
+
+        See :py:meth:`capacity_sun`.
+
+        Parameters
+        ----------
+        type : str, optional
+            Either "regions" or "departements".
+            Default is "departements".
+
+        Returns
+        -------
+        pd.DataFrame
+            The mean wind speed for each zone, NaN for the zones without wind farms.
+        """
+        return self.aggregate_wind(self.get_aggregator(type, "capacity", self.capacity_files["wind"]))
+
+    def get_aggregator(self, type, weighting=None, capacity=None):
+        """Return the aggregator of the data over the regions or the departements.
+
+        Parameters
+        ----------
+        type : str
+            Either "regions" or "departements".
+        weighting : str, optional
+            the weighting of the cells, see :func:`energy_forecast.geography.get_zone_aggregator`.
+            Default is None, for :py:attr:`zone_weighting`.
+        capacity : str | Path, optional
+            the file of the installed capacity, for the weighting ``"capacity"``.
+
+        Returns
+        -------
+        ZonalAggregator
+            the aggregator for the grid of the data.
+        """
+        weighting = self.zone_weighting if weighting is None else weighting
+        return get_zone_aggregator(type, self.read_dataset(), weighting, capacity)
+
+    def aggregate_sun(self, aggregator):
+        """Compute the mean sun flux for each zone of the aggregator.
+
+        Parameters
+        ----------
+        aggregator : ZonalAggregator
+            the aggregator, see :py:meth:`get_aggregator`.
+
+        Returns
+        -------
+        pd.DataFrame
+            The mean sun flux for each zone.
+        """
+        da_sun = self.read_sspd().ssrd.drop_vars("valid_time")
+        da_flux = deaccumulate(aggregator.mean(da_sun))
+        # the flux of the hour before each step
+        da_flux["step"] = da_flux["step"] - pd.Timedelta("1h")
+        # first step of the runs not starting at the beginning of the forecast, see deaccumulate
+        return to_table(da_flux, aggregator.label).dropna(how="all")
+
+    def aggregate_wind(self, aggregator):
+        """Compute the mean wind speed for each zone of the aggregator.
+
+        Parameters
+        ----------
+        aggregator : ZonalAggregator
+            the aggregator, see :py:meth:`get_aggregator`.
+
+        Returns
+        -------
+        pd.DataFrame
+            The mean wind speed for each zone.
+        """
+        da_wind = self.read_wind().si10
+        df_unstacked = aggregator.mean_table(da_wind)
+        # steps missing for some runs, see ArpegeMultiRunAPI
+        return df_unstacked.dropna(how="all")
+
+    def statistics_wind(self, type="departements", statistics=STATISTICS, quantiles=(0.1, 0.5, 0.9)):
+        """Return statistics of the wind speed over each region or department of France.
+
+        The distribution of the wind speed within a zone, including its extremes,
+        drives the production better than the mean alone.
+        All the statistics are computed in a single pass, see :py:meth:`energy_forecast.zonal.ZonalAggregator.statistics`.
+
+        Parameters
+        ----------
+        type : str, optional
+            Either "regions" or "departements".
+            Default is "departements".
+        statistics : list[str], optional
+            the statistics, among :py:data:`energy_forecast.zonal.STATISTICS`.
+            Default is all of them.
+        quantiles : list[float], optional
+            the approximate quantiles, between 0 and 1.
+            Default is the first decile, the median and the last decile.
+
+        Returns
+        -------
+        pd.DataFrame
+            The statistics of the wind speed, with the columns ``(statistic, zone)``.
+        """
+        da_wind = self.read_wind().si10
+        df_statistics = self.get_aggregator(type).statistics_table(da_wind,
+                                                                   statistics=statistics,
+                                                                   quantiles=quantiles)
+        # steps missing for some runs, see ArpegeMultiRunAPI
+        return df_statistics.dropna(how="all")
+
+    def points_aggregator(self, lon, lat, weights=None, names=None, method="bilinear"):
+        """Return the aggregator interpolating the data at points of interest.
+
+        See :py:meth:`energy_forecast.zonal.ZonalAggregator.from_points` for the parameters.
+        """
+        dataset = self.read_dataset()
+        return ZonalAggregator.from_points(dataset["longitude"].to_numpy(), dataset["latitude"].to_numpy(),
+                                           lon, lat, weights=weights, names=names, method=method)
+
+    def points_sun(self, lon, lat, weights=None, names=None, method="bilinear"):
+        """Return the sun flux at points of interest, e.g. the solar farms.
+
+        Parameters
+        ----------
+        lon, lat : array-like
+            the coordinates of the points.
+        weights : array-like, optional
+            the weight of each point, e.g. the installed capacity.
+            If given, the column ``"weighted_mean"`` is added.
+        names : list[str], optional
+            the names of the points, used as columns.
+        method : str, optional
+            ``"bilinear"`` or ``"nearest"``.
+            Default is ``"bilinear"``.
+
+        Returns
+        -------
+        pd.DataFrame
+            The sun flux at each point, one column per point.
+
+        Examples
+        --------
+        >>> client = ArpegeSimpleAPI()
+        >>> client.points_sun([2.35, 5.37], [48.85, 43.30], weights=[10, 250], names=["Paris", "Marseille"])
+        """
+        return self.aggregate_sun(self.points_aggregator(lon, lat, weights, names, method))
+
+    def points_wind(self, lon, lat, weights=None, names=None, method="bilinear"):
+        """Return the wind speed at points of interest, e.g. the wind farms.
+
+        See :py:meth:`points_sun` for the parameters.
+
+        Returns
+        -------
+        pd.DataFrame
+            The wind speed at each point, one column per point.
+        """
+        return self.aggregate_wind(self.points_aggregator(lon, lat, weights, names, method))
+
     def mask_sun(self, masks, names, label):
         """Compute the mean sun flux for each region of France.
 
+        Each cell is given to the zone of the mask containing its centre.
+
         Returns
         -------
         pd.DataFrame
             The mean sun flux for each region of France.
         """
-        da_sun = self.read_sspd().ssrd
-        df_groups = calculate_mean_group_value(masks, names, label, da_sun, self.min_lon, self.max_lon, self.min_lat, self.max_lat)
-        df_unstacked = df_groups["ssrd"].unstack(label)
-        df_instant_flux = instant_flux_from_cumul(df_unstacked)
-        return df_instant_flux
+        return self.aggregate_sun(ZonalAggregator.from_masks(masks, names, label))
 
-    
-    
     def mask_wind(self, masks, names, label):
         """Compute the mean wind speed for each region of France.
 
+        Each cell is given to the zone of the mask containing its centre.
+
         Returns
         -------
         pd.DataFrame
             The mean wind speed for each region of France.
         """
-        da_wind = self.read_wind().si10
-        df_groups = calculate_mean_group_value(masks, names, label, da_wind, self.min_lon, self.max_lon, self.min_lat, self.max_lat)
-        df_unstacked = df_groups["si10"].unstack(label)
-        return df_unstacked
+        return self.aggregate_wind(ZonalAggregator.from_masks(masks, names, label))
+
 
+class ArpegeMultiRunAPI(ArpegeSimpleAPI):
+    """Fetch and read several successive runs of ARPEGE, incrementally.
 
+    The first run is fetched entirely.
+    For each following run, only the forecast horizons reaching valid times
+    not covered by the previous runs are fetched (see :py:meth:`ArpegeSimpleAPI.new_forecast_horizons`),
+    and the runs adding no valid time are skipped (e.g. the 06Z run, which stops before the 00Z run).
+    As the files already in the prefix folder are not downloaded again,
+    an intraday refresh only downloads the end of the new run.
+
+    The dataset has a ``time`` dimension (the run) in addition to the ``step`` dimension.
+    Hence the ``region_*`` and ``departement_*`` methods return DataFrames
+    indexed by ``(time, valid_time)``.
+
+    Parameters
+    ----------
+    start : str or pd.Timestamp
+        the first run.
+    end : str or pd.Timestamp, optional
+        the last run.
+        Default is None, for the latest available run (see :py:meth:`ArpegeSimpleAPI.latest_run`).
+    **kwargs
+        the other parameters of :class:`ArpegeSimpleAPI`, e.g. ``prefix``.
+
+    Examples
+    --------
+    >>> client = ArpegeMultiRunAPI("2024-06-28 00:00", "2024-06-28 18:00")
+    >>> client.departement_wind()  # indexed by (time, valid_time)
+    """
+
+    def __init__(self, start, end=None, **kwargs):
+        if end is None:
+            end = self.latest_run(**kwargs).run_timestamp
+        run_timestamps = pd.date_range(pd.Timestamp(start).ceil("6h"), pd.Timestamp(end), freq="6h")
+        if len(run_timestamps) == 0:
+            raise ValueError(f"No run between {start} and {end}")
+        self.clients = []
+        for run_timestamp in run_timestamps:
+            client = ArpegeSimpleAPI(date=run_timestamp.strftime("%Y-%m-%d"),
+                                     time=run_timestamp.strftime("%H:%M:%S"),
+                                     **kwargs)
+            if self.clients:
+                forecast_horizons = client.new_forecast_horizons(self.clients[-1])
+                if not forecast_horizons:
+                    logger.debug(f"The run {run_timestamp} adds no valid time, skipping it")
+                    continue
+                client.forecast_horizons = forecast_horizons
+            self.clients.append(client)
+        last = self.clients[-1]
+        super().__init__(date=last.date, time=last.time, **kwargs)
+
+    def fetch(self, errors="raise", forecast_horizons=None):
+        """Download the new forecast horizons of all the runs.
+
+        Parameters
+        ----------
+        errors : str, optional
+            What to do if a forecast horizon cannot be downloaded, see :py:meth:`ArpegeSimpleAPI.fetch`.
+            Default is ``"raise"``.
+        forecast_horizons : None
+            not supported, the forecast horizons are chosen for each run.
+
+        Returns
+        -------
+        list[str]
+            The list of the files downloaded, ordered by run and forecast horizon.
+        """
+        if forecast_horizons is not None:
+            raise ValueError("The forecast horizons cannot be chosen for several runs")
+        list_files = []
+        self.missing_horizons = []
+        for client in self.clients:
+            list_files += client.fetch(errors=errors)
+            self.missing_horizons += [(client.run_timestamp, forecast_horizon)
+                                      for forecast_horizon in client.missing_horizons]
+        return list_files
+
+    def read_dataset(self):
+        """Read the solar radiation, the wind speed and the temperature of all the runs over France.
+
+        Each run is read with :py:meth:`ArpegeSimpleAPI.read_dataset`, so it is decoded and cached once.
+
+        Returns
+        -------
+        xr.Dataset
+            the dataset containing the variables ``ssrd``, ``si10`` and ``t2m``,
+            with the dimensions ``time``, ``step``, ``latitude`` and ``longitude``.
+        """
+        return xr.concat([client.read_dataset() for client in self.clients], dim="time", join="outer")
+
+
+def forecast_horizon_hours(forecast_horizon):
+    """Return the first and the last hours of a forecast horizon, e.g. ``(13, 24)`` for ``"013H024H"``."""
+    return int(forecast_horizon[:3]), int(forecast_horizon[4:7])
+
+
+def read_forecast_files(list_files: list[str]) -> xr.Dataset:
+    """Read the fields of :py:data:`KEYS_FILTERS` in the files, over France, as a single dataset.
+
+    Each file is opened once per field with cfgrib, so each GRIB message is decoded once,
+    cropped to :py:data:`energy_forecast.constants.france_bounds` and loaded in memory.
+    The fields are merged, then the files are concatenated along the ``step`` dimension.
+
+    Parameters
+    ----------
+    list_files : list[str]
+        the files to read, ordered by forecast horizon.
+
+    Returns
+    -------
+    xr.Dataset
+        the dataset containing the variables ``ssrd``, ``si10`` and ``t2m``,
+        with the dimensions ``step``, ``latitude`` and ``longitude``.
+    """
+    datasets = []
+    for filename in list_files:
+        fields = []
+        for keys_filter in KEYS_FILTERS:
+            ds = ArpegeSimpleAPI.read_file_as_xarray(filename, keys_filter)
+            ds = ds.sel(longitude=slice(france_bounds["min_lon"], france_bounds["max_lon"]),
+                        latitude=slice(france_bounds["max_lat"], france_bounds["min_lat"]))
+            # drop the level coordinates, that differ between the fields,
+            # and valid_time, that is recomputed once the fields are merged
+            ds = ds.drop_vars([name for name in ds.coords if name not in ["time", "step", "latitude", "longitude"]])
+            fields.append(ds.load())
+            ds.close()
+        datasets.append(xr.merge(fields, join="outer", compat="override"))
+    dataset = xr.concat(datasets, dim="step")
+    dataset.coords["valid_time"] = dataset.coords["time"] + dataset.coords["step"]
+    return dataset
+
+
+def write_france_cache(dataset: xr.Dataset, filename: str, complevel: int = 4):
+    """Save the France subset of a run as a compressed NetCDF file.
+
+    The variables are chunked by step, so reading a single step (e.g. for a map) reads a single chunk.
+    The file is written to a temporary file, then renamed, so a partially written file is never read.
+
+    Parameters
+    ----------
+    dataset : xr.Dataset
+        the dataset to save, see :func:`read_forecast_files`.
+    filename : str
+        the filename of the NetCDF file.
+    complevel : int, optional
+        the zlib compression level, from 1 to 9.
+        Default is 4.
+    """
+    partial = f"{filename}.part"
+    encoding = {name: {"zlib": True,
+                       "complevel": complevel,
+                       "chunksizes": (1,) + variable.shape[1:]}
+                for name, variable in dataset.data_vars.items()}
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+    dataset.to_netcdf(partial, engine="netcdf4", encoding=encoding)
+    os.replace(partial, filename)
+
+
+@lru_cache(maxsize=8)
+def read_france_cache(filename: str) -> xr.Dataset:
+    """Read the France subset of a run, saved by :func:`write_france_cache`.
+
+    .. note::
+        The function is cached in memory for the process, the key being the filename,
+        i.e. the date and the time of the weather forecast.
+
+    Parameters
+    ----------
+    filename : str
+        the filename of the NetCDF file.
+
+    Returns
+    -------
+    xr.Dataset
+        the dataset containing the variables ``ssrd``, ``si10`` and ``t2m``, loaded in memory.
+    """
+    with xr.open_dataset(filename, engine="netcdf4") as dataset:
+        return dataset.load()
 
 
 @memory.cache
-def get_region_sun(date: str)->pd.DataFrame:
+def get_region_sun(date: str, time: str = "00:00:00")->pd.DataFrame:
     """Retrun the mean sun flux for each hour of the day.
 
     This is a simple wrapper around :py:meth:`ArpegeSimpleAPI.region_sun`.
@@ -269,6 +1037,9 @@ def get_region_sun(date: str)->pd.DataFrame:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -293,11 +1064,11 @@ def get_region_sun(date: str)->pd.DataFrame:
     .. seealso::
         :func:`get_region_wind`
     """
-    sun_data = ArpegeSimpleAPI(date).region_sun()
+    sun_data = ArpegeSimpleAPI(date, time).region_sun()
     return sun_data
 
 @memory.cache
-def get_region_wind(date: str)->pd.DataFrame:
+def get_region_wind(date: str, time: str = "00:00:00")->pd.DataFrame:
     """Retrun the mean wind speed for each hour of the day.
 
     This is a simple wrapper around :py:meth:`ArpegeSimpleAPI.region_wind`.
@@ -313,6 +1084,9 @@ def get_region_wind(date: str)->pd.DataFrame:
         the date at which the weather forecast is requested.
         Must be a valid date format, e.g. ``"YYYY-MM-DD"``
         or a ``datetime.date`` object.
+    time : str, optional
+        the time of the run, see :class:`ArpegeSimpleAPI`.
+        Default is ``"00:00:00"``.
 
     Returns
     -------
@@ -337,12 +1111,23 @@ def get_region_wind(date: str)->pd.DataFrame:
     .. seealso::
         :func:`get_region_sun`
     """
-    sun_data = ArpegeSimpleAPI(date).region_wind()
+    sun_data = ArpegeSimpleAPI(date, time).region_wind()
     return sun_data
 
-def warm_cache(logger, date=None, max_counter=30, sleep_duration=600):
+def warm_cache(logger, date=None, max_counter=30, sleep_duration=600, probe=True, min_sleep_duration=30):
     """Try to fetch the data from the API until it is successful.
 
+    If all the files of the run are already downloaded, the function returns immediately, without any network call.
+
+    With ``probe=True``, the availability of each missing forecast horizon is checked
+    with a cheap ``HEAD`` request (see :py:meth:`ArpegeSimpleAPI.is_available`),
+    and each horizon is downloaded as soon as it is published.
+    The duration between two probes starts at ``min_sleep_duration`` and doubles up to ``sleep_duration``,
+    with a random jitter.
+    The horizons still missing are logged and kept in :py:attr:`ArpegeSimpleAPI.missing_horizons`.
+
+    With ``probe=False``, the whole run is fetched again every ``sleep_duration`` seconds.
+
     Parameters
     ----------
     logger : logging.Logger
@@ -353,10 +1138,22 @@ def warm_cache(logger, date=None, max_counter=30, sleep_duration=600):
         Default is the current date.
     max_counter : int, optional
         the maximum number of attempts.
+        With ``probe=True``, the maximum waiting duration is ``max_counter * sleep_duration``.
         Default is 30.
     sleep_duration : int, optional
         the duration to sleep between each attempt in seconds.
         Default is 600 (10 minutes).
+    probe : bool, optional
+        if True, probe and download the forecast horizons independently.
+        Default is True.
+    min_sleep_duration : int, optional
+        the first duration to sleep between two probes in seconds.
+        Default is 30.
+
+    Returns
+    -------
+    list[str]
+        The list of the files downloaded, ordered as :py:attr:`ArpegeSimpleAPI.forecast_horizons`.
 
     Raises
     ------
@@ -366,19 +1163,57 @@ def warm_cache(logger, date=None, max_counter=30, sleep_duration=600):
     """
     date = date or pd.Timestamp("today").strftime("%Y-%m-%d")
     client = ArpegeSimpleAPI(date)
-    counter=0
+    if client.is_complete():
+        logger.info(f"The run of {date} is already downloaded")
+        return [client.find_file(forecast_horizon) for forecast_horizon in client.forecast_horizons]
+    if not probe:
+        counter=0
+        while True:
+            logger.info(f"Attempt {counter}")
+            try :
+                return client.fetch()
+            except requests.exceptions.RequestException as e:
+                logger.warning(e)
+                logger.info(f"Sleeping for {sleep_duration} seconds")
+                time.sleep(sleep_duration)
+                counter += 1
+                if counter > max_counter:
+                    raise TimeoutError("Max counter reached")
+
+    deadline = time.monotonic() + max_counter * sleep_duration
+    delay = min_sleep_duration
     while True:
-        logger.info(f"Attempt {counter}")
-        try :
-            client.fetch()
-            break
-        except requests.exceptions.HTTPError as e:
-            logger.warning(e)
-            logger.info(f"Sleeping for {sleep_duration} seconds")
-            time.sleep(sleep_duration)
-            counter += 1
-            if counter > max_counter:
-                raise TimeoutError("Max counter reached")
+        missing = [forecast_horizon for forecast_horizon in client.forecast_horizons
+                   if client.find_file(forecast_horizon) is None]
+        available = []
+        for forecast_horizon in missing:
+            try:
+                if client.is_available(forecast_horizon):
+                    available.append(forecast_horizon)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Could not probe {forecast_horizon}: {e}")
+        if available:
+            client.fetch(errors="ignore", forecast_horizons=available)
+            for forecast_horizon in available:
+                if client.find_file(forecast_horizon) is not None:
+                    missing.remove(forecast_horizon)
+                    logger.info(f"Downloaded {forecast_horizon} "
+                                f"({len(client.forecast_horizons) - len(missing)}/{len(client.forecast_horizons)})")
+            delay = min_sleep_duration
+        client.missing_horizons = missing
+        if not missing:
+            return [client.find_file(forecast_horizon) for forecast_horizon in client.forecast_horizons]
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Max counter reached, missing forecast horizons: {missing}")
+        logger.info(f"Missing forecast horizons: {missing}")
+        sleep = delay * random.uniform(0.5, 1)
+        logger.info(f"Sleeping for {sleep:.0f} seconds")
+        time.sleep(sleep)
+        delay = min(2 * delay, sleep_duration)
+
+#: Name of the manifest of the ETags of the historical forecasts, in their folder.
+HISTORICAL_FORECASTS_MANIFEST = "manifest.json"
+
 
 def download_historical_forecasts(s3_key,
                                   s3_secret,
@@ -387,10 +1222,18 @@ def download_historical_forecasts(s3_key,
                                   prefix="./",
                                   variables="all",
                                   forecast_type="all",
-                                  dryrun=False
+                                  dryrun=False,
+                                  max_workers=4,
+                                  transfer_config=None,
                                   ):
     """Download the historical forecasts from the S3 bucket.
 
+    The files are downloaded concurrently, each one in several parts (see ``boto3.s3.transfer.TransferConfig``),
+    to a ``.part`` file renamed once complete.
+    The ETag and the size of each file are saved in a manifest (see :py:data:`HISTORICAL_FORECASTS_MANIFEST`):
+    a local file is downloaded again if its size differs from the remote file (a partial file),
+    or if the ETag of the remote file changed (a new version).
+
     Parameters
     ----------
     s3_key : str
@@ -417,21 +1260,32 @@ def download_historical_forecasts(s3_key,
     dryrun : bool, optional
         if True, do not download the files.
         Default is False.
+    max_workers : int, optional
+        the number of files downloaded at the same time.
+        Default is 4.
+    transfer_config : boto3.s3.transfer.TransferConfig, optional
+        the configuration of the transfer of each file.
+        Default is None, for parts of 8 MB, downloaded by 4 threads.
 
     Returns
     -------
     list[Path]
-        the list of the files downloaded.
+        the list of the files downloaded, or up to date.
+
+    Raises
+    ------
+    botocore.exceptions.ClientError
+        if a file could not be downloaded, once all the other files are downloaded.
     """
     import boto3
+    from boto3.s3.transfer import TransferConfig
 
     session = boto3.Session(
         aws_access_key_id=s3_key,
         aws_secret_access_key=s3_secret,
     )
     s3 = session.resource("s3", endpoint_url=s3_entrypoint)
-    bucket = s3.Bucket(s3_bucket)
-    list_files = []
+    client = s3.meta.client
     key_prefix = "weather_forecasts"
     if variables == "all":
         variables = ["wind_speed_hourly",
@@ -451,32 +1305,84 @@ def download_historical_forecasts(s3_key,
     for forecast in forecast_type:
         if forecast not in ["d0", "d1", "d2", "d3"]:
             raise ValueError(f"Unknown forecast type {forecast} : must be in ['d0', 'd1', 'd2', 'd3']")
-    
-    for var in variables:
-        for forecast in forecast_type:
-            key = f"{key_prefix}/{var}_{forecast}.nc"
-            # test if the key exists
-            filename = Path(prefix + "/" + key)
-            if filename.exists():
-                print(f"{filename} already downloaded, skipping")
-                continue
-            filename.parent.mkdir(parents=True, exist_ok=True)
-            if dryrun:
-                print(f"DRY RUN : would Download {key} to {filename}")
-                # test if the key exists without downloading it
-                try : 
-                    s3.Object(s3_bucket, key).load()
-                except Exception as e:
-                    print(e)
-                
-            else:
-                bucket.download_file(key, filename)
-            list_files.append(filename)
+    if transfer_config is None:
+        transfer_config = TransferConfig(multipart_threshold=8 * 1024**2,
+                                         multipart_chunksize=8 * 1024**2,
+                                         max_concurrency=4)
+
+    folder = Path(prefix) / key_prefix
+    manifest_file = folder / HISTORICAL_FORECASTS_MANIFEST
+    manifest = json.loads(manifest_file.read_text()) if manifest_file.exists() else {}
+    keys = [f"{key_prefix}/{var}_{forecast}.nc" for var in variables for forecast in forecast_type]
+    transferred = {"bytes": 0}
+    lock = threading.Lock()
+
+    def count_bytes(n_bytes):
+        with lock:
+            transferred["bytes"] += n_bytes
+
+    def download(key):
+        filename = Path(prefix) / key
+        head = client.head_object(Bucket=s3_bucket, Key=key)
+        etag, size = head["ETag"], head["ContentLength"]
+        if filename.exists() and filename.stat().st_size == size:
+            # the files downloaded before the manifest are checked by their size only
+            if manifest.get(key, {}).get("etag", etag) == etag:
+                return filename, "up to date", etag, size
+        if dryrun:
+            logger.info(f"DRY RUN : would download {key} to {filename}")
+            return filename, "dry run", etag, size
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        partial = partial_filename(filename)
+        client.download_file(s3_bucket, key, str(partial), Config=transfer_config, Callback=count_bytes)
+        downloaded_size = partial.stat().st_size
+        if downloaded_size != size:
+            partial.unlink()
+            raise IncompleteDownloadError(f"{key} : downloaded {downloaded_size} bytes, expected {size}")
+        os.replace(partial, filename)
+        return filename, "downloaded", etag, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(download, key) for key in keys}
+    list_files = []
+    statuses = {}
+    failures = {}
+    for key, future in futures.items():
+        try:
+            filename, status, etag, size = future.result()
+        except Exception as e:
+            logger.warning(f"Could not download {key}: {e}")
+            statuses[key] = "failed"
+            failures[key] = e
+            continue
+        statuses[key] = status
+        if status == "dry run":
+            continue
+        list_files.append(filename)
+        manifest[key] = {"etag": etag, "size": size}
+    if not dryrun:
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp_file = manifest_file.with_suffix(f".{os.getpid()}.part")
+        tmp_file.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(tmp_file, manifest_file)
+
+    duration = time.perf_counter() - start
+    counts = pd.Series(statuses, dtype=object).value_counts().to_dict()
+    megabytes = transferred["bytes"] / 1024**2
+    logger.info(f"Historical forecasts: {counts}, {megabytes:.1f} MB in {duration:.1f} s "
+                f"({megabytes / max(duration, 1e-9):.1f} MB/s)")
+    if failures:
+        raise next(iter(failures.values()))
     return list_files
 
+
 def calculate_mean_group_value(masks, names, label, da_value, min_lon, max_lon, min_lat, max_lat):
         """Group the data by the masks and calculate the mean value for each group.
 
+        The means are computed with a sparse weight matrix, built once per mask,
+        see :class:`energy_forecast.zonal.ZonalAggregator`.
+
         Parameters
         ----------
         masks : xr.DataArray
@@ -494,31 +1400,83 @@ def calculate_mean_group_value(masks, names, label, da_value, min_lon, max_lon,
         -------
         pd.DataFrame
             The mean value for each group.
+
+        See Also
+        --------
+        calculate_zonal_mean : the same means, as a wide table.
         """
-        was_valid_time = "valid_time" in da_value.coords
-        if was_valid_time:
+        if "valid_time" in da_value.coords:
             # remove the valid_time dimension
             # as it can be recomputed from the time and step
-            # and it breaks the groupby
-            da_value = da_value.drop("valid_time")
-            
+            da_value = da_value.drop_vars("valid_time")
         da_france = da_value.sel(
         longitude=slice(min_lon, max_lon), latitude=slice(max_lat, min_lat)
         )
-        try :
-            da_groups = da_france.groupby(masks).mean(["latitude", "longitude"])
-        except ValueError:
-            da_groups = da_france.groupby(masks).mean("stacked_longitude_latitude")
-        # relabel the regions groups
-        da_groups["group"] = names
-        # change the name of the groups
-        da_groups = da_groups.rename(group=label)
+        aggregator = ZonalAggregator.from_masks(masks, names, label)
+        da_groups = aggregator.mean(da_france)
         da_groups.coords["valid_time"] = da_value.coords["time"] + da_value.coords["step"]
         df_groups = da_groups.to_dataframe()
         df_groups = df_groups.set_index("valid_time", append=True)
         df_groups = df_groups.droplevel("step")
         return df_groups
 
+
+def calculate_zonal_mean(masks, names, label, da_value):
+    """Calculate the mean value of the data for each zone of the masks.
+
+    Parameters
+    ----------
+    masks : xr.DataArray
+        the index of the zone of each cell, see :func:`energy_forecast.geography.get_mask`.
+    names : list[str]
+        the names of the zones.
+    label : str
+        the name of the columns axis, e.g. ``"region"``.
+    da_value : xr.DataArray
+        the data, with the dimensions ``step``, ``latitude``, ``longitude``
+        and optionally ``time``.
+
+    Returns
+    -------
+    pd.DataFrame
+        one column per zone, indexed by ``valid_time``,
+        or by ``(time, valid_time)`` for several runs.
+    """
+    return ZonalAggregator.from_masks(masks, names, label).mean_table(da_value)
+
+
+def deaccumulate(da_cumul, dim="step"):
+    """Compute the flux of each step from the flux accumulated since the start of the run.
+
+    The differences are computed with numpy along ``dim``, for all the runs and zones at once.
+    The first step is accumulated since the start of the run if it is at most 1 hour,
+    otherwise (for a run not fetched from the beginning, see :class:`ArpegeMultiRunAPI`) it is NaN.
+
+    As the means over the zones are linear, the flux can be de-accumulated after the aggregation.
+
+    Parameters
+    ----------
+    da_cumul : xr.DataArray
+        the accumulated flux, e.g. with the dimensions ``(time, step, region)``.
+    dim : str, optional
+        the dimension of the accumulation.
+        Default is ``"step"``.
+
+    Returns
+    -------
+    xr.DataArray
+        the flux accumulated over each step, with the same coordinates.
+    """
+    axis = da_cumul.get_axis_num(dim)
+    values = da_cumul.to_numpy()
+    first = np.take(values, [0], axis=axis)
+    if da_cumul[dim].to_numpy()[0] <= np.timedelta64(1, "h"):
+        prepend = np.zeros_like(first)
+    else:
+        prepend = np.full_like(first, np.nan)
+    return da_cumul.copy(data=np.diff(values, axis=axis, prepend=prepend))
+
+
 def instant_flux_from_cumul(df_unstacked):
     """Compute the instant flux from the cumulated flux.
     
@@ -538,41 +1496,52 @@ def instant_flux_from_cumul(df_unstacked):
     
     Notes
     -----
-    The function changes a lot if the index is a MultiIndex or not.
-    Maybe it should be split into two functions ?
+    With a MultiIndex, the runs are differenced independently.
+    The first step of a run that does not start at the beginning of the forecast
+    (see :class:`ArpegeMultiRunAPI`) cannot be differenced, and is dropped.
+
+    The rows are sorted once and differenced with numpy.
+    For the arrays of the zonal aggregation, see :func:`deaccumulate`.
     """
-    
     if isinstance(df_unstacked.index, pd.MultiIndex):
-        times = df_unstacked.index.get_level_values('time').unique()
-        zero_pad = pd.DataFrame(data=0,
-                                index=pd.MultiIndex.from_arrays([times,
-                                                                 times],
-                                                                names=['time', 'valid_time']),
-                                columns=df_unstacked.columns
-        )
+        times = df_unstacked.index.get_level_values("time").to_numpy()
+        valid_times = df_unstacked.index.get_level_values("valid_time").to_numpy()
+        order = np.lexsort((valid_times, times))
+        times, valid_times = times[order], valid_times[order]
+        new_run = np.r_[True, times[1:] != times[:-1]]
+        starts_at_beginning = valid_times - times <= np.timedelta64(1, "h")
     else:
-        zero_pad = df_unstacked.iloc[0].copy().to_frame().T
-        zero_pad.index = zero_pad.index - pd.Timedelta("1h")
-        zero_pad[:] = 0
-    
-    df_unstacked = pd.concat([zero_pad, df_unstacked], axis=0)
+        valid_times = df_unstacked.index.to_numpy()
+        order = np.argsort(valid_times, kind="stable")
+        valid_times = valid_times[order]
+        new_run = np.zeros(len(valid_times), dtype=bool)
+        new_run[:1] = True
+        starts_at_beginning = new_run
+    values = df_unstacked.to_numpy(dtype=float)[order]
+    flux = np.diff(values, axis=0, prepend=np.zeros((1, values.shape[1])))
+    flux[new_run] = np.where(starts_at_beginning[new_run, np.newaxis], values[new_run], np.nan)
+
+    valid_times = valid_times - np.timedelta64(1, "h")
     if isinstance(df_unstacked.index, pd.MultiIndex):
-        df_unstacked = df_unstacked.sort_index(level=["time", "valid_time"])
+        index = pd.MultiIndex.from_arrays([times, valid_times], names=["time", "valid_time"])
     else:
-        df_unstacked = df_unstacked.sort_index()
-    df_instant_flux = df_unstacked.diff().dropna()
-    if isinstance(df_instant_flux.index, pd.MultiIndex):
-        df_instant_flux.index = df_instant_flux.index.set_levels(df_instant_flux.index.levels[1] - pd.Timedelta("1h"),
-                                                                 level=1
-        )
-    else:
-        df_instant_flux.index -= pd.Timedelta("1h")
-    return df_instant_flux
+        index = pd.DatetimeIndex(valid_times, name=df_unstacked.index.name)
+    df_instant_flux = pd.DataFrame(flux, index=index, columns=df_unstacked.columns)
+    return df_instant_flux.dropna()
+
+
+#: Template of the url of the daily observations of Météo-France, per departement.
+OBSERVATIONS_URL_TEMPLATE = "https://object.files.data.gouv.fr/meteofrance/data/synchro_ftp/BASE/QUOT/Q_{DEP_ID:0>2}_{file_type}.csv.gz"
+#: Name of the manifest of the validators of the observation files, in their folder.
+OBSERVATIONS_MANIFEST = "manifest.json"
 
 
 def download_observations(url, filename):
     """Download the observations from the url and save it in the filename.
 
+    The file is streamed to the disk and replaced atomically,
+    see :func:`energy_forecast.download.stream_to_file`.
+
     Parameters
     ----------
     url : str
@@ -580,68 +1549,213 @@ def download_observations(url, filename):
     filename : str
         the filename to save the data.
     """
-    response = requests.get(url)
-    response.raise_for_status()
-    with open(filename, "wb") as f:
-        f.write(response.content)
+    stream_to_file(url, filename)
 
-def download_observations_all_departments(cache_duration="12h",
-                                          file_type="latest-2023-2024_RR-T-Vent",
-                                          verbose=False):
-    """Download the temperature for each department of France."""
-    url_template = "https://object.files.data.gouv.fr/meteofrance/data/synchro_ftp/BASE/QUOT/Q_{DEP_ID:0>2}_{file_type}.csv.gz"
-    list_files = []
-    download_root = ROOT_DIR / "data/bronze/observations"
+def _observations_filename(download_root, dep_id, file_type):
+    return download_root / "Q_{DEP_ID:0>2}_{file_type}.csv.gz".format(DEP_ID=dep_id, file_type=file_type)
+
+
+def read_observations_manifest(download_root):
+    """Read the manifest of the observation files of a folder, see :func:`fetch_observations`.
+
+    Parameters
+    ----------
+    download_root : Path
+        the folder of the files.
+
+    Returns
+    -------
+    dict[str, dict]
+        the validators and the time of the last check of each file, by name of file.
+        Empty if there is no manifest.
+    """
+    manifest_file = Path(download_root) / OBSERVATIONS_MANIFEST
+    if not manifest_file.exists():
+        return {}
+    try:
+        return json.loads(manifest_file.read_text())
+    except json.JSONDecodeError:
+        logger.warning(f"Ignoring the corrupted manifest {manifest_file}")
+        return {}
+
+
+def fetch_observations(cache_duration="12h",
+                       file_type="latest-2023-2024_RR-T-Vent",
+                       url_template=OBSERVATIONS_URL_TEMPLATE,
+                       download_root=None,
+                       max_workers=8,
+                       dep_ids=range(1, 96)):
+    """Refresh the observation files of the departements, in parallel, with conditional requests.
+
+    The ``ETag`` and ``Last-Modified`` headers of each file are saved in a manifest
+    (see :py:data:`OBSERVATIONS_MANIFEST`), and sent back in the ``If-None-Match`` and ``If-Modified-Since``
+    headers of the next request (see :func:`energy_forecast.download.conditional_download`).
+    A file that did not change upstream costs a ``304 Not Modified`` response without a body.
+
+    Parameters
+    ----------
+    cache_duration : str, optional
+        the files checked less than ``cache_duration`` ago are not requested at all.
+        Default is ``"12h"``.
+    file_type : str, optional
+        the type of the files, as in the name of the files of Météo-France.
+        Default is ``"latest-2023-2024_RR-T-Vent"``.
+    url_template : str, optional
+        the template of the url of the files.
+        Default is :py:data:`OBSERVATIONS_URL_TEMPLATE`.
+    download_root : Path, optional
+        the folder of the files.
+        Default is ``data/bronze/observations`` in the project.
+    max_workers : int, optional
+        the maximum number of parallel requests.
+        Default is 8.
+    dep_ids : list[int], optional
+        the numbers of the departements.
+        Default is 1 to 95.
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by the number of the departement, with the columns ``"filename"``, ``"status"``
+        (``"fresh"`` if not requested, ``"not_modified"``, ``"downloaded"`` or ``"failed"``),
+        ``"etag"``, ``"last_modified"`` and ``"error"``.
+    """
+    download_root = Path(download_root or ROOT_DIR / "data/bronze/observations")
     download_root.mkdir(parents=True, exist_ok=True)
-    now = pd.Timestamp("now")
-    for dep_id in range(1, 96):
+    manifest = read_observations_manifest(download_root)
+    now = pd.Timestamp("now", tz="UTC")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    def refresh(dep_id):
+        filename = _observations_filename(download_root, dep_id, file_type)
+        entry = manifest.get(filename.name, {})
+        if filename.exists() and "checked" in entry:
+            if now - pd.Timestamp(entry["checked"]) < pd.Timedelta(cache_duration):
+                return {**entry, "status": "fresh"}
         url = url_template.format(DEP_ID=dep_id, file_type=file_type)
-        filename = download_root / "Q_{DEP_ID:0>2}_{file_type}.csv.gz".format(DEP_ID=dep_id, file_type=file_type)
         try:
-            if filename.exists():
-                modification_time = pd.Timestamp(filename.stat().st_mtime, unit="s")
-                if now - modification_time < pd.Timedelta(cache_duration):
-                    list_files.append(filename)
-                    continue
-            if verbose:
-                logger.info(f"Downloading {url} to {filename}")
-            download_observations(url, filename)
-            list_files.append(filename)
-        except requests.exceptions.HTTPError:
-            logger.warning(f"Could not download {url}")
-    return list_files
+            result = conditional_download(url, filename, entry.get("etag"), entry.get("last_modified"), session=session)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not download {url}: {e}")
+            return {**entry, "status": "failed", "error": str(e)}
+        return {**result, "url": url, "checked": now.isoformat()}
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(dep_ids, executor.map(refresh, dep_ids)))
+
+    for dep_id, result in results.items():
+        if result["status"] != "failed":
+            manifest[_observations_filename(download_root, dep_id, file_type).name] = {
+                key: result.get(key) for key in ["url", "etag", "last_modified", "checked"]}
+    manifest_file = download_root / OBSERVATIONS_MANIFEST
+    tmp_file = manifest_file.with_suffix(f".{os.getpid()}.part")
+    tmp_file.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp_file, manifest_file)
+
+    df_status = pd.DataFrame({dep_id: {"filename": _observations_filename(download_root, dep_id, file_type),
+                                       **result}
+                              for dep_id, result in results.items()}).T
+    df_status = df_status.reindex(columns=["filename", "status", "etag", "last_modified", "error"])
+    df_status.index.name = "departement"
+    logger.info(f"Observations: {df_status['status'].value_counts().to_dict()}")
+    return df_status
 
-def aggregates_observations(list_files, cut_before="2022-01-01", verbose=False):
+
+def download_observations_all_departments(cache_duration="12h",
+                                          file_type="latest-2023-2024_RR-T-Vent",
+                                          verbose=False,
+                                          url_template=OBSERVATIONS_URL_TEMPLATE,
+                                          download_root=None,
+                                          max_workers=8):
+    """Download the temperature for each department of France.
+
+    The files are refreshed in parallel, with conditional requests, see :func:`fetch_observations`.
+
+    Parameters
+    ----------
+    cache_duration : str, optional
+        the files checked less than ``cache_duration`` ago are not requested again.
+        Default is ``"12h"``.
+    file_type : str, optional
+        the type of the files, as in the name of the files of Météo-France.
+        Default is ``"latest-2023-2024_RR-T-Vent"``.
+    verbose : bool, optional
+        if True, log the status of each file.
+    url_template : str, optional
+        the template of the url of the files.
+        Default is :py:data:`OBSERVATIONS_URL_TEMPLATE`.
+    download_root : Path, optional
+        the folder of the files.
+        Default is ``data/bronze/observations`` in the project.
+    max_workers : int, optional
+        the maximum number of parallel requests.
+        Default is 8.
+
+    Returns
+    -------
+    list[Path]
+        the list of the files available, including the files that could not be refreshed.
+    """
+    df_status = fetch_observations(cache_duration=cache_duration,
+                                   file_type=file_type,
+                                   url_template=url_template,
+                                   download_root=download_root,
+                                   max_workers=max_workers)
+    if verbose:
+        for filename, status in zip(df_status["filename"], df_status["status"]):
+            logger.info(f"{filename.name}: {status}")
+    return [filename for filename in df_status["filename"] if filename.exists()]
+
+def aggregates_observations(list_files, cut_before="2022-01-01", verbose=False, max_workers=None, store=None,
+                            weights=None):
     """Aggregate the observations for each department of France.
 
+    The mean temperature of each departement is the mean over its stations
+    (see :func:`energy_forecast.observations.departement_temperatures`),
+    and the mean temperature of France is the weighted mean over the departements
+    (see :func:`energy_forecast.observations.national_temperature`).
+    The files are parsed once, in parallel, see :func:`energy_forecast.observations.read_observations`,
+    or only the new days of each station are appended to a store, see :class:`energy_forecast.observations.ObservationStore`.
+
     Parameters
     ----------
     list_files : list[str]
         the list of the files to aggregate.
+    cut_before : str, optional
+        the first day kept.
+        Default is ``"2022-01-01"``.
+    verbose : bool, optional
+        if True, log the number of observations read.
+    max_workers : int, optional
+        the number of processes parsing the new files.
+        Default is None, for the number of processors.
+    store : ObservationStore, optional
+        the store of the observations, updated with the files.
+        Default is None, to read the files.
+    weights : pd.Series, optional
+        the weight of each departement, e.g. its population,
+        see :func:`energy_forecast.geography.load_departement_weights`.
+        Default is None, for the same weight for all the departements.
 
     Returns
     -------
-    pd.DataFrame
-        the DataFrame containing the observations for each department.
+    pd.Series
+        the mean temperature of France for each day.
     """
-    all_deps = []
-    for i, file_name in enumerate(list_files):
-        if verbose:
-            logger.info(f"Reading {file_name} ({i+1}/{len(list_files)})")
-        tem_df = pd.read_csv(file_name, sep=";", usecols=["AAAAMMJJ", "TM"], compression="gzip", date_format="%Y%m%d", parse_dates=["AAAAMMJJ"])
-        
-        tem_df = (tem_df.set_index("AAAAMMJJ")
-                  .dropna(subset=["TM"])
-                  .sort_index()
-        )
-        tem_df = (tem_df
-                  .groupby(tem_df.index).mean()
-                  
-        )[cut_before:]
-        all_deps.append(tem_df)
-        
-    return pd.concat(all_deps, axis=1).mean(axis=1)
-        
+    if store is None:
+        df_observations = read_observations(list_files, max_workers=max_workers, start=cut_before)
+    else:
+        store.ingest(list_files, max_workers=max_workers)
+        df_observations = store.query(start=cut_before, departements=[departement_of(filename) for filename in list_files])
+    if verbose:
+        logger.info(f"Read {len(df_observations)} observations from {len(list_files)} files")
+    return national_temperature(departement_temperatures(df_observations), weights)
+
+
 if __name__ == "__main__":
     logger.info("Fetching data for today")
     warm_cache(logger)
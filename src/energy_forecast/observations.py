@@ -0,0 +1,434 @@
+"""Implements the parsing of the daily observations of Météo-France.
+
+The observations are published as one gzip CSV file per departement
+(see :func:`energy_forecast.meteo.fetch_observations`), with dozens of columns per station and per day.
+Only the station, the day and the mean temperature are kept:
+each file is parsed once, with the CSV reader of ``pyarrow``, and saved as a Parquet file
+named after the hash of the source file (see :func:`energy_forecast.grib_index.content_hash`),
+so a file is parsed again only when its content changes.
+The files to parse are spread over a pool of processes.
+"""
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import csv
+
+from energy_forecast import ROOT_DIR
+from energy_forecast.grib_index import content_hash
+
+logger = logging.getLogger(__name__)
+
+#: Directory of the parsed observation files, see :func:`read_observations`.
+OBSERVATIONS_CACHE_DIR = ROOT_DIR / "data" / "silver" / "observations_cache"
+
+#: Directory of the store of the observations, see :class:`ObservationStore`.
+OBSERVATIONS_STORE_DIR = ROOT_DIR / "data" / "silver" / "observations_store"
+
+#: Columns kept from the observation files, with their new names.
+OBSERVATION_COLUMNS = {"NUM_POSTE": "station", "AAAAMMJJ": "date", "TM": "temperature"}
+#: Types of the columns kept from the observation files.
+OBSERVATION_TYPES = {"NUM_POSTE": pa.int64(), "AAAAMMJJ": pa.timestamp("s"), "TM": pa.float64()}
+
+
+def departement_of(filename: str | Path) -> str:
+    """Return the departement of an observation file, e.g. ``"01"`` for ``Q_01_latest-2023-2024_RR-T-Vent.csv.gz``.
+
+    Raises
+    ------
+    ValueError
+        If the name of the file does not follow the pattern of Météo-France.
+    """
+    match = re.match(r"Q_(\w+?)_", Path(filename).name)
+    if match is None:
+        raise ValueError(f"{filename} is not an observation file of Météo-France")
+    return match.group(1)
+
+
+def read_observations_table(filename: str | Path) -> pa.Table:
+    """Parse an observation file of Météo-France with the CSV reader of ``pyarrow``.
+
+    Only the columns of :py:data:`OBSERVATION_COLUMNS` are converted, and the gzip is decompressed by ``pyarrow``.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the gzip CSV file.
+
+    Returns
+    -------
+    pa.Table
+        the columns ``"station"``, ``"date"``, ``"temperature"`` (the mean temperature of the day, in °C)
+        and ``"departement"``, without the days missing a temperature.
+    """
+    table = csv.read_csv(filename,
+                         parse_options=csv.ParseOptions(delimiter=";"),
+                         convert_options=csv.ConvertOptions(include_columns=list(OBSERVATION_COLUMNS),
+                                                            column_types=OBSERVATION_TYPES,
+                                                            timestamp_parsers=["%Y%m%d"]))
+    table = table.rename_columns([OBSERVATION_COLUMNS[name] for name in table.column_names])
+    table = table.filter(pc.is_valid(table["temperature"]))
+    departement = pa.DictionaryArray.from_arrays(pa.array(np.zeros(len(table), dtype="int32")),
+                                                 pa.array([departement_of(filename)]))
+    return table.append_column("departement", departement)
+
+
+def parse_observations(filename: str | Path) -> pd.DataFrame:
+    """Parse an observation file of Météo-France.
+
+    Parameters
+    ----------
+    filename : str | Path
+        the gzip CSV file.
+
+    Returns
+    -------
+    pd.DataFrame
+        the columns of :func:`read_observations_table`.
+    """
+    return read_observations_table(filename).to_pandas()
+
+
+def _cache_stem(filename: str | Path) -> str:
+    return Path(filename).name.removesuffix(".gz").removesuffix(".csv")
+
+
+def cache_filename(filename: str | Path, cache_dir: str | Path | None = None) -> Path:
+    """Return the Parquet file of an observation file, named after its content."""
+    return Path(cache_dir or OBSERVATIONS_CACHE_DIR) / f"{_cache_stem(filename)}_{content_hash(filename)[:16]}.parquet"
+
+
+def _parse_to_cache(filename: Path, cache_file: Path) -> Path:
+    """Parse the observation file and save it in the cache, atomically."""
+    table = read_observations_table(filename)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.part")
+    pq.write_table(table, tmp_file)
+    os.replace(tmp_file, cache_file)
+    # the previous versions of the file
+    stem = _cache_stem(filename)
+    for stale in cache_file.parent.glob(f"{stem}_*.parquet"):
+        if stale != cache_file and stale.name.removesuffix(".parquet").rsplit("_", 1)[0] == stem:
+            stale.unlink(missing_ok=True)
+    return cache_file
+
+
+def read_observations(list_files: list[str | Path],
+                      cache_dir: str | Path | None = None,
+                      max_workers: int | None = None,
+                      start: str | pd.Timestamp | None = None) -> pd.DataFrame:
+    """Read the observation files, parsing only the files that are new or changed.
+
+    Parameters
+    ----------
+    list_files : list[str | Path]
+        the gzip CSV files, see :func:`energy_forecast.meteo.download_observations_all_departments`.
+    cache_dir : str | Path, optional
+        the directory of the parsed files.
+        Default is :py:data:`OBSERVATIONS_CACHE_DIR`.
+    max_workers : int, optional
+        the number of processes parsing the files.
+        Default is None, for the number of processors.
+    start : str | pd.Timestamp, optional
+        the first day read, the previous days are skipped when reading the Parquet files.
+        Default is None, for all the days.
+
+    Returns
+    -------
+    pd.DataFrame
+        the observations of all the files, with the columns of :func:`read_observations_table`.
+    """
+    cache_dir = Path(cache_dir or OBSERVATIONS_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_files = [cache_filename(filename, cache_dir) for filename in list_files]
+    to_parse = [(Path(filename), cache_file) for filename, cache_file in zip(list_files, cache_files)
+                if not cache_file.exists()]
+    if len(to_parse) > 1:
+        logger.info(f"Parsing {len(to_parse)} observation files")
+        with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count(), len(to_parse))) as executor:
+            list(executor.map(_parse_to_cache, *zip(*to_parse)))
+    elif to_parse:
+        _parse_to_cache(*to_parse[0])
+    if not cache_files:
+        return pd.DataFrame(columns=[*OBSERVATION_COLUMNS.values(), "departement"])
+    filters = None if start is None else [("date", ">=", pd.Timestamp(start).to_pydatetime())]
+    return pq.read_table(cache_files, filters=filters).to_pandas()
+
+
+def _ingest_tail(filename: Path,
+                 last_dates: dict[str, str],
+                 default_last_date: str | None,
+                 partition_dir: Path) -> tuple[int, dict[str, str]]:
+    """Append the observations of the file after the last date of their station to the partition.
+
+    The stations missing from ``last_dates`` are filtered with ``default_last_date``, if any.
+    Return the number of rows appended and the last date of each station of the file.
+    """
+    table = read_observations_table(filename).drop_columns(["departement"])
+    new_last_dates = table.group_by("station").aggregate([("date", "max")])
+    new_last_dates = {str(station): pd.Timestamp(date).isoformat()
+                      for station, date in zip(new_last_dates["station"].to_pylist(),
+                                               new_last_dates["date_max"].to_pylist())}
+    if last_dates or default_last_date is not None:
+        stations = pa.array([int(station) for station in last_dates], pa.int64())
+        dates = pa.array([pd.Timestamp(date).to_pydatetime() for date in last_dates.values()], pa.timestamp("s"))
+        thresholds = pc.take(dates, pc.index_in(table["station"], value_set=stations))
+        if default_last_date is not None:
+            thresholds = pc.fill_null(thresholds, pa.scalar(pd.Timestamp(default_last_date).to_pydatetime(),
+                                                            pa.timestamp("s")))
+        table = table.filter(pc.fill_null(pc.greater(table["date"], thresholds), True))
+    if not len(table):
+        return 0, new_last_dates
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    # named after the last day and the time of the ingestion, as late rows may end on a day already ingested
+    part_file = partition_dir / f"part-{pd.Timestamp(pc.max(table['date']).as_py()):%Y%m%d}-{time.time_ns():x}.parquet"
+    # ignored by the readers until it is complete
+    tmp_file = partition_dir / f"_{part_file.name}.{os.getpid()}.part"
+    pq.write_table(table.sort_by([("date", "ascending"), ("station", "ascending")]), tmp_file)
+    os.replace(tmp_file, part_file)
+    return len(table), new_last_dates
+
+
+class ObservationStore:
+    """An append-only store of the daily observations, partitioned by departement.
+
+    The observations of each departement are Parquet files in the folder ``departement={departement}``,
+    one file per ingestion. The last day ingested of each station and the hash of the last source file
+    of each departement are saved in ``_state.json``.
+    An ingestion skips the files that did not change, and appends only the days after the last day ingested
+    of each station, so the rows already in the store are never converted or written again,
+    and a station publishing its observations later than the others is not missed.
+    The gzip files are still decompressed entirely, as the rows of a file are sorted by station.
+
+    The corrections of the days already ingested are not added.
+    Call :py:meth:`rebuild` to ingest the files from scratch.
+
+    Parameters
+    ----------
+    root : str | Path, optional
+        the folder of the store.
+        Default is :py:data:`OBSERVATIONS_STORE_DIR`.
+
+    Examples
+    --------
+    >>> store = ObservationStore()
+    >>> store.ingest(download_observations_all_departments())
+    >>> store.query(start="2024-01-01", departements=["75", "13"])
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root or OBSERVATIONS_STORE_DIR)
+
+    @property
+    def state_file(self) -> Path:
+        """The file of the last days ingested and of the hash of the source file of each departement."""
+        return self.root / "_state.json"
+
+    def read_state(self) -> dict[str, dict]:
+        """Return the last day ingested of the departement and of its stations, and the hash of the source file, by departement."""
+        if not self.state_file.exists():
+            return {}
+        return json.loads(self.state_file.read_text())
+
+    def _write_state(self, state: dict[str, dict]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_suffix(f".{os.getpid()}.part")
+        tmp_file.write_text(json.dumps(state, indent=1, sort_keys=True))
+        os.replace(tmp_file, self.state_file)
+
+    @property
+    def last_dates(self) -> pd.Series:
+        """The last day ingested of each departement."""
+        state = self.read_state()
+        return pd.Series({departement: pd.Timestamp(entry["last_date"]) for departement, entry in state.items()},
+                         dtype="datetime64[ns]", name="last_date").rename_axis("departement").sort_index()
+
+    def partition_dir(self, departement: str) -> Path:
+        """Return the folder of the observations of a departement."""
+        return self.root / f"departement={departement}"
+
+    def ingest(self, list_files: list[str | Path], max_workers: int | None = None) -> pd.Series:
+        """Append the new observations of the files to the store.
+
+        Parameters
+        ----------
+        list_files : list[str | Path]
+            the gzip CSV files, see :func:`energy_forecast.meteo.download_observations_all_departments`.
+        max_workers : int, optional
+            the number of processes parsing the files.
+            Default is None, for the number of processors.
+
+        Returns
+        -------
+        pd.Series
+            the number of rows appended for each departement of the files.
+        """
+        state = self.read_state()
+        to_ingest = {}
+        for filename in map(Path, list_files):
+            departement = departement_of(filename)
+            source_hash = content_hash(filename)
+            entry = state.get(departement, {})
+            if entry.get("source_hash") != source_hash:
+                # the states written before the last days of the stations were tracked
+                default_last_date = None if "stations" in entry else entry.get("last_date")
+                to_ingest[departement] = (filename, entry.get("stations", {}), default_last_date,
+                                          self.partition_dir(departement), source_hash)
+
+        rows = pd.Series(0, index=pd.Index([departement_of(filename) for filename in list_files], name="departement"),
+                         name="rows")
+        if not to_ingest:
+            return rows
+        arguments = [argument[:4] for argument in to_ingest.values()]
+        if len(to_ingest) > 1:
+            with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count(), len(to_ingest))) as executor:
+                results = list(executor.map(_ingest_tail, *zip(*arguments)))
+        else:
+            results = [_ingest_tail(*arguments[0])]
+        for (departement, argument), (n_rows, new_last_dates) in zip(to_ingest.items(), results):
+            rows[departement] = n_rows
+            last_dates = {**argument[1], **new_last_dates}
+            state[departement] = {**state.get(departement, {}), "source_hash": argument[-1], "stations": last_dates}
+            if last_dates:
+                state[departement]["last_date"] = max(last_dates.values())
+        self._write_state(state)
+        logger.info(f"Ingested {rows.sum()} observations from {len(to_ingest)} files")
+        return rows
+
+    def rebuild(self, list_files: list[str | Path], max_workers: int | None = None) -> pd.Series:
+        """Delete the store and ingest the files from scratch, see :py:meth:`ingest`."""
+        for part_file in self.root.glob("departement=*/*.parquet"):
+            part_file.unlink()
+        self.state_file.unlink(missing_ok=True)
+        return self.ingest(list_files, max_workers=max_workers)
+
+    def compact(self):
+        """Merge the files of each departement into a single file, sorted by day."""
+        for partition_dir in self.root.glob("departement=*"):
+            part_files = sorted(partition_dir.glob("part-*.parquet"))
+            if len(part_files) < 2:
+                continue
+            table = pq.read_table(part_files, partitioning=None).sort_by([("date", "ascending"), ("station", "ascending")])
+            compacted = partition_dir / part_files[-1].name
+            tmp_file = partition_dir / f"_{compacted.name}.{os.getpid()}.part"
+            pq.write_table(table, tmp_file)
+            # replace first, so an interruption leaves duplicated rows rather than lost ones
+            os.replace(tmp_file, compacted)
+            for part_file in part_files[:-1]:
+                part_file.unlink()
+
+    def query(self,
+              start: str | pd.Timestamp | None = None,
+              end: str | pd.Timestamp | None = None,
+              departements: list[str] | None = None) -> pd.DataFrame:
+        """Return the observations of a range of days.
+
+        The filters are applied by ``pyarrow`` while reading the Parquet files,
+        the files of the other departements are not read.
+
+        Parameters
+        ----------
+        start, end : str | pd.Timestamp, optional
+            the first and the last days, included.
+            Default is None, for no limit.
+        departements : list[str], optional
+            the departements, e.g. ``["01", "2A"]``.
+            Default is None, for all the departements.
+
+        Returns
+        -------
+        pd.DataFrame
+            the columns ``"station"``, ``"date"``, ``"temperature"`` and ``"departement"``,
+            as :func:`read_observations`.
+        """
+        columns = [*OBSERVATION_COLUMNS.values(), "departement"]
+        if not any(self.root.glob("departement=*/*.parquet")):
+            return pd.DataFrame(columns=columns)
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", pd.Timestamp(start).to_pydatetime()))
+        if end is not None:
+            filters.append(("date", "<=", pd.Timestamp(end).to_pydatetime()))
+        if departements is not None:
+            filters.append(("departement", "in", list(departements)))
+        partitioning = ds.partitioning(pa.schema([("departement", pa.string())]), flavor="hive")
+        dataset = ds.dataset(self.root, format="parquet", partitioning=partitioning)
+        expression = pq.filters_to_expression(filters) if filters else None
+        df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        df["departement"] = df["departement"].astype("category")
+        return df
+
+
+def departement_temperatures(df_observations: pd.DataFrame) -> pd.DataFrame:
+    """Return the mean temperature of each departement for each day, the mean over its stations.
+
+    The means of all the days and departements are computed at once,
+    with a single ``np.bincount`` over the codes of the pairs ``(day, departement)``.
+
+    Parameters
+    ----------
+    df_observations : pd.DataFrame
+        the observations, see :func:`read_observations` or :py:meth:`ObservationStore.query`.
+
+    Returns
+    -------
+    pd.DataFrame
+        the ``(day, departement)`` matrix of the mean temperatures, NaN for the days without observation.
+    """
+    day_numbers = df_observations["date"].to_numpy().astype("datetime64[D]").astype("int64")
+    first_day = day_numbers.min(initial=0)
+    n_days = day_numbers.max(initial=-1) - first_day + 1
+    departements = df_observations["departement"].astype("category").cat
+    departement_codes = departements.codes.to_numpy().astype("int64")
+    departements = np.asarray(departements.categories, dtype=str)
+    codes = (day_numbers - first_day) * len(departements) + departement_codes
+    size = n_days * len(departements)
+    sums = np.bincount(codes, weights=df_observations["temperature"].to_numpy(), minlength=size)
+    counts = np.bincount(codes, minlength=size).reshape(n_days, len(departements))
+    with np.errstate(invalid="ignore"):
+        means = sums.reshape(n_days, len(departements)) / counts
+    days = np.arange(first_day, first_day + n_days).astype("datetime64[D]")
+    observed_days, observed_departements = counts.any(axis=1), counts.any(axis=0)
+    df_departements = pd.DataFrame(means[np.ix_(observed_days, observed_departements)],
+                                   index=pd.DatetimeIndex(days[observed_days], name="date"),
+                                   columns=pd.Index(departements[observed_departements], name="departement"))
+    return df_departements.sort_index(axis=1)
+
+
+def national_temperature(df_departements: pd.DataFrame, weights: pd.Series | None = None) -> pd.Series:
+    """Return the mean temperature of France for each day, the weighted mean over the departements.
+
+    The departements without observation on a day are left out of the mean of the day.
+
+    Parameters
+    ----------
+    df_departements : pd.DataFrame
+        the mean temperatures of the departements, see :func:`departement_temperatures`.
+    weights : pd.Series, optional
+        the weight of each departement, e.g. its population, see :func:`energy_forecast.geography.load_departement_weights`.
+        The departements without weight are left out.
+        Default is None, for the same weight for all the departements.
+
+    Returns
+    -------
+    pd.Series
+        the mean temperature of France for each day.
+    """
+    if weights is None:
+        return df_departements.mean(axis=1).rename("temperature")
+    weights = weights.reindex(df_departements.columns).fillna(0.).to_numpy()
+    values = df_departements.to_numpy()
+    observed = ~np.isnan(values)
+    total_weights = observed @ weights
+    with np.errstate(invalid="ignore"):
+        means = np.where(observed, values, 0.) @ weights / total_weights
+    return pd.Series(means, index=df_departements.index, name="temperature")
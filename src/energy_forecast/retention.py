@@ -0,0 +1,254 @@
+"""Implements the retention of the weather forecast files downloaded in the prefix folder.
+
+The files of :class:`energy_forecast.meteo.ArpegeSimpleAPI` are grouped by run
+(the date and the time of the weather forecast) and evicted run by run,
+the least recently used first, until the prefix folder satisfies a maximum size and a maximum age.
+
+A run being read or downloaded is pinned with :func:`use_run`, and is never evicted.
+
+Usage
+-----
+The eviction runs automatically after :py:meth:`energy_forecast.meteo.ArpegeSimpleAPI.fetch`.
+It can also be run as a maintenance command::
+
+    python -m energy_forecast.retention --prefix /tmp/arpege --max-size 5GB --max-age 7D
+
+"""
+import argparse
+import fcntl
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from energy_forecast.grib_index import CFGRIB_INDEX_DIR, remove_index
+
+logger = logging.getLogger(__name__)
+
+#: Regular expression extracting the run from the name of a file.
+RUN_PATTERN = re.compile(r"^(arpege_\w+?_\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2})_")
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+def parse_size(size: int | str) -> int:
+    """Convert a size like ``"500MB"`` or ``"5GB"`` to a number of bytes."""
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B)\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Unknown size {size} : must be a number followed by one of {list(_SIZE_UNITS)}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def get_run(filename: str | Path) -> str | None:
+    """Return the run of a file of the prefix folder, e.g. ``"arpege_01_2024-06-28_00:00:00"``."""
+    match = RUN_PATTERN.match(Path(filename).name)
+    return match.group(1) if match else None
+
+
+def _lock_filename(prefix: str | Path, run: str) -> Path:
+    return Path(prefix) / ".locks" / f"{run}.lock"
+
+
+@contextmanager
+def use_run(prefix: str | Path, run: str):
+    """Pin a run while it is used, so that it is not evicted by another process.
+
+    The run is pinned with a shared lock, released when the context exits or the process dies.
+    The last access time of the run is updated.
+    The lock file is deleted with the run by :func:`evict`: if it is deleted while waiting for the lock,
+    the new lock file is locked instead.
+
+    Parameters
+    ----------
+    prefix : str | Path
+        the prefix folder.
+    run : str
+        the run to pin, see :func:`get_run`.
+    """
+    lock_filename = _lock_filename(prefix, run)
+    while True:
+        lock_filename.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(lock_filename, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            if os.stat(lock_filename).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+    with lock_file:
+        try:
+            touch_run(prefix, run)
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def touch_run(prefix: str | Path, run: str):
+    """Set the last access time of the files of a run to now.
+
+    The access time is set explicitly, as most file systems do not update it on each read.
+    """
+    now = time.time()
+    for filename in Path(prefix).glob(f"{run}_*"):
+        try:
+            os.utime(filename, (now, filename.stat().st_mtime))
+        except FileNotFoundError:
+            pass
+
+
+def _lock_run(prefix: str | Path, run: str):
+    """Lock a run exclusively, or return None if it is pinned by :func:`use_run`."""
+    lock_filename = _lock_filename(prefix, run)
+    lock_filename.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_filename, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.stat(lock_filename).st_ino != os.fstat(lock_file.fileno()).st_ino:
+            # the lock file was deleted by another eviction in the meantime
+            raise BlockingIOError
+    except (BlockingIOError, FileNotFoundError):
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def list_runs(prefix: str | Path) -> pd.DataFrame:
+    """List the runs of the prefix folder.
+
+    Parameters
+    ----------
+    prefix : str | Path
+        the prefix folder.
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per run, indexed by the run, sorted from the least to the most recently used,
+        with the columns ``"size"`` (in bytes), ``"last_access"`` and ``"files"``.
+    """
+    runs: dict[str, dict] = {}
+    prefix = Path(prefix)
+    if prefix.exists():
+        for filename in prefix.iterdir():
+            run = get_run(filename)
+            if run is None or not filename.is_file():
+                continue
+            stat = filename.stat()
+            info = runs.setdefault(run, {"size": 0, "last_access": 0., "files": []})
+            info["size"] += stat.st_size
+            info["last_access"] = max(info["last_access"], stat.st_atime, stat.st_mtime)
+            info["files"].append(filename)
+    df_runs = pd.DataFrame.from_dict(runs, orient="index", columns=["size", "last_access", "files"])
+    df_runs["last_access"] = pd.to_datetime(df_runs["last_access"], unit="s")
+    return df_runs.sort_values("last_access")
+
+
+def evict(prefix: str | Path,
+          max_size: int | str | None = None,
+          max_age: str | pd.Timedelta | None = None,
+          pinned: list[str] | tuple[str, ...] = (),
+          dryrun: bool = False,
+          index_dir: str | Path = CFGRIB_INDEX_DIR) -> list[Path]:
+    """Delete the least recently used runs of the prefix folder.
+
+    The runs not used for more than ``max_age`` are deleted,
+    then the least recently used runs are deleted until the total size is below ``max_size``.
+    The runs listed in ``pinned``, or pinned by any process with :func:`use_run`, are kept.
+    The cfgrib index files of the deleted GRIB files are deleted too (see :func:`energy_forecast.grib_index.remove_index`),
+    as well as the lock files of the deleted runs and of the runs without any file.
+
+    Parameters
+    ----------
+    prefix : str | Path
+        the prefix folder.
+    max_size : int | str, optional
+        the maximum size of the prefix folder, in bytes or as a string like ``"5GB"``.
+        Default is None, for no size limit.
+    max_age : str | pd.Timedelta, optional
+        the maximum duration since the last access of a run, e.g. ``"7D"``.
+        Default is None, for no age limit.
+    pinned : list[str], optional
+        the runs to keep, see :func:`get_run`.
+    dryrun : bool, optional
+        if True, do not delete the files.
+        Default is False.
+    index_dir : str | Path, optional
+        the directory of the cfgrib index files.
+        Default is :py:data:`energy_forecast.grib_index.CFGRIB_INDEX_DIR`.
+
+    Returns
+    -------
+    list[Path]
+        the deleted files.
+    """
+    df_runs = list_runs(prefix)
+    total_size = df_runs["size"].sum()
+    max_size = None if max_size is None else parse_size(max_size)
+    oldest_access = None if max_age is None else pd.Timestamp("now") - pd.Timedelta(max_age)
+    deleted: list[Path] = []
+    for run, info in df_runs.iterrows():
+        too_old = oldest_access is not None and info["last_access"] < oldest_access
+        too_large = max_size is not None and total_size > max_size
+        if not (too_old or too_large):
+            continue
+        lock_file = None if run in pinned else _lock_run(prefix, run)
+        if lock_file is None:
+            logger.debug(f"Keeping {run}, in use")
+            continue
+        with lock_file:
+            logger.info(f"Evicting {run} ({info['size'] / 1024**2:.0f} MB, "
+                        f"last used {info['last_access']:%Y-%m-%d %H:%M})")
+            for filename in info["files"]:
+                if not dryrun:
+                    if filename.suffix == ".grib2":
+                        try:
+                            remove_index(filename, index_dir)
+                        except FileNotFoundError:
+                            pass
+                    filename.unlink(missing_ok=True)
+                deleted.append(filename)
+            if not dryrun:
+                _lock_filename(prefix, run).unlink(missing_ok=True)
+        total_size -= info["size"]
+    if not dryrun:
+        _remove_orphan_locks(prefix, keep=set(df_runs.index) | set(pinned))
+    return deleted
+
+
+def _remove_orphan_locks(prefix: str | Path, keep: set[str]):
+    """Delete the lock files of the runs without any file (e.g. after a failed download) which are not in use."""
+    lock_dir = Path(prefix) / ".locks"
+    if not lock_dir.exists():
+        return
+    for lock_filename in lock_dir.glob("*.lock"):
+        run = lock_filename.stem
+        if run in keep:
+            continue
+        lock_file = _lock_run(prefix, run)
+        if lock_file is not None:
+            with lock_file:
+                lock_filename.unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evict the least recently used weather forecast runs.")
+    parser.add_argument("--prefix", default="/tmp/arpege", help="the prefix folder (default: /tmp/arpege)")
+    parser.add_argument("--max-size", default=None, help="the maximum size of the prefix folder, e.g. 5GB")
+    parser.add_argument("--max-age", default=None, help="the maximum duration since the last access, e.g. 7D")
+    parser.add_argument("--dryrun", action="store_true", help="only list the files to delete")
+    args = parser.parse_args()
+    deleted = evict(args.prefix, max_size=args.max_size, max_age=args.max_age, dryrun=args.dryrun)
+    for filename in deleted:
+        print(f"{'DRY RUN : would delete' if args.dryrun else 'Deleted'} {filename}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
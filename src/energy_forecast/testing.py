@@ -0,0 +1,395 @@
+"""Implements a local stand-in for the object stores used to fetch the weather data, for the tests and the benchmarks.
+
+:class:`LocalObjectStore` is an HTTP server, running in a thread, that serves synthetic files
+with the same paths as the real servers:
+
+- the ARPEGE GRIB2 files of ``object.data.gouv.fr`` (see :class:`energy_forecast.meteo.ArpegeSimpleAPI`),
+- the observation CSV.gz files of ``object.files.data.gouv.fr``
+  (see :func:`energy_forecast.meteo.download_observations_all_departments`),
+- any file added with :py:meth:`LocalObjectStore.add_file`, e.g. the NetCDF files
+  of an S3 bucket (path-style ``/{bucket}/{key}``, see :func:`energy_forecast.meteo.download_historical_forecasts`).
+
+The server supports ``HEAD``, ``Range``, ``If-Range``, ``If-None-Match`` and ``If-Modified-Since`` requests,
+and can inject latency and failures, so the download code can be tested and benchmarked offline.
+
+Examples
+--------
+>>> with LocalObjectStore(latency=0.05, missing=["097H102H"]) as store:
+...     client = ArpegeSimpleAPI("2024-06-28", prefix="/tmp/arpege_local")
+...     client.base_url = store.arpege_url
+...     client.fetch(errors="ignore")
+"""
+import gzip
+import hashlib
+import http.server
+import io
+import random
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+#: Fields of the synthetic ARPEGE files: the ones used in the project, and other fields of the SP1 package.
+SYNTHETIC_FIELDS = ["t2m", "si10", "ssrd", "2r", "10u", "10v", "2d", "prmsl", "tp", "tcc", "sp", "lcc"]
+
+_GRIB_PATH = re.compile(r"/meteofrance-pnt/pnt/(?P<date>[\d-]+)T(?P<time>[\d:]+)Z/arpege/(?P<resolution>\w+)/SP1/"
+                        r"arpege__\w+__SP1__(?P<forecast>\d{3}H\d{3}H)__.*\.grib2")
+_OBSERVATIONS_PATH = re.compile(r"/meteofrance/data/synchro_ftp/BASE/QUOT/Q_(?P<dep_id>\d+)_(?P<file_type>.+)\.csv\.gz")
+
+
+def synthetic_grib(date: str, time: str, forecast_horizon: str, ni: int = 741, nj: int = 521,
+                   fields: list[str] = SYNTHETIC_FIELDS, seed: int = 0) -> bytes:
+    """Build a synthetic ARPEGE GRIB2 file for a forecast horizon.
+
+    The default grid is the grid of ARPEGE 0.1° (-32° to 42° of longitude, 72° to 20° of latitude),
+    so the files have a realistic size and can be aggregated with the masks of France.
+
+    Parameters
+    ----------
+    date : str
+        the date of the run, ``"YYYY-MM-DD"``.
+    time : str
+        the time of the run, ``"HH:MM:SS"``.
+    forecast_horizon : str
+        the forecast horizon, e.g. ``"013H024H"``.
+    ni, nj : int, optional
+        the number of longitudes and latitudes. Default is the ARPEGE 0.1° grid.
+    fields : list[str], optional
+        the fields of each step. Default is :py:data:`SYNTHETIC_FIELDS`.
+    seed : int, optional
+        the seed of the random values.
+
+    Returns
+    -------
+    bytes
+        the content of the GRIB2 file.
+    """
+    import eccodes
+
+    short_names = {"t2m": "2t", "si10": "10si"}
+    first, last = int(forecast_horizon[:3]), int(forecast_horizon[4:7])
+    rng = np.random.default_rng(seed)
+    output = io.BytesIO()
+    for step in range(first, last + 1):
+        for field in fields:
+            gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+            try:
+                eccodes.codes_set(gid, "centre", 85)
+                eccodes.codes_set(gid, "dataDate", int(date.replace("-", "")))
+                eccodes.codes_set(gid, "dataTime", int(time[:2]) * 100)
+                eccodes.codes_set(gid, "Ni", ni)
+                eccodes.codes_set(gid, "Nj", nj)
+                eccodes.codes_set(gid, "latitudeOfFirstGridPointInDegrees", 72.0)
+                eccodes.codes_set(gid, "longitudeOfFirstGridPointInDegrees", -32.0)
+                eccodes.codes_set(gid, "latitudeOfLastGridPointInDegrees", 72.0 - (nj - 1) * 0.1)
+                eccodes.codes_set(gid, "longitudeOfLastGridPointInDegrees", -32.0 + (ni - 1) * 0.1)
+                eccodes.codes_set(gid, "iDirectionIncrementInDegrees", 0.1)
+                eccodes.codes_set(gid, "jDirectionIncrementInDegrees", 0.1)
+                if field in ["ssrd", "tp"]:
+                    # accumulated since the start of the run
+                    eccodes.codes_set(gid, "productDefinitionTemplateNumber", 8)
+                    eccodes.codes_set_string(gid, "shortName", field)
+                    eccodes.codes_set(gid, "forecastTime", 0)
+                    eccodes.codes_set(gid, "lengthOfTimeRange", step)
+                    values = step * 3.6e5 * rng.random(ni * nj)
+                else:
+                    eccodes.codes_set_string(gid, "shortName", short_names.get(field, field))
+                    eccodes.codes_set(gid, "forecastTime", step)
+                    values = 10 * rng.random(ni * nj)
+                eccodes.codes_set(gid, "bitsPerValue", 16)
+                eccodes.codes_set_values(gid, values)
+                output.write(eccodes.codes_get_message(gid))
+            finally:
+                eccodes.codes_release(gid)
+    return output.getvalue()
+
+
+def synthetic_observations(dep_id: int, start: str = "2023-01-01", end: str | None = None,
+                           n_stations: int = 40, seed: int = 0) -> bytes:
+    """Build a synthetic daily observation file of Météo-France, compressed with gzip.
+
+    Parameters
+    ----------
+    dep_id : int
+        the number of the departement.
+    start, end : str, optional
+        the first and last days. Default is from 2023-01-01 to today.
+    n_stations : int, optional
+        the number of stations of the departement.
+    seed : int, optional
+        the seed of the random values.
+
+    Returns
+    -------
+    bytes
+        the content of the CSV.gz file.
+    """
+    rng = np.random.default_rng(seed + dep_id)
+    days = pd.date_range(start, end or pd.Timestamp("today").normalize(), freq="D")
+    stations = dep_id * 1000000 + np.arange(n_stations)
+    n_rows = len(days) * n_stations
+    temperature = 12 - 8 * np.cos(2 * np.pi * days.dayofyear.to_numpy() / 365)
+    df = pd.DataFrame({
+        "NUM_POSTE": np.repeat(stations, len(days)),
+        "NOM_USUEL": np.repeat([f"STATION {station}" for station in stations], len(days)),
+        "LAT": np.repeat(rng.uniform(42, 51, n_stations), len(days)).round(6),
+        "LON": np.repeat(rng.uniform(-4, 8, n_stations), len(days)).round(6),
+        "ALTI": np.repeat(rng.integers(0, 2000, n_stations), len(days)),
+        "AAAAMMJJ": np.tile(days.strftime("%Y%m%d"), n_stations),
+        "RR": rng.exponential(2, n_rows).round(1),
+        "QRR": 1,
+        "TN": (np.tile(temperature, n_stations) - 5 + rng.normal(0, 2, n_rows)).round(1),
+        "QTN": 1,
+        "TX": (np.tile(temperature, n_stations) + 5 + rng.normal(0, 2, n_rows)).round(1),
+        "QTX": 1,
+        "TM": (np.tile(temperature, n_stations) + rng.normal(0, 2, n_rows)).round(1),
+        "QTM": 1,
+        "FFM": rng.gamma(2, 2, n_rows).round(1),
+        "QFFM": 1,
+    })
+    # some stations do not measure the mean temperature
+    df.loc[rng.random(n_rows) < 0.1, "TM"] = np.nan
+    return gzip.compress(df.to_csv(sep=";", index=False).encode(), compresslevel=6, mtime=0)
+
+
+class LocalObjectStore:
+    """A local HTTP server serving synthetic weather files, with configurable latency and failures.
+
+    Parameters
+    ----------
+    latency : float, optional
+        the delay before each response, in seconds.
+        Default is 0.
+    failure_rate : float, optional
+        the probability of answering a request with a ``503`` error.
+        Default is 0.
+    truncate_rate : float, optional
+        the probability of closing the connection in the middle of a ``GET`` response.
+        Default is 0.
+    short_rate : float, optional
+        the probability of answering a ``GET`` request with only the first half of the file,
+        with a consistent ``Content-Length``, as a server serving a stale copy.
+        Default is 0.
+    missing : list[str], optional
+        the requests whose path contains one of these strings are answered with a ``404`` error,
+        e.g. ``["097H102H"]`` for a forecast horizon not yet published.
+    accept_ranges : bool, optional
+        if False, the ``Range`` requests are answered with the full file, as a server without range support.
+        Default is True.
+    grib_kwargs : dict, optional
+        the parameters of :func:`synthetic_grib`, e.g. a smaller grid.
+    observations_kwargs : dict, optional
+        the parameters of :func:`synthetic_observations`.
+    seed : int, optional
+        the seed of the injected failures.
+
+    Attributes
+    ----------
+    stats : dict[str, int]
+        the number of requests, of ``GET`` requests, of failures, and the number of bytes sent.
+    """
+
+    def __init__(self,
+                 latency: float = 0.,
+                 failure_rate: float = 0.,
+                 truncate_rate: float = 0.,
+                 short_rate: float = 0.,
+                 missing: list[str] | None = None,
+                 accept_ranges: bool = True,
+                 grib_kwargs: dict | None = None,
+                 observations_kwargs: dict | None = None,
+                 seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.truncate_rate = truncate_rate
+        self.short_rate = short_rate
+        self.missing = list(missing or [])
+        self.accept_ranges = accept_ranges
+        self.grib_kwargs = grib_kwargs or {}
+        self.observations_kwargs = observations_kwargs or {}
+        self.files: dict[str, bytes] = {}
+        self._etags: dict[str, str] = {}
+        self.last_modified = time.time()
+        self.stats = {"requests": 0, "get": 0, "head": 0, "failures": 0, "not_modified": 0, "bytes": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: http.server.ThreadingHTTPServer | None = None
+        self._get_grib = lru_cache(maxsize=32)(self._build_grib)
+        self._get_observations = lru_cache(maxsize=128)(self._build_observations)
+
+    @property
+    def url(self) -> str:
+        """The root url of the server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def arpege_url(self) -> str:
+        """The template of the ARPEGE files, to use as :py:attr:`ArpegeSimpleAPI.base_url`."""
+        return (self.url + "/meteofrance-pnt/pnt/{date}T{time}Z/arpege/01/SP1/"
+                "arpege__{resolution}__SP1__{forecast}__{date}T{time}Z.grib2")
+
+    @property
+    def observations_url(self) -> str:
+        """The template of the observation files, see :func:`download_observations_all_departments`."""
+        return self.url + "/meteofrance/data/synchro_ftp/BASE/QUOT/Q_{DEP_ID:0>2}_{file_type}.csv.gz"
+
+    def add_file(self, path: str, content: bytes):
+        """Serve a static file, e.g. ``add_file("/bucket/weather_forecasts/file.nc", content)``."""
+        path = "/" + path.lstrip("/")
+        self.files[path] = content
+        self._etags.pop(path, None)
+
+    def touch(self):
+        """Mark all the files as modified now, for the conditional requests."""
+        self.last_modified = time.time() + 1
+
+    def reset_stats(self):
+        """Set all the counters of :py:attr:`stats` to 0."""
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def start(self):
+        """Start the server in a background thread, on a free port of localhost."""
+        handler = type("Handler", (_Handler,), {"store": self})
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _build_grib(self, date, time, forecast_horizon):
+        return synthetic_grib(date, time, forecast_horizon, **self.grib_kwargs)
+
+    def _build_observations(self, dep_id, file_type):
+        return synthetic_observations(dep_id, **self.observations_kwargs)
+
+    def get_content(self, path: str) -> bytes | None:
+        """Return the content served at the path, or None if there is no such file."""
+        if path in self.files:
+            return self.files[path]
+        match = _GRIB_PATH.fullmatch(path)
+        if match:
+            return self._get_grib(match["date"], match["time"], match["forecast"])
+        match = _OBSERVATIONS_PATH.fullmatch(path)
+        if match:
+            return self._get_observations(int(match["dep_id"]), match["file_type"])
+        return None
+
+    def get_etag(self, path: str, content: bytes) -> str:
+        """Return the ETag of the content served at the path, hashed once."""
+        if path not in self._etags:
+            self._etags[path] = '"' + hashlib.md5(content).hexdigest() + '"'
+        return self._etags[path]
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _draw(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store: LocalObjectStore
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _send_empty(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _respond(self, send_body):
+        store = self.store
+        store._count("requests")
+        store._count("get" if send_body else "head")
+        if store.latency:
+            time.sleep(store.latency)
+        path = self.path.split("?")[0]
+        if any(missing in path for missing in store.missing):
+            return self._send_empty(404)
+        if store._draw(store.failure_rate):
+            store._count("failures")
+            return self._send_empty(503)
+        content = store.get_content(path)
+        if content is None:
+            return self._send_empty(404)
+
+        etag = store.get_etag(path, content)
+        last_modified = formatdate(store.last_modified, usegmt=True)
+        headers = {"ETag": etag, "Last-Modified": last_modified,
+                   "Accept-Ranges": "bytes" if store.accept_ranges else "none"}
+        if self._not_modified(etag, store.last_modified):
+            store._count("not_modified")
+            return self._send_empty(304, headers)
+
+        start, end, status = 0, len(content), 200
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if byte_range and store.accept_ranges and (if_range is None or if_range in [etag, last_modified]):
+            first, last = byte_range.removeprefix("bytes=").split("-")
+            start = int(first)
+            end = min(int(last) + 1, len(content)) if last else len(content)
+            if start >= len(content):
+                return self._send_empty(416, {"Content-Range": f"bytes */{len(content)}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(content)}"
+
+        body = content[start:end]
+        if send_body and store._draw(store.short_rate):
+            store._count("failures")
+            body = body[:len(body) // 2]
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not send_body:
+            return
+        if store._draw(store.truncate_rate):
+            store._count("failures")
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+        store._count("bytes", len(body))
+
+    def _not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
@@ -0,0 +1,512 @@
+"""Implements the zonal statistics of the weather data, over the regions or the departements of France.
+
+The mean over each zone is a linear operation on the cells of the grid:
+with a sparse weight matrix ``W`` of shape ``(cells, zones)``, where ``W[i, j] = a_ij / A_j``
+with ``a_ij`` the weight of the cell ``i`` in the zone ``j`` (1 if the cell is in the zone with a mask,
+or the covered area, see :func:`energy_forecast.geography.get_coverage`) and ``A_j`` the total weight of the zone,
+the means of all the zones for all the ``(time, step)`` slices are a single matrix product
+``values @ W``, with ``values`` of shape ``(slices, cells)``.
+
+The matrix is built once per grid and mask (see :py:meth:`ZonalAggregator.from_masks`),
+which is much faster than ``xarray.DataArray.groupby`` on the mask for every dataset.
+
+The means over larger zones made of smaller ones (the regions, made of departements)
+are the weighted means of the means over the smaller zones, see :func:`rollup`.
+
+Other statistics (minimum, maximum, standard deviation, approximate quantiles)
+are computed in a single pass over the cells of each zone, see :py:meth:`ZonalAggregator.statistics`.
+
+The values at points of interest are computed the same way,
+with the interpolation weights of each point, see :py:meth:`ZonalAggregator.from_points`.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import sparse
+
+
+#: The statistics of :py:meth:`ZonalAggregator.statistics`, in addition to the quantiles.
+STATISTICS = ("mean", "min", "max", "std")
+
+
+class ZonalAggregator:
+    """Compute the mean of gridded data over zones, with a sparse weight matrix.
+
+    Parameters
+    ----------
+    masks : xr.DataArray
+        the index of the zone of each cell, NaN outside of all the zones.
+        Must have the dimensions ``longitude`` and ``latitude``,
+        see :func:`energy_forecast.geography.get_mask`.
+    names : list[str]
+        the names of the zones, in the order of the indexes of the mask.
+    label : str, optional
+        the name of the dimension of the zones in the results, e.g. ``"region"``.
+        Default is ``"zone"``.
+
+    Attributes
+    ----------
+    coverage : scipy.sparse.csr_array
+        the ``(cells, zones)`` weight of each cell in each zone,
+        the cells being ordered as the flattened ``(latitude, longitude)`` grid.
+        With a mask, the weight is 1 for the cells of the zone.
+    weights : scipy.sparse.csr_array
+        the ``(cells, zones)`` weight matrix of the means, the coverage normalized by zone.
+    totals : np.ndarray
+        the total weight of each zone, i.e. the number of cells with a mask.
+
+    Examples
+    --------
+    >>> aggregator = ZonalAggregator.from_masks(get_mask_regions(), region_names, "region")
+    >>> da_regions = aggregator.mean(dataset["si10"])
+    """
+
+    _cache: dict[tuple, "ZonalAggregator"] = {}
+
+    def __init__(self, masks: xr.DataArray, names: list[str], label: str = "zone"):
+        masks = masks.transpose("latitude", "longitude")
+        codes = masks.to_numpy().ravel()
+        cells = np.flatnonzero(~np.isnan(codes))
+        zones = codes[cells].astype(int)
+        if len(zones) and (zones.min() < 0 or zones.max() >= len(names)):
+            raise ValueError(f"The mask contains indexes outside of the {len(names)} names")
+        coverage = sparse.csr_array((np.ones(len(cells)), (cells, zones)), shape=(codes.size, len(names)))
+        self._set_coverage(coverage, masks["longitude"].to_numpy(), masks["latitude"].to_numpy(), names, label)
+
+    def _set_coverage(self, coverage, longitude, latitude, names, label):
+        self.names = list(names)
+        self.label = label
+        self.longitude = np.asarray(longitude)
+        self.latitude = np.asarray(latitude)
+        if coverage.shape != (len(self.latitude) * len(self.longitude), len(self.names)):
+            raise ValueError(f"The coverage of shape {coverage.shape} does not match the grid and the names")
+        self.coverage = sparse.csr_array(coverage)
+        self.totals = np.asarray(self.coverage.sum(axis=0)).ravel()
+        with np.errstate(divide="ignore"):
+            inverse_totals = np.where(self.totals > 0, 1 / self.totals, 0.)
+        self.weights = sparse.csr_array(self.coverage * inverse_totals[np.newaxis, :])
+        # the cells of each zone, contiguous, for the reductions other than the mean
+        by_zone = sparse.csc_array(self.coverage)
+        by_zone.sort_indices()
+        self._zone_cells = by_zone.indices
+        self._zone_weights = by_zone.data
+        self._zone_sizes = np.diff(by_zone.indptr)
+
+    @classmethod
+    def from_coverage(cls,
+                      coverage: sparse.csr_array,
+                      longitude: np.ndarray,
+                      latitude: np.ndarray,
+                      names: list[str],
+                      label: str = "zone") -> "ZonalAggregator":
+        """Return the aggregator of precomputed weights, e.g. the areas of the cells in each zone.
+
+        Parameters
+        ----------
+        coverage : sparse.csr_array
+            the ``(cells, zones)`` weight of each cell in each zone,
+            see :func:`energy_forecast.geography.get_coverage`.
+        longitude, latitude : np.ndarray
+            the coordinates of the grid.
+        names : list[str]
+            the names of the zones.
+        label : str, optional
+            the name of the dimension of the zones.
+
+        Returns
+        -------
+        ZonalAggregator
+            the aggregator.
+        """
+        aggregator = cls.__new__(cls)
+        aggregator._set_coverage(coverage, longitude, latitude, names, label)
+        return aggregator
+
+    @classmethod
+    def from_points(cls,
+                    longitude: np.ndarray,
+                    latitude: np.ndarray,
+                    lon: np.ndarray,
+                    lat: np.ndarray,
+                    weights: np.ndarray | None = None,
+                    names: list[str] | None = None,
+                    method: str = "bilinear",
+                    label: str = "site") -> "ZonalAggregator":
+        """Return the aggregator interpolating the data at points of interest, e.g. the production sites.
+
+        Each point is a zone whose coverage is the interpolation weights of the surrounding cells,
+        so the values at all the points, for all the steps, are a single sparse matrix product.
+        The grid is rectilinear, so the cells are located with a binary search on each axis.
+
+        Parameters
+        ----------
+        longitude, latitude : np.ndarray
+            the coordinates of the grid.
+        lon, lat : np.ndarray
+            the coordinates of the points.
+        weights : np.ndarray, optional
+            the weight of each point, e.g. the installed capacity of each site.
+            If given, a last zone ``"weighted_mean"`` is added, with the weighted mean of the values at the points.
+        names : list[str], optional
+            the names of the points.
+            Default is None, for the positions of the points.
+        method : str, optional
+            ``"bilinear"`` or ``"nearest"``.
+            Default is ``"bilinear"``.
+        label : str, optional
+            the name of the dimension of the points.
+            Default is ``"site"``.
+
+        Returns
+        -------
+        ZonalAggregator
+            the aggregator. The values of the points outside of the grid are NaN.
+
+        Raises
+        ------
+        ValueError
+            if the method is unknown.
+        """
+        longitude, latitude = np.asarray(longitude, dtype=float), np.asarray(latitude, dtype=float)
+        lon, lat = np.atleast_1d(np.asarray(lon, dtype=float)), np.atleast_1d(np.asarray(lat, dtype=float))
+        names = list(range(len(lon))) if names is None else list(names)
+        x, inside_x = _fractional_index(longitude, lon)
+        y, inside_y = _fractional_index(latitude, lat)
+        points = np.flatnonzero(inside_x & inside_y)
+        x, y = x[points], y[points]
+        if method == "nearest":
+            columns, rows, values = np.rint(x), np.rint(y), np.ones(len(points))
+        elif method == "bilinear":
+            x0 = np.minimum(np.floor(x), max(len(longitude) - 2, 0))
+            y0 = np.minimum(np.floor(y), max(len(latitude) - 2, 0))
+            dx, dy = x - x0, y - y0
+            columns = np.concatenate([x0, x0 + 1, x0, x0 + 1])
+            rows = np.concatenate([y0, y0, y0 + 1, y0 + 1])
+            values = np.concatenate([(1 - dx) * (1 - dy), dx * (1 - dy), (1 - dx) * dy, dx * dy])
+            points = np.tile(points, 4)
+        else:
+            raise ValueError(f"Unknown method {method} : must be in ['bilinear', 'nearest']")
+        cells = rows.astype(int) * len(longitude) + columns.astype(int)
+        coverage = sparse.csr_array((values, (cells, points)), shape=(len(latitude) * len(longitude), len(names)))
+        if weights is not None:
+            weights = np.where(inside_x & inside_y, np.asarray(weights, dtype=float), 0.)
+            portfolio = sparse.csr_array((coverage @ weights)[:, np.newaxis])
+            coverage = sparse.hstack([coverage, portfolio], format="csr")
+            names = names + ["weighted_mean"]
+        coverage.eliminate_zeros()
+        return cls.from_coverage(coverage, longitude, latitude, names, label)
+
+    @classmethod
+    def from_masks(cls, masks: xr.DataArray, names: list[str], label: str = "zone") -> "ZonalAggregator":
+        """Return the aggregator of a mask, built only once per grid and mask for the process.
+
+        Parameters
+        ----------
+        masks : xr.DataArray
+            the index of the zone of each cell, see :class:`ZonalAggregator`.
+        names : list[str]
+            the names of the zones.
+        label : str, optional
+            the name of the dimension of the zones.
+
+        Returns
+        -------
+        ZonalAggregator
+            the aggregator.
+        """
+        masks = masks.transpose("latitude", "longitude")
+        digest = hashlib.blake2b(digest_size=16)
+        for array in [masks["longitude"], masks["latitude"], masks]:
+            digest.update(np.ascontiguousarray(array.to_numpy(), dtype=float).tobytes())
+        key = (digest.hexdigest(), tuple(names), label)
+        if key not in cls._cache:
+            cls._cache[key] = cls(masks, names, label)
+        return cls._cache[key]
+
+    def drop_empty_zones(self) -> "ZonalAggregator":
+        """Return the aggregator without the zones covering no cell of the grid, whose means would be NaN.
+
+        Returns
+        -------
+        ZonalAggregator
+            the aggregator itself if all the zones cover at least a cell, else a new aggregator.
+        """
+        covered = np.flatnonzero(self.totals > 0)
+        if len(covered) == len(self.names):
+            return self
+        return ZonalAggregator.from_coverage(self.coverage[:, covered], self.longitude, self.latitude,
+                                             [self.names[index] for index in covered], self.label)
+
+    def _align(self, da_value: xr.DataArray) -> xr.DataArray:
+        """Select the cells of the mask in the data, and put the grid dimensions last."""
+        da_value = da_value.sel(longitude=self.longitude, latitude=self.latitude,
+                                method="nearest", tolerance=1e-6)
+        return da_value.transpose(..., "latitude", "longitude")
+
+    def mean(self, da_value: xr.DataArray) -> xr.DataArray:
+        """Compute the mean of the data over each zone.
+
+        The mean is weighted by :py:attr:`coverage`.
+        The NaN values are ignored, as with ``groupby(masks).mean()``.
+
+        Parameters
+        ----------
+        da_value : xr.DataArray
+            the data, with the dimensions ``longitude`` and ``latitude`` covering the mask.
+
+        Returns
+        -------
+        xr.DataArray
+            the mean for each zone, with the other dimensions of the data
+            and the dimension :py:attr:`label` last.
+        """
+        da_value = self._align(da_value)
+        other_dims = da_value.dims[:-2]
+        values = da_value.to_numpy().reshape(-1, len(self.latitude) * len(self.longitude))
+        missing = np.isnan(values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if missing.any():
+                sums = np.where(missing, 0., values) @ self.coverage
+                means = sums / ((~missing).astype(float) @ self.coverage)
+            else:
+                means = values @ self.weights
+                means[:, self.totals == 0] = np.nan
+        coords = {name: coord for name, coord in da_value.coords.items()
+                  if not {"latitude", "longitude"} & set(coord.dims)}
+        coords[self.label] = self.names
+        return xr.DataArray(means.reshape(da_value.shape[:-2] + (len(self.names),)),
+                            dims=other_dims + (self.label,),
+                            coords=coords,
+                            name=da_value.name)
+
+    def statistics(self,
+                   da_value: xr.DataArray,
+                   statistics: list[str] | tuple[str, ...] = STATISTICS,
+                   quantiles: list[float] | tuple[float, ...] = (),
+                   bins: int = 64) -> xr.DataArray:
+        """Compute several statistics of the data over each zone, in a single pass.
+
+        The values of the cells of each zone are gathered once,
+        and all the statistics are reduced from them, weighted by :py:attr:`coverage`.
+        The quantiles are approximated from a weighted histogram of each zone and each slice,
+        with ``bins`` bins between the minimum and the maximum of the zone.
+        The NaN values are ignored.
+
+        Parameters
+        ----------
+        da_value : xr.DataArray
+            the data, with the dimensions ``longitude`` and ``latitude`` covering the grid.
+        statistics : list[str], optional
+            the statistics among :py:data:`STATISTICS`.
+            Default is all of them.
+        quantiles : list[float], optional
+            the quantiles to approximate, between 0 and 1, e.g. ``[0.1, 0.9]``.
+            They are named ``"q0.1"``, ``"q0.9"``.
+            Default is no quantile.
+        bins : int, optional
+            the number of bins of the histograms of the quantiles.
+            The error of a quantile is at most the range of the zone divided by ``bins``.
+            Default is 64.
+
+        Returns
+        -------
+        xr.DataArray
+            the statistics, with the other dimensions of the data,
+            then the dimensions ``statistic`` and :py:attr:`label`.
+
+        Raises
+        ------
+        ValueError
+            if a statistic is unknown.
+        """
+        unknown = set(statistics) - set(STATISTICS)
+        if unknown:
+            raise ValueError(f"Unknown statistics {sorted(unknown)} : must be in {list(STATISTICS)}")
+        da_value = self._align(da_value)
+        values = da_value.to_numpy().reshape(-1, len(self.latitude) * len(self.longitude))
+        n_slices, n_zones = values.shape[0], len(self.names)
+        zones = np.flatnonzero(self._zone_sizes)
+        starts = np.r_[0, np.cumsum(self._zone_sizes[zones])[:-1]]
+
+        gathered = values[:, self._zone_cells]
+        valid = ~np.isnan(gathered)
+        weights = np.where(valid, self._zone_weights, 0.)
+        gathered_or_zero = np.where(valid, gathered, 0.)
+        results = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sum_weights = np.add.reduceat(weights, starts, axis=1)
+            mean = np.add.reduceat(weights * gathered_or_zero, starts, axis=1) / sum_weights
+            results["mean"] = mean
+            if "std" in statistics:
+                mean_square = np.add.reduceat(weights * gathered_or_zero ** 2, starts, axis=1) / sum_weights
+                results["std"] = np.sqrt(np.maximum(mean_square - mean ** 2, 0.))
+            minimum = np.fmin.reduceat(gathered, starts, axis=1)
+            maximum = np.fmax.reduceat(gathered, starts, axis=1)
+            results["min"], results["max"] = minimum, maximum
+            if quantiles:
+                results.update(self._quantiles(gathered, weights, minimum, maximum, sum_weights, quantiles, bins))
+
+        names = list(statistics) + [f"q{quantile:g}" for quantile in quantiles]
+        keys = list(statistics) + [("q", quantile) for quantile in quantiles]
+        output = np.full((n_slices, len(names), n_zones), np.nan)
+        for position, key in enumerate(keys):
+            output[:, position, zones] = results[key]
+        coords = {name: coord for name, coord in da_value.coords.items()
+                  if not {"latitude", "longitude"} & set(coord.dims)}
+        coords["statistic"] = names
+        coords[self.label] = self.names
+        return xr.DataArray(output.reshape(da_value.shape[:-2] + (len(names), n_zones)),
+                            dims=da_value.dims[:-2] + ("statistic", self.label),
+                            coords=coords,
+                            name=da_value.name)
+
+    def _quantiles(self, gathered, weights, minimum, maximum, sum_weights, quantiles, bins):
+        """Approximate the quantiles from a weighted histogram of each slice and each zone."""
+        n_slices, n_zones = minimum.shape
+        sizes = self._zone_sizes[self._zone_sizes > 0]
+        lower = np.repeat(minimum, sizes, axis=1)
+        width = np.repeat((maximum - minimum) / bins, sizes, axis=1)
+        positions = np.where(width > 0, (gathered - lower) / width, 0.)
+        positions = np.clip(np.nan_to_num(positions), 0, bins - 1).astype(int)
+        entry_zones = np.repeat(np.arange(n_zones), sizes)
+        flat_bins = (np.arange(n_slices)[:, np.newaxis] * n_zones + entry_zones) * bins + positions
+        histogram = np.bincount(flat_bins.ravel(), weights=weights.ravel(), minlength=n_slices * n_zones * bins)
+        cumulative = np.cumsum(histogram.reshape(n_slices, n_zones, bins), axis=2) / sum_weights[..., np.newaxis]
+        widths = (maximum - minimum) / bins
+        results = {}
+        for quantile in quantiles:
+            above = cumulative >= quantile - 1e-12
+            k = np.argmax(above, axis=2)
+            upper = np.take_along_axis(cumulative, k[..., np.newaxis], axis=2)[..., 0]
+            previous = np.where(k > 0,
+                                np.take_along_axis(cumulative, np.maximum(k - 1, 0)[..., np.newaxis], axis=2)[..., 0],
+                                0.)
+            fraction = np.where(upper > previous, (quantile - previous) / (upper - previous), 0.)
+            results[("q", quantile)] = minimum + (k + np.clip(fraction, 0, 1)) * widths
+        return results
+
+    def statistics_table(self, da_value: xr.DataArray, **kwargs) -> pd.DataFrame:
+        """Compute several statistics of the data over each zone, as a wide table.
+
+        Parameters
+        ----------
+        da_value : xr.DataArray
+            the data, see :py:meth:`mean_table`.
+        **kwargs
+            the parameters of :py:meth:`statistics`.
+
+        Returns
+        -------
+        pd.DataFrame
+            one column per statistic and zone (a MultiIndex ``(statistic, label)``),
+            indexed by ``valid_time``, or by ``(time, valid_time)`` if the data has a ``time`` dimension.
+        """
+        if "valid_time" in da_value.coords:
+            da_value = da_value.drop_vars("valid_time")
+        da_statistics = self.statistics(da_value, **kwargs).stack(column=("statistic", self.label))
+        df_statistics = to_table(da_statistics, "column")
+        df_statistics.columns = pd.MultiIndex.from_tuples(df_statistics.columns, names=["statistic", self.label])
+        return df_statistics
+
+    def mean_table(self, da_value: xr.DataArray) -> pd.DataFrame:
+        """Compute the mean of the data over each zone, as a wide table.
+
+        Parameters
+        ----------
+        da_value : xr.DataArray
+            the data, with the dimensions ``step`` and optionally ``time`` (the run),
+            see :py:meth:`energy_forecast.meteo.ArpegeSimpleAPI.read_dataset`.
+
+        Returns
+        -------
+        pd.DataFrame
+            one column per zone, indexed by ``valid_time``,
+            or by ``(time, valid_time)`` if the data has a ``time`` dimension.
+        """
+        if "valid_time" in da_value.coords:
+            da_value = da_value.drop_vars("valid_time")
+        return to_table(self.mean(da_value), self.label)
+
+
+def to_table(da_zones: xr.DataArray, label: str) -> pd.DataFrame:
+    """Convert values per zone to a wide table indexed by the valid time.
+
+    Parameters
+    ----------
+    da_zones : xr.DataArray
+        the values, with the dimensions ``step``, ``label`` and optionally ``time`` (the run),
+        see :py:meth:`ZonalAggregator.mean`.
+    label : str
+        the dimension of the zones.
+
+    Returns
+    -------
+    pd.DataFrame
+        one column per zone, indexed by ``valid_time``,
+        or by ``(time, valid_time)`` if the data has a ``time`` dimension.
+    """
+    if "time" in da_zones.dims:
+        da_zones = da_zones.transpose("time", "step", label)
+        times = np.repeat(da_zones["time"].to_numpy(), da_zones.sizes["step"])
+        steps = np.tile(da_zones["step"].to_numpy(), da_zones.sizes["time"])
+        index = pd.MultiIndex.from_arrays([times, times + steps], names=["time", "valid_time"])
+    else:
+        da_zones = da_zones.transpose("step", label)
+        index = pd.DatetimeIndex(da_zones["time"].to_numpy() + da_zones["step"].to_numpy(), name="valid_time")
+    return pd.DataFrame(da_zones.to_numpy().reshape(len(index), da_zones.sizes[label]),
+                        index=index,
+                        columns=pd.Index(da_zones[label].to_numpy(), name=label))
+
+
+def _fractional_index(coords: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the fractional position of the values in the coordinates, and whether they are inside."""
+    positions = np.arange(len(coords), dtype=float)
+    if len(coords) > 1 and coords[0] > coords[-1]:
+        coords, positions = coords[::-1], positions[::-1]
+    inside = (values >= coords[0]) & (values <= coords[-1])
+    return np.interp(values, coords, positions), inside
+
+
+def rollup(df_means: pd.DataFrame,
+           hierarchy: pd.DataFrame,
+           label: str = "region",
+           parents: list[str] | None = None) -> pd.DataFrame:
+    """Compute the means over parent zones from the means over their child zones.
+
+    The mean over a parent zone is the weighted mean of the means over its children,
+    which is exact when the weights are the total weights of the children in their aggregation
+    (see :func:`energy_forecast.geography.get_zone_hierarchy`) and the grid has no NaN value.
+    The NaN means are ignored.
+
+    Parameters
+    ----------
+    df_means : pd.DataFrame
+        the means over the child zones, one column per zone, e.g. the departements.
+    hierarchy : pd.DataFrame
+        indexed by the child zones, with the column ``label`` (the parent zone)
+        and the column ``"weight"``.
+    label : str, optional
+        the column of the parent zones in ``hierarchy``, and the name of the columns axis of the result.
+        Default is ``"region"``.
+    parents : list[str], optional
+        the parent zones, in the order of the columns of the result.
+        Default is None, for all the parents of the children, in the order of their first child.
+
+    Returns
+    -------
+    pd.DataFrame
+        the means over the parent zones, one column per zone.
+    """
+    hierarchy = hierarchy.loc[df_means.columns]
+    parents = pd.Index(hierarchy[label].unique() if parents is None else parents, name=label)
+    matrix = np.zeros((len(hierarchy), len(parents)))
+    columns = parents.get_indexer(hierarchy[label])
+    children = np.flatnonzero(columns >= 0)
+    matrix[children, columns[children]] = hierarchy["weight"].to_numpy()[children]
+    values = df_means.to_numpy(dtype=float)
+    missing = np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (np.where(missing, 0., values) @ matrix) / ((~missing).astype(float) @ matrix)
+    return pd.DataFrame(means, index=df_means.index, columns=parents)
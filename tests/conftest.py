@@ -0,0 +1,12 @@
+import pytest
+
+from energy_forecast.testing import LocalObjectStore
+
+
+@pytest.fixture
+def local_store():
+    """A local object store with small synthetic files."""
+    grib_kwargs = {"ni": 60, "nj": 40, "fields": ["t2m", "si10", "ssrd", "prmsl"]}
+    observations_kwargs = {"start": "2023-01-01", "end": "2023-03-31", "n_stations": 5}
+    with LocalObjectStore(grib_kwargs=grib_kwargs, observations_kwargs=observations_kwargs) as store:
+        yield store
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from shapely.geometry import Polygon
+
+from energy_forecast import geography
+from energy_forecast.constants import region_names
+from energy_forecast.geography import (
+    build_geometry_store,
+    extract_list_poly,
+    generate_coverage,
+    get_capacity_coverage,
+    get_geometries,
+    get_mask,
+    get_zone_aggregator,
+    get_zone_hierarchy,
+    grid_signature,
+    load_geometry_store,
+    points_in_polygons,
+    which_region,
+)
+from energy_forecast.zonal import rollup
+
+
+def make_grid(resolution):
+    longitude = np.arange(-5, 10, resolution)
+    latitude = np.arange(51, 41, -resolution)
+    return xr.Dataset(coords={"longitude": longitude, "latitude": latitude})
+
+
+class TestGeography:
+
+    def test_points_in_polygons(self):
+        polygons = {2: Polygon([(0, 0), (2, 0), (2, 2), (0, 2)]),
+                    0: Polygon([(1, 1), (3, 1), (3, 3), (1, 3)]),
+                    1: Polygon([(4, 0), (5, 0), (4.5, 1)])}
+        lon, lat = np.meshgrid(np.arange(-0.25, 5.5, 0.5), np.arange(-0.25, 3.5, 0.5), indexing="ij")
+        result = points_in_polygons(lon, lat, polygons)
+        expected = np.vectorize(which_region, excluded=["polygons_regions"])(lon, lat, polygons_regions=polygons)
+        np.testing.assert_array_equal(result, expected)
+        assert set(np.unique(result[~np.isnan(result)])) == {0, 1, 2}
+
+    def test_get_mask_by_grid(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_masks", {})
+        coarse, fine = make_grid(0.5), make_grid(0.25)
+        assert grid_signature("regions", coarse) != grid_signature("regions", fine)
+        mask = get_mask("regions", coarse)
+        assert mask.shape == (30, 20)
+        assert get_mask("regions", coarse) is mask
+        assert get_mask("regions", fine).shape == (60, 40)
+        assert len(list(tmp_path.glob("mask_france_regions_*.nc"))) == 2
+        # a new process reads the files
+        monkeypatch.setattr(geography, "_masks", {})
+        xr.testing.assert_identical(get_mask("regions", coarse), mask)
+
+    def test_mask_of_the_largest_polygons(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_masks", {})
+        grid = make_grid(0.5)
+        # the geometry of the masks the production models were trained with
+        polygons = extract_list_poly(geography.ROOT_DIR / "data" / "geo" / "regions.geojson", region_names,
+                                     largest=True)
+        assert all(polygon.geom_type == "Polygon" and not polygon.interiors for polygon in polygons.values())
+        lon, lat = np.meshgrid(grid["longitude"], grid["latitude"], indexing="ij")
+        expected = np.vectorize(which_region, excluded=["polygons_regions"])(lon, lat, polygons_regions=polygons)
+        np.testing.assert_array_equal(get_mask("regions", grid).to_numpy(), expected)
+
+    def test_coverage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_coverages", {})
+        grid = make_grid(0.5)
+        coverage = generate_coverage("regions", grid)
+        # a cell is never covered more than its area
+        cell_areas = 0.25 * np.cos(np.deg2rad(np.repeat(grid["latitude"].to_numpy(), grid.sizes["longitude"])))
+        assert (coverage.sum(axis=1) <= cell_areas + 1e-9).all()
+        # the area of France is about 550 000 km2, 1 square degree at the equator is about 12 364 km2
+        assert 40 < coverage.sum() < 48
+
+        aggregator = get_zone_aggregator("regions", grid)
+        assert list(tmp_path.glob("coverage_france_regions_*.npz"))
+        da_value = xr.DataArray(np.full((2, 20, 30), 3.), dims=("step", "latitude", "longitude"),
+                                coords={"step": [0, 1], **grid.coords})
+        da_means = aggregator.mean(da_value)
+        np.testing.assert_allclose(da_means.to_numpy(), 3.)
+        assert list(da_means["region"].values) == region_names
+
+    def test_geometry_store(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(geography, "GEOMETRY_STORE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_geometries", {})
+        geometries = get_geometries("regions")
+        names, stored, _ = load_geometry_store(tmp_path / "regions.npz")
+        assert names == region_names
+        expected = extract_list_poly(geography.ROOT_DIR / "data" / "geo" / "regions.geojson", region_names)
+        assert all(geometries[index].equals_exact(expected[index], 0) for index in expected)
+        assert get_geometries("regions") is geometries
+        simplified = build_geometry_store("regions", tolerance=0.05)
+        assert simplified.stat().st_size < (tmp_path / "regions.npz").stat().st_size
+
+    def test_capacity_weighting(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "CAPACITY_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_capacity_coverages", {})
+        pd.DataFrame({"longitude": [2.35, 5.37, 5.0, -4.9],
+                      "latitude": [48.85, 43.30, 43.6, 45.0],
+                      "capacity": [10., 250., 50., 100.]}).to_csv(tmp_path / "capacity_wind.csv", index=False)
+        grid = make_grid(0.5)
+        coverage = get_capacity_coverage("regions", "capacity_wind", grid)
+        # the site in the sea is dropped
+        assert coverage.sum() == pytest.approx(310.)
+        assert list(tmp_path.glob("capacity_france_regions_capacity_wind_*.npz"))
+
+        aggregator = get_zone_aggregator("regions", grid, weighting="capacity", capacity="capacity_wind")
+        lon, _ = xr.broadcast(grid["longitude"], grid["latitude"])
+        da_means = aggregator.mean(lon.expand_dims(step=[0]))
+        means = da_means.isel(step=0).to_series()
+        # the bilinear interpolation of a linear field is exact
+        assert means["Île-de-France"] == pytest.approx(2.35)
+        assert means["Provence-Alpes-Côte d'Azur"] == pytest.approx((5.37 * 250 + 5.0 * 50) / 300)
+        assert means.drop(["Île-de-France", "Provence-Alpes-Côte d'Azur"]).isna().all()
+
+        with pytest.raises(FileNotFoundError):
+            get_zone_aggregator("regions", grid, weighting="capacity", capacity="capacity_sun")
+        with pytest.raises(ValueError):
+            get_zone_aggregator("regions", grid, weighting="capacity")
+
+    @pytest.mark.parametrize("weighting", ["cells", "area"])
+    def test_rollup_of_the_departements(self, tmp_path, monkeypatch, weighting):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_masks", {})
+        monkeypatch.setattr(geography, "_coverages", {})
+        grid = make_grid(0.25)
+        rng = np.random.default_rng(0)
+        da_value = xr.DataArray(rng.random((2, 40, 60)), dims=("step", "latitude", "longitude"),
+                                coords={"time": pd.Timestamp("2024-06-28"),
+                                        "step": pd.to_timedelta([0, 1], unit="h"), **grid.coords})
+        hierarchy = get_zone_hierarchy(grid, weighting)
+        assert "Territoire de Belfort" in hierarchy.index
+        df_departements = get_zone_aggregator("departements", grid, weighting).mean_table(da_value)
+        df_regions = rollup(df_departements, hierarchy, "region", parents=region_names)
+        expected = get_zone_aggregator("regions", grid, weighting).mean_table(da_value)
+        pd.testing.assert_frame_equal(df_regions, expected)
+
+    @pytest.mark.parametrize("weighting", ["cells", "area"])
+    def test_no_empty_departement(self, tmp_path, monkeypatch, weighting):
+        monkeypatch.setattr(geography, "MASK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(geography, "_masks", {})
+        monkeypatch.setattr(geography, "_coverages", {})
+        grid = make_grid(0.25)
+        da_value = xr.DataArray(np.ones((1, 40, 60)), dims=("step", "latitude", "longitude"),
+                                coords={"time": pd.Timestamp("2024-06-28"),
+                                        "step": pd.to_timedelta([0], unit="h"), **grid.coords})
+        aggregator = get_zone_aggregator("departements", grid, weighting)
+        df_departements = aggregator.mean_table(da_value)
+        assert not df_departements.isna().all().any()
+        # Paris covers no cell centre of this grid, but a part of some cells
+        assert ("Paris" in df_departements.columns) == (weighting == "area")
+        assert list(get_zone_hierarchy(grid, weighting).index) == list(df_departements.columns)
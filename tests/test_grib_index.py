@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+
+from energy_forecast.grib_index import HEADER_SIZE, iter_messages, merge_ranges, parse_message_header, select_messages
+from energy_forecast.meteo import KEYS_FILTER_SSPD, KEYS_FILTER_T2M, KEYS_FILTER_WIND
+
+
+def fake_message(category, number, level_type, level, template=0, payload=100):
+    """Build a minimal GRIB2 message with a section 1, a section 4 and a payload."""
+    section_1 = struct.pack(">IB", 21, 1) + bytes(16)
+    section_4 = (struct.pack(">IBHH", 34, 4, 0, template)
+                 + bytes([category, number])
+                 + bytes(11)
+                 + struct.pack(">BbI", level_type, 0, level)
+                 + bytes(6))
+    body = section_1 + section_4 + bytes(payload) + b"7777"
+    return b"GRIB" + bytes(2) + bytes([0, 2]) + struct.pack(">Q", 16 + len(body)) + body
+
+
+class TestGribIndex:
+
+    def test_parse_message_header(self):
+        message = parse_message_header(fake_message(2, 1, 103, 10), offset=42)
+        assert message["offset"] == 42
+        assert message["length"] == 16 + 21 + 34 + 100 + 4
+        assert message["discipline"] == 0
+        assert message["parameterCategory"] == 2
+        assert message["parameterNumber"] == 1
+        assert message["typeOfFirstFixedSurface"] == 103
+        assert message["level"] == 10
+
+    def test_parse_not_grib(self):
+        with pytest.raises(ValueError):
+            parse_message_header(b"not a grib message")
+
+    def test_iter_and_select_messages(self):
+        data = b"".join([
+            fake_message(0, 0, 103, 2),  # t2m
+            fake_message(1, 1, 103, 2),  # r2
+            fake_message(2, 1, 103, 10),  # si10
+            fake_message(4, 7, 1, 0, template=8),  # ssrd
+            fake_message(2, 1, 103, 100),  # wind speed at 100 m
+        ])
+        messages = list(iter_messages(lambda offset, length: data[offset:offset + length]))
+        assert len(messages) == 5
+        assert sum(message["length"] for message in messages) == len(data)
+
+        selected = select_messages(messages, [KEYS_FILTER_SSPD, KEYS_FILTER_WIND, KEYS_FILTER_T2M])
+        assert [messages.index(message) for message in selected] == [0, 2, 3]
+
+        ranges = merge_ranges(selected)
+        assert len(ranges) == 2
+        assert ranges[0] == (0, messages[0]["length"])
+        assert ranges[1] == (messages[2]["offset"], messages[4]["offset"])
+
+    def test_iter_messages_by_blocks(self):
+        message = fake_message(0, 0, 103, 2)
+        data = message * 10
+        reads = []
+
+        def read(offset, length):
+            reads.append((offset, length))
+            return data[offset:offset + length]
+
+        assert len(list(iter_messages(read))) == 10
+        assert len(reads) == 6
+        reads.clear()
+        messages = list(iter_messages(read, block_size=HEADER_SIZE + 4 * len(message)))
+        assert [message["offset"] for message in messages] == list(range(0, len(data), len(message)))
+        assert len(reads) == 2
+
+    def test_iter_corrupt_messages(self):
+        def reader(data):
+            return lambda offset, length: data[offset:offset + length]
+
+        message = fake_message(0, 0, 103, 2)
+        zero_length = message[:8] + struct.pack(">Q", 0) + message[16:]
+        with pytest.raises(ValueError):
+            list(iter_messages(reader(message + zero_length)))
+        with pytest.raises(ValueError):
+            list(iter_messages(reader(message + b"GRIB\x00")))
+
+    def test_select_unknown_key(self):
+        message = parse_message_header(fake_message(0, 0, 103, 2))
+        with pytest.raises(ValueError):
+            select_messages([message], [{"shortName": "2t"}])
@@ -0,0 +1,210 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+import requests
+
+from energy_forecast.download import (
+    IncompleteDownloadError,
+    RangeNotSupportedError,
+    download_ranges,
+    partial_filename,
+    stream_to_file,
+    validators_filename,
+)
+from energy_forecast.meteo import (
+    ArpegeMultiRunAPI,
+    ArpegeSimpleAPI,
+    download_historical_forecasts,
+    download_observations_all_departments,
+    fetch_observations,
+)
+
+
+def make_client(store, prefix, **kwargs):
+    client = ArpegeSimpleAPI("2024-06-28", prefix=prefix, forecast_horizons=["000H012H", "013H024H"], **kwargs)
+    client.base_url = store.arpege_url
+    return client
+
+
+class TestLocalObjectStore:
+
+    def test_conditional_requests(self, local_store):
+        url = local_store.observations_url.format(DEP_ID=1, file_type="test")
+        response = requests.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+        response = requests.get(url, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert len(response.content) == 10
+
+    def test_fetch(self, local_store, tmp_path):
+        client = make_client(local_store, tmp_path, subset=False)
+        files = client.fetch()
+        assert len(files) == 2
+        requests_count = local_store.stats["requests"]
+        client.fetch()
+        assert local_store.stats["requests"] == requests_count
+
+    def test_fetch_subset(self, local_store, tmp_path):
+        full = make_client(local_store, tmp_path / "full", subset=False).fetch()[0]
+        subset = make_client(local_store, tmp_path / "subset").fetch()[0]
+        assert os.path.getsize(subset) < os.path.getsize(full)
+        dataset = ArpegeSimpleAPI.read_file_as_xarray(subset, {"cfVarName": "ssrd"})
+        assert dataset["ssrd"].sizes["step"] == 13
+
+    def test_fetch_subset_without_ranges(self, local_store, tmp_path):
+        local_store.accept_ranges = False
+        client = make_client(local_store, tmp_path)
+        files = client.fetch()
+        assert files == [client.get_filename(forecast_horizon, subset=False)
+                         for forecast_horizon in client.forecast_horizons]
+        assert client.is_complete()
+        requests_count = local_store.stats["requests"]
+        assert client.fetch() == files
+        assert local_store.stats["requests"] == requests_count
+
+    def test_fetch_missing_horizon(self, tmp_path, local_store):
+        local_store.missing = ["013H024H"]
+        client = make_client(local_store, tmp_path)
+        client.fetch(errors="ignore")
+        assert client.missing_horizons == ["013H024H"]
+        with pytest.raises(requests.HTTPError):
+            client.fetch()
+
+    def test_concurrent_fetch_partial_failure(self, tmp_path, local_store):
+        client = ArpegeSimpleAPI("2024-06-28", prefix=tmp_path, subset=False, max_workers=3,
+                                 forecast_horizons=["000H012H", "013H024H", "025H036H"])
+        client.base_url = local_store.arpege_url
+        # not a network error: the partial file cannot be written
+        partial_filename(client.get_filename("013H024H")).mkdir()
+        files = client.fetch(errors="ignore")
+        assert files == [client.get_filename("000H012H"), client.get_filename("025H036H")]
+        assert client.missing_horizons == ["013H024H"]
+        with pytest.raises(IsADirectoryError):
+            client.fetch()
+        assert client.missing_horizons == ["013H024H"]
+
+    def test_multi_run_fetch(self, tmp_path, local_store, monkeypatch):
+        monkeypatch.setattr(ArpegeSimpleAPI, "base_url", local_store.arpege_url)
+        client = ArpegeMultiRunAPI("2024-06-27 18:00", "2024-06-28 00:00", prefix=tmp_path, subset=False)
+        previous, current = client.clients
+        assert len(previous.forecast_horizons) == 5
+        # the 00Z run starts 6 hours later, its horizons ending before the 18Z run are skipped
+        assert current.forecast_horizons == ArpegeSimpleAPI.forecast_horizons[4:]
+        files = client.fetch()
+        assert len(files) == 10
+        assert local_store.stats["get"] == 10
+        local_store.reset_stats()
+        assert client.fetch() == files
+        assert local_store.stats["requests"] == 0
+
+    def test_resume_truncated_download(self, local_store, tmp_path):
+        url = local_store.observations_url.format(DEP_ID=1, file_type="test")
+        local_store.truncate_rate = 1.
+        with pytest.raises(requests.RequestException):
+            stream_to_file(url, tmp_path / "observations.csv.gz")
+        local_store.truncate_rate = 0.
+        stream_to_file(url, tmp_path / "observations.csv.gz")
+        df = pd.read_csv(tmp_path / "observations.csv.gz", sep=";")
+        assert len(df) == 5 * 90
+
+    def test_resume_with_the_validators_of_the_server(self, local_store, tmp_path):
+        url = local_store.observations_url.format(DEP_ID=1, file_type="test")
+        filename = tmp_path / "observations.csv.gz"
+        local_store.last_modified = time.time() - 3600
+        local_store.truncate_rate = 1.
+        with pytest.raises(requests.RequestException):
+            stream_to_file(url, filename)
+        assert validators_filename(filename).exists()
+        partial_size = partial_filename(filename).stat().st_size
+        local_store.truncate_rate = 0.
+        local_store.reset_stats()
+        stream_to_file(url, filename)
+        assert local_store.stats["bytes"] == filename.stat().st_size - partial_size
+        assert not validators_filename(filename).exists()
+        df = pd.read_csv(filename, sep=";")
+        assert len(df) == 5 * 90
+
+    def test_failed_ranges_are_not_kept(self, local_store, tmp_path):
+        url = local_store.observations_url.format(DEP_ID=1, file_type="test")
+        filename = tmp_path / "ranges.csv.gz"
+        local_store.short_rate = 1.
+        with pytest.raises(IncompleteDownloadError):
+            download_ranges(url, [(0, 100), (200, 300)], filename)
+        assert not partial_filename(filename).exists()
+        local_store.short_rate = 0.
+        local_store.accept_ranges = False
+        with pytest.raises(RangeNotSupportedError):
+            download_ranges(url, [(0, 100)], filename)
+        assert not partial_filename(filename).exists()
+        local_store.missing = ["Q_01_"]
+        with pytest.raises(requests.HTTPError):
+            download_ranges(url, [(0, 100)], filename)
+        assert not partial_filename(filename).exists()
+        assert not filename.exists()
+
+    def test_download_observations(self, local_store, tmp_path):
+        local_store.missing = ["Q_20_"]
+        files = download_observations_all_departments(file_type="test",
+                                                      url_template=local_store.observations_url,
+                                                      download_root=tmp_path)
+        assert len(files) == 94
+
+    def test_conditional_refresh_of_observations(self, local_store, tmp_path):
+        kwargs = {"file_type": "test", "url_template": local_store.observations_url, "download_root": tmp_path}
+        df_status = fetch_observations(cache_duration="0h", **kwargs)
+        assert (df_status["status"] == "downloaded").all()
+        assert (tmp_path / "manifest.json").exists()
+
+        local_store.reset_stats()
+        df_status = fetch_observations(cache_duration="0h", **kwargs)
+        assert (df_status["status"] == "not_modified").all()
+        assert local_store.stats["not_modified"] == 95
+        assert local_store.stats["bytes"] == 0
+
+        local_store.reset_stats()
+        assert (fetch_observations(**kwargs)["status"] == "fresh").all()
+        assert local_store.stats["requests"] == 0
+
+        local_store.touch()
+        local_store.add_file("/meteofrance/data/synchro_ftp/BASE/QUOT/Q_01_test.csv.gz", b"changed")
+        local_store.missing = ["Q_02_"]
+        df_status = fetch_observations(cache_duration="0h", **kwargs)
+        assert df_status.loc[1, "status"] == "downloaded"
+        assert (tmp_path / "Q_01_test.csv.gz").read_bytes() == b"changed"
+        assert df_status.loc[2, "status"] == "failed"
+        assert (df_status.loc[3:, "status"] == "not_modified").all()
+
+    def test_download_historical_forecasts(self, local_store, tmp_path):
+        from boto3.s3.transfer import TransferConfig
+
+        for forecast in ["d0", "d1"]:
+            local_store.add_file(f"/bucket/weather_forecasts/temperature_hourly_{forecast}.nc",
+                                 bytes(range(256)) * 4096)
+        kwargs = {"variables": "temperature_hourly", "forecast_type": ["d0", "d1"], "prefix": str(tmp_path),
+                  # several parts per file
+                  "transfer_config": TransferConfig(multipart_threshold=256 * 1024, multipart_chunksize=256 * 1024)}
+        files = download_historical_forecasts("key", "secret", local_store.url, "bucket", **kwargs)
+        assert [file.read_bytes() for file in files] == [bytes(range(256)) * 4096] * 2
+
+        local_store.reset_stats()
+        download_historical_forecasts("key", "secret", local_store.url, "bucket", **kwargs)
+        assert local_store.stats["get"] == 0
+
+        # a partial file, and a new version of the remote file
+        files[0].write_bytes(b"partial")
+        local_store.add_file("/bucket/weather_forecasts/temperature_hourly_d1.nc", b"new version")
+        download_historical_forecasts("key", "secret", local_store.url, "bucket", **kwargs)
+        assert files[0].read_bytes() == bytes(range(256)) * 4096
+        assert files[1].read_bytes() == b"new version"
+
+    def test_download_historical_forecasts_short_body(self, local_store, tmp_path):
+        local_store.add_file("/bucket/weather_forecasts/temperature_hourly_d0.nc", b"x" * 1000)
+        local_store.short_rate = 1.
+        with pytest.raises(IncompleteDownloadError, match="downloaded 500 bytes, expected 1000"):
+            download_historical_forecasts("key", "secret", local_store.url, "bucket", prefix=str(tmp_path),
+                                          variables="temperature_hourly", forecast_type="d0")
+        assert not list((tmp_path / "weather_forecasts").glob("*.nc*"))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from energy_forecast.meteo import ArpegeSimpleAPI, deaccumulate, forecast_horizon_hours, instant_flux_from_cumul
+
+
+class TestArpegeSimpleAPI:
+
+    def test_forecast_horizon_hours(self):
+        assert forecast_horizon_hours("000H012H") == (0, 12)
+        assert forecast_horizon_hours("097H102H") == (97, 102)
+
+    def test_run_forecast_horizons(self, tmp_path):
+        assert ArpegeSimpleAPI("2024-06-28", "00:00:00", prefix=tmp_path).forecast_horizons[-1] == "097H102H"
+        assert ArpegeSimpleAPI("2024-06-28", "06:00:00", prefix=tmp_path).forecast_horizons[-1] == "061H072H"
+        assert ArpegeSimpleAPI("2024-06-28", "18:00:00", prefix=tmp_path).forecast_horizons[-1] == "049H060H"
+
+    def test_new_forecast_horizons(self, tmp_path):
+        previous = ArpegeSimpleAPI("2024-06-28", "00:00:00", prefix=tmp_path)
+        current = ArpegeSimpleAPI("2024-06-28", "12:00:00", prefix=tmp_path)
+        assert current.run_timestamp == pd.Timestamp("2024-06-28 12:00")
+        assert current.new_forecast_horizons(previous) == ["085H096H", "097H102H"]
+        assert previous.new_forecast_horizons(previous) == []
+        # the 06Z run stops before the 00Z run
+        assert ArpegeSimpleAPI("2024-06-28", "06:00:00", prefix=tmp_path).new_forecast_horizons(previous) == []
+
+    def test_latest_run_on_disk(self, tmp_path):
+        complete = ArpegeSimpleAPI("2024-06-28", "06:00:00", prefix=tmp_path)
+        for forecast_horizon in complete.forecast_horizons:
+            open(complete.get_filename(forecast_horizon), "wb").close()
+        latest = ArpegeSimpleAPI.latest_run(now="2024-06-28 09:30", prefix=tmp_path)
+        assert (latest.date, latest.time) == ("2024-06-28", "06:00:00")
+
+
+class TestInstantFlux:
+
+    def make_cumul(self):
+        """Two runs of 4 steps, the second one fetched from the step 2."""
+        steps = pd.to_timedelta(range(4), unit="h")
+        values = np.array([[0., 1., 3., 6.], [np.nan, np.nan, 10., 14.]])
+        return xr.DataArray(values[:, :, np.newaxis], dims=("time", "step", "region"),
+                            coords={"time": pd.DatetimeIndex(["2024-06-28 00:00", "2024-06-28 06:00"]),
+                                    "step": steps, "region": ["a"]})
+
+    def test_deaccumulate(self):
+        da_flux = deaccumulate(self.make_cumul())
+        np.testing.assert_array_equal(da_flux.isel(region=0).to_numpy(),
+                                      [[0., 1., 2., 3.], [np.nan, np.nan, np.nan, 4.]])
+        da_late = deaccumulate(self.make_cumul().isel(step=slice(2, None)))
+        assert da_late.isel(step=0).isnull().all()
+
+    def test_instant_flux_from_cumul(self):
+        da_cumul = self.make_cumul()
+        times = np.repeat(da_cumul["time"].to_numpy(), 4)
+        valid_times = times + np.tile(da_cumul["step"].to_numpy(), 2)
+        df_cumul = pd.DataFrame({"a": da_cumul.to_numpy().ravel()},
+                                index=pd.MultiIndex.from_arrays([times, valid_times], names=["time", "valid_time"]))
+        df_flux = instant_flux_from_cumul(df_cumul.iloc[::-1].dropna())
+        assert df_flux["a"].tolist() == [0., 1., 2., 3., 4.]
+        assert df_flux.index[-1] == (pd.Timestamp("2024-06-28 06:00"), pd.Timestamp("2024-06-28 08:00"))
+        df_single = instant_flux_from_cumul(df_cumul.loc["2024-06-28 00:00"])
+        assert df_single["a"].tolist() == [0., 1., 2., 3.]
+        assert df_single.index[0] == pd.Timestamp("2024-06-27 23:00")
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from energy_forecast import observations
+from energy_forecast.geography import load_departement_weights
+from energy_forecast.meteo import aggregates_observations
+from energy_forecast.observations import (
+    ObservationStore,
+    departement_of,
+    departement_temperatures,
+    national_temperature,
+    parse_observations,
+    read_observations,
+)
+from energy_forecast.testing import synthetic_observations
+
+
+def write_observations(folder, dep_ids, end="2023-03-31", **kwargs):
+    """Write synthetic observation files of the departements."""
+    files = []
+    for dep_id in dep_ids:
+        filename = folder / f"Q_{dep_id:0>2}_latest-2023-2024_RR-T-Vent.csv.gz"
+        filename.write_bytes(synthetic_observations(dep_id, start="2023-01-01", end=end,
+                                                    n_stations=4, **kwargs))
+        files.append(filename)
+    return files
+
+
+class TestObservations:
+
+    def test_parse_observations(self, tmp_path):
+        filename, = write_observations(tmp_path, [13])
+        assert departement_of(filename) == "13"
+        df = parse_observations(filename)
+        expected = pd.read_csv(filename, sep=";").dropna(subset=["TM"])
+        assert list(df.columns) == ["station", "date", "temperature", "departement"]
+        assert df["temperature"].tolist() == expected["TM"].tolist()
+        assert df["date"].iloc[-1] == pd.Timestamp("2023-03-31")
+        assert (df["departement"] == "13").all()
+
+    def test_read_observations_cache(self, tmp_path):
+        files = write_observations(tmp_path, [1, 2, 75])
+        cache_dir = tmp_path / "cache"
+        df = read_observations(files, cache_dir, max_workers=2)
+        assert len(list(cache_dir.glob("*.parquet"))) == 3
+        assert set(df["departement"]) == {"01", "02", "75"}
+        pd.testing.assert_frame_equal(read_observations(files, cache_dir), df)
+        # a changed file is parsed again, and replaces its previous version
+        write_observations(tmp_path, [2], seed=1)
+        df_changed = read_observations(files, cache_dir, start="2023-02-01")
+        assert len(list(cache_dir.glob("Q_02_*.parquet"))) == 1
+        assert df_changed["date"].min() == pd.Timestamp("2023-02-01")
+        assert not df_changed[df_changed["departement"] == "02"]["temperature"].isin(df["temperature"]).all()
+
+    def test_aggregates_observations(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(observations, "OBSERVATIONS_CACHE_DIR", tmp_path / "cache")
+        files = write_observations(tmp_path, [1, 2])
+        expected = []
+        for filename in files:
+            df = pd.read_csv(filename, sep=";", parse_dates=["AAAAMMJJ"], date_format="%Y%m%d")
+            expected.append(df.groupby("AAAAMMJJ")["TM"].mean()["2023-02-01":])
+        expected = pd.concat(expected, axis=1).mean(axis=1)
+        result = aggregates_observations(files, cut_before="2023-02-01")
+        pd.testing.assert_series_equal(result, expected, check_names=False, check_index_type=False)
+
+    def test_observation_store(self, tmp_path):
+        files = write_observations(tmp_path, [1, 2], end="2023-03-30")
+        store = ObservationStore(tmp_path / "store")
+        assert store.ingest(files).tolist() == [len(parse_observations(filename)) for filename in files]
+        assert store.ingest(files).sum() == 0
+        # a day more in the first file
+        write_observations(tmp_path, [1], end="2023-03-31")
+        expected = parse_observations(files[0])
+        assert store.ingest(files).tolist() == [(expected["date"] == "2023-03-31").sum(), 0]
+        assert store.last_dates.tolist() == [pd.Timestamp("2023-03-31"), pd.Timestamp("2023-03-30")]
+        assert len(list((tmp_path / "store" / "departement=01").glob("*.parquet"))) == 2
+
+        df = store.query(start="2023-03-31")
+        assert (df["departement"] == "01").all()
+        expected = expected[expected["date"] == "2023-03-31"]
+        assert sorted(df["temperature"]) == sorted(expected["temperature"])
+
+        store.compact()
+        assert len(list((tmp_path / "store" / "departement=01").glob("*.parquet"))) == 1
+        assert len(store.query(departements=["02"])) == len(parse_observations(files[1]))
+        assert store.query(end="2022-12-31").empty
+
+    def test_observation_store_late_rows(self, tmp_path):
+        filename, = write_observations(tmp_path, [1], end="2023-03-31")
+        df_source = pd.read_csv(filename, sep=";")
+        late_station = df_source["NUM_POSTE"].iloc[0]
+        # a station publishes its last day after the others
+        late = (df_source["NUM_POSTE"] == late_station) & (df_source["AAAAMMJJ"] == 20230331)
+        df_source[~late].to_csv(filename, sep=";", index=False)
+        store = ObservationStore(tmp_path / "store")
+        store.ingest([filename])
+        df_source.to_csv(filename, sep=";", index=False)
+        assert store.ingest([filename]).tolist() == [1]
+        columns = ["station", "date", "temperature"]
+        df_store = store.query()[columns].sort_values(["station", "date"], ignore_index=True)
+        expected = parse_observations(filename)[columns].sort_values(["station", "date"], ignore_index=True)
+        pd.testing.assert_frame_equal(df_store, expected, check_dtype=False)
+
+    def test_weighted_temperature(self, tmp_path):
+        files = write_observations(tmp_path, [1, 2, 3])
+        df_observations = read_observations(files, tmp_path / "cache")
+        df_departements = departement_temperatures(df_observations)
+        expected = df_observations.groupby(["date", "departement"], observed=True)["temperature"].mean().unstack()
+        np.testing.assert_allclose(df_departements.to_numpy(), expected.to_numpy())
+        assert df_departements.columns.tolist() == ["01", "02", "03"]
+
+        pd.DataFrame({"departement": ["1", "02", "75"], "weight": [3., 1., 10.]}).to_csv(tmp_path / "weights.csv",
+                                                                                       index=False)
+        weights = load_departement_weights(tmp_path / "weights.csv")
+        assert weights.index.tolist() == ["01", "02", "75"]
+        df_departements.iloc[0, 0] = np.nan
+        national = national_temperature(df_departements, weights)
+        assert national.iloc[0] == df_departements.iloc[0, 1]
+        np.testing.assert_allclose(national.iloc[1:],
+                                   (3 * df_departements["01"] + df_departements["02"]).iloc[1:] / 4)
@@ -0,0 +1,92 @@
+import os
+import time
+
+import pytest
+
+from energy_forecast.grib_index import index_key
+from energy_forecast.retention import evict, get_run, list_runs, parse_size, use_run
+
+
+def make_run(prefix, date, size, age_days=0):
+    """Write two files of a run, last accessed ``age_days`` ago."""
+    run = f"arpege_01_{date}_00:00:00"
+    timestamp = time.time() - age_days * 24 * 3600
+    for name in ["000H012H.grib2", "france.nc"]:
+        filename = prefix / f"{run}_{name}"
+        filename.write_bytes(b"x" * size)
+        os.utime(filename, (timestamp, timestamp))
+    return run
+
+
+class TestRetention:
+
+    def test_get_run(self):
+        assert get_run("/tmp/arpege/arpege_01_2024-06-28_06:00:00_000H012H.grib2") == "arpege_01_2024-06-28_06:00:00"
+        assert get_run("/tmp/arpege/other.grib2") is None
+
+    def test_parse_size(self):
+        assert parse_size("2KB") == 2048
+        assert parse_size(10) == 10
+        with pytest.raises(ValueError):
+            parse_size("2 lots")
+
+    def test_evict_max_size(self, tmp_path):
+        old = make_run(tmp_path, "2024-06-01", 100, age_days=3)
+        middle = make_run(tmp_path, "2024-06-02", 100, age_days=2)
+        recent = make_run(tmp_path, "2024-06-03", 100, age_days=1)
+        deleted = evict(tmp_path, max_size=450, pinned=[old])
+        assert {get_run(filename) for filename in deleted} == {middle}
+        assert set(list_runs(tmp_path).index) == {old, recent}
+
+    def test_evict_max_age(self, tmp_path):
+        old = make_run(tmp_path, "2024-06-01", 100, age_days=10)
+        recent = make_run(tmp_path, "2024-06-03", 100, age_days=1)
+        evict(tmp_path, max_age="7D")
+        assert set(list_runs(tmp_path).index) == {recent}
+        assert old not in list_runs(tmp_path).index
+
+    def test_evict_keeps_runs_in_use(self, tmp_path):
+        run = make_run(tmp_path, "2024-06-01", 100, age_days=10)
+        with use_run(tmp_path, run):
+            assert evict(tmp_path, max_size=0) == []
+        assert len(evict(tmp_path, max_size=0)) == 2
+
+    def test_evict_deletes_the_lock_files(self, tmp_path):
+        for date in ["2024-06-01", "2024-06-03", "2024-06-04"]:
+            with use_run(tmp_path, f"arpege_01_{date}_00:00:00"):
+                pass
+        old = make_run(tmp_path, "2024-06-01", 100, age_days=10)
+        recent = make_run(tmp_path, "2024-06-03", 100, age_days=1)
+        lock_dir = tmp_path / ".locks"
+        with use_run(tmp_path, "arpege_01_2024-06-05_00:00:00"):
+            evict(tmp_path, max_age="7D", dryrun=True)
+            assert len(list(lock_dir.iterdir())) == 4
+            evict(tmp_path, max_age="7D")
+            assert sorted(lock_dir.iterdir()) == [lock_dir / f"{recent}.lock",
+                                                  lock_dir / "arpege_01_2024-06-05_00:00:00.lock"]
+        # a run pinned again after its eviction gets a new lock file
+        with use_run(tmp_path, old):
+            assert len(evict(tmp_path, max_size=0)) == 2
+            assert sorted(lock_dir.iterdir()) == [lock_dir / f"{old}.lock"]
+
+    def test_evict_deletes_the_cfgrib_index(self, tmp_path):
+        prefix, index_dir = tmp_path / "arpege", tmp_path / "index"
+        prefix.mkdir()
+        index_dir.mkdir()
+        old = make_run(prefix, "2024-06-01", 100, age_days=10)
+        recent = make_run(prefix, "2024-06-03", 100, age_days=1)
+        for run in [old, recent]:
+            key = index_key(prefix / f"{run}_000H012H.grib2")
+            (index_dir / f"{key}.5f2ba.idx").touch()
+            (index_dir / f"{key}.lock").touch()
+        kept = sorted(index_dir.glob(f"{index_key(prefix / f'{recent}_000H012H.grib2')}.*"))
+        evict(prefix, max_age="7D", index_dir=index_dir)
+        assert sorted(index_dir.iterdir()) == kept
+
+    def test_index_key(self, tmp_path):
+        filename = tmp_path / "arpege_01_2024-06-01_00:00:00_000H012H.grib2"
+        filename.write_bytes(b"x" * 100)
+        key = index_key(filename)
+        assert index_key(tmp_path / ".." / tmp_path.name / filename.name) == key
+        os.utime(filename, (time.time(), time.time() + 10))
+        assert index_key(filename) != key
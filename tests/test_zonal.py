@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from energy_forecast.zonal import ZonalAggregator, rollup
+
+
+def make_data(times=None):
+    longitude = np.arange(-1, 2, 0.5)
+    latitude = np.arange(3, 1, -0.5)
+    masks = xr.DataArray(np.array([[0, 0, 1, 1, np.nan, 2],
+                                   [0, 0, 1, 1, np.nan, 2],
+                                   [0, 1, 1, np.nan, np.nan, 2],
+                                   [np.nan, 1, 1, np.nan, 2, 2]]).T,
+                         dims=("longitude", "latitude"),
+                         coords={"longitude": longitude, "latitude": latitude})
+    rng = np.random.default_rng(0)
+    dims, coords = ("step", "latitude", "longitude"), {"step": pd.to_timedelta(range(3), unit="h"),
+                                                       "latitude": latitude, "longitude": longitude}
+    if times is None:
+        coords["time"] = pd.Timestamp("2024-06-28")
+    else:
+        dims, coords["time"] = ("time",) + dims, pd.DatetimeIndex(times)
+    shape = tuple(len(coords[dim]) for dim in dims)
+    return masks, xr.DataArray(rng.random(shape), dims=dims, coords=coords, name="si10")
+
+
+class TestZonalAggregator:
+
+    def test_mean_as_groupby(self):
+        masks, da_value = make_data()
+        da_value[0, 0, 0] = np.nan
+        aggregator = ZonalAggregator(masks, ["a", "b", "c"], "region")
+        expected = da_value.groupby(masks).mean("stacked_longitude_latitude")
+        da_means = aggregator.mean(da_value)
+        np.testing.assert_allclose(da_means.to_numpy(), expected.transpose("step", ...).to_numpy())
+        assert list(da_means["region"].values) == ["a", "b", "c"]
+
+    def test_empty_zone(self):
+        masks, da_value = make_data()
+        aggregator = ZonalAggregator(masks, ["a", "b", "c", "empty"], "region")
+        assert aggregator.mean(da_value).sel(region="empty").isnull().all()
+
+    def test_mean_table(self):
+        masks, da_value = make_data(times=["2024-06-28 00:00", "2024-06-28 06:00"])
+        df_means = ZonalAggregator.from_masks(masks, ["a", "b", "c"], "region").mean_table(da_value)
+        assert df_means.index.names == ["time", "valid_time"]
+        assert df_means.index[-1] == (pd.Timestamp("2024-06-28 06:00"), pd.Timestamp("2024-06-28 08:00"))
+        assert list(df_means.columns) == ["a", "b", "c"]
+        assert ZonalAggregator.from_masks(masks, ["a", "b", "c"], "region") is ZonalAggregator.from_masks(masks.copy(), ["a", "b", "c"], "region")
+
+    def test_rollup(self):
+        masks, da_value = make_data()
+        children = ZonalAggregator(masks, ["a", "b", "c"], "departement")
+        hierarchy = pd.DataFrame({"region": ["X", "X", "Y"], "weight": children.totals},
+                                 index=["a", "b", "c"])
+        df_regions = rollup(children.mean_table(da_value), hierarchy, "region")
+        parent_masks = masks.where(masks != 1, 0)
+        parent_masks = parent_masks.where(parent_masks != 2, 1)
+        expected = ZonalAggregator(parent_masks, ["X", "Y"], "region").mean_table(da_value)
+        pd.testing.assert_frame_equal(df_regions, expected)
+
+    def test_from_points(self):
+        masks, da_value = make_data()
+        longitude, latitude = da_value["longitude"].to_numpy(), da_value["latitude"].to_numpy()
+        lon, lat = np.array([-0.75, 0.5, 1.5, 10.]), np.array([2.25, 2.5, 1.5, 2.])
+        aggregator = ZonalAggregator.from_points(longitude, latitude, lon, lat, weights=[1, 3, 0, 5])
+        da_points = aggregator.mean(da_value)
+        expected = da_value.interp(longitude=xr.DataArray(lon[:3], dims="site"),
+                                   latitude=xr.DataArray(lat[:3], dims="site"))
+        np.testing.assert_allclose(da_points.isel(site=slice(0, 3)).to_numpy(), expected.to_numpy())
+        assert da_points.isel(site=3).isnull().all()
+        np.testing.assert_allclose(da_points.sel(site="weighted_mean").to_numpy(),
+                                   (expected[:, 0] + 3 * expected[:, 1]).to_numpy() / 4)
+        nearest = ZonalAggregator.from_points(longitude, latitude, [0.4], [2.6], method="nearest").mean(da_value)
+        np.testing.assert_allclose(nearest.to_numpy()[:, 0], da_value.sel(longitude=0.5, latitude=2.5).to_numpy())
+
+    def test_statistics(self):
+        masks, da_value = make_data()
+        da_value[0, 0, 0] = np.nan
+        aggregator = ZonalAggregator(masks, ["a", "b", "c", "empty"], "region")
+        da_statistics = aggregator.statistics(da_value, quantiles=[0.5, 1.], bins=1000)
+        assert list(da_statistics["statistic"].values) == ["mean", "min", "max", "std", "q0.5", "q1"]
+        grouped = da_value.groupby(masks)
+        for statistic in ["mean", "min", "max", "std"]:
+            expected = getattr(grouped, statistic)("stacked_longitude_latitude").transpose("step", ...)
+            np.testing.assert_allclose(da_statistics.sel(statistic=statistic, region=["a", "b", "c"]).to_numpy(),
+                                       expected.to_numpy())
+        median = grouped.quantile(0.5, "stacked_longitude_latitude", method="inverted_cdf").transpose("step", ...)
+        np.testing.assert_allclose(da_statistics.sel(statistic="q0.5", region=["a", "b", "c"]).to_numpy(),
+                                   median.to_numpy(), atol=1e-3)
+        xr.testing.assert_allclose(da_statistics.sel(statistic="q1", drop=True),
+                                   da_statistics.sel(statistic="max", drop=True))
+        assert da_statistics.sel(region="empty").isnull().all()
+        df_statistics = aggregator.statistics_table(da_value, statistics=["mean", "max"])
+        assert df_statistics.columns.names == ["statistic", "region"]
+        assert df_statistics.shape == (3, 8)